@@ -0,0 +1,151 @@
+import functools
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from database import (
+    create_user, get_user_by_telegram_id, load_user_identity, get_user_wallets, touch_user, get_user_balances,
+    create_wallets_bulk, get_next_derivation_index, get_active_stakes, get_user_withdrawals, log_withdrawal
+)
+from identity_cache import user_identity_cache
+from config import ASYNC_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+
+class AsyncDatabase:
+    """Async engine and session-per-update factory for bot handlers"""
+
+    def __init__(
+        self,
+        url: str = ASYNC_DATABASE_URL,
+        pool_size: int = DB_POOL_SIZE,
+        max_overflow: int = DB_MAX_OVERFLOW,
+        pool_timeout: float = DB_POOL_TIMEOUT,
+        pool_recycle: int = DB_POOL_RECYCLE
+    ):
+        self.url = url
+        self.pool_options = {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'pool_recycle': pool_recycle,
+            'pool_pre_ping': True
+        }
+        self._engine = None
+        self._sessionmaker = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'sessions': 0,
+            'open_sessions': 0,
+            'checkouts': 0,
+            'peak_checked_out': 0,
+            'pool_timeouts': 0
+        }
+
+    def get_engine(self):
+        """Get async engine, created on first use so importing the bot opens no pool"""
+        with self._lock:
+            if self._engine is None:
+                from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+                options = self.pool_options if self.url.startswith('postgresql') else {}
+                self._engine = create_async_engine(self.url, **options)
+                # Objects stay readable after commit, handlers keep using them
+                self._sessionmaker = async_sessionmaker(self._engine, expire_on_commit=False)
+                event.listen(self._engine.sync_engine.pool, 'checkout', self._on_checkout)
+            return self._engine
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        """Pool checkout hook, tracks peak concurrent connections"""
+        pool = self._engine.sync_engine.pool
+        self.stats['checkouts'] += 1
+        if hasattr(pool, 'checkedout'):
+            self.stats['peak_checked_out'] = max(self.stats['peak_checked_out'], pool.checkedout())
+
+    @asynccontextmanager
+    async def session(self):
+        """Open an AsyncSession that is closed when the block exits, even on errors"""
+        self.get_engine()
+        self.stats['sessions'] += 1
+        self.stats['open_sessions'] += 1
+        try:
+            async with self._sessionmaker() as session:
+                try:
+                    yield session
+                except PoolTimeoutError:
+                    self.stats['pool_timeouts'] += 1
+                    raise
+        finally:
+            self.stats['open_sessions'] -= 1
+
+    def get_pool_stats(self) -> Dict:
+        """Get pool occupancy and session counters"""
+        stats = dict(self.stats)
+        if self._engine is not None:
+            pool = self._engine.sync_engine.pool
+            for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+                if hasattr(pool, name):
+                    stats[name] = getattr(pool, name)()
+        return stats
+
+    async def dispose(self) -> None:
+        """Close all pooled connections"""
+        if self._engine is not None:
+            await self._engine.dispose()
+
+# Global instance
+async_database = AsyncDatabase()
+
+def with_session(handler):
+    """Run a handler with its own AsyncSession, passed as the db argument"""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        async with async_database.session() as db:
+            return await handler(update, context, db)
+    return wrapper
+
+# Async variants of the database helpers, run over the session's connection
+async def create_user_async(session, telegram_id):
+    """Create a new user"""
+    return await session.run_sync(create_user, telegram_id)
+
+async def get_user_by_telegram_id_async(session, telegram_id):
+    """Get user by telegram ID"""
+    return await session.run_sync(get_user_by_telegram_id, telegram_id)
+
+async def get_user_identity_async(session, telegram_id):
+    """Get user identity, no query when it is cached"""
+    identity = user_identity_cache.get(telegram_id)
+    if identity is not None:
+        return identity
+    return await session.run_sync(load_user_identity, telegram_id)
+
+async def get_user_wallets_async(session, user_id):
+    """Get all wallets for a user"""
+    return await session.run_sync(get_user_wallets, user_id)
+
+async def touch_user_async(session, user_id):
+    """Record user activity"""
+    return await session.run_sync(touch_user, user_id)
+
+async def get_user_balances_async(session, user_id):
+    """Get balance snapshots for all wallets of a user"""
+    return await session.run_sync(get_user_balances, user_id)
+
+async def create_wallets_bulk_async(session, user_id, network, wallets, compact=False):
+    """Create many wallets in one transaction"""
+    return await session.run_sync(create_wallets_bulk, user_id, network, wallets, compact)
+
+async def get_next_derivation_index_async(session, user_id, network):
+    """Get first unused master seed index of a user in network"""
+    return await session.run_sync(get_next_derivation_index, user_id, network)
+
+async def get_active_stakes_async(session, user_id):
+    """Get active stakes for a user"""
+    return await session.run_sync(get_active_stakes, user_id)
+
+async def get_user_withdrawals_async(session, user_id, limit=20):
+    """Get latest withdrawals of a user"""
+    return await session.run_sync(get_user_withdrawals, user_id, limit)
+
+async def log_withdrawal_async(session, **kwargs):
+    """Log a withdrawal request"""
+    return await session.run_sync(lambda db: log_withdrawal(db, **kwargs))
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import (
+    SUPPORTED_ASSETS,
+    BALANCE_CACHE_TTLS,
+    BALANCE_CACHE_STALE_TTL,
+    BALANCE_CACHE_MAX_ENTRIES
+)
+
+class BalanceCache:
+    def __init__(
+        self,
+        max_entries: int = BALANCE_CACHE_MAX_ENTRIES,
+        ttls: Optional[Dict[str, float]] = None,
+        stale_ttl: float = BALANCE_CACHE_STALE_TTL
+    ):
+        self.max_entries = max_entries
+        self.ttls = dict(BALANCE_CACHE_TTLS if ttls is None else ttls)
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def _key(self, network: str, address: str, asset: str) -> Tuple[str, str, str]:
+        """Build cache key, EVM addresses are case-insensitive"""
+        if address.startswith('0x'):
+            address = address.lower()
+        return network, address, asset
+
+    def get_many(self, network: str, address: str, assets: List[str]) -> Tuple[Optional[Dict[str, float]], bool]:
+        """Get cached balances for assets (balances or None, all fresh)"""
+        now = time.monotonic()
+        ttl = self.ttls.get(network, 5)
+        balances = {}
+        fresh = True
+        
+        with self._lock:
+            for asset in assets:
+                key = self._key(network, address, asset)
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._stats['misses'] += 1
+                    return None, False
+                
+                value, stored_at = entry
+                age = now - stored_at
+                if age > ttl + self.stale_ttl:
+                    del self._entries[key]
+                    self._stats['misses'] += 1
+                    return None, False
+                if age > ttl:
+                    fresh = False
+                
+                self._entries.move_to_end(key)
+                balances[asset] = value
+            
+            self._stats['hits' if fresh else 'stale_hits'] += 1
+        return balances, fresh
+
+    def get(self, network: str, address: str, asset: str) -> Tuple[Optional[float], bool]:
+        """Get cached balance for one asset (balance or None, is fresh)"""
+        balances, fresh = self.get_many(network, address, [asset])
+        if balances is None:
+            return None, False
+        return balances[asset], fresh
+
+    def set_many(self, network: str, address: str, balances: Dict[str, Optional[float]]) -> None:
+        """Store balances fetched for address, unknown (None) amounts are not cached"""
+        now = time.monotonic()
+        with self._lock:
+            for asset, value in balances.items():
+                if value is None:
+                    continue
+                key = self._key(network, address, asset)
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def set(self, network: str, address: str, asset: str, value: float) -> None:
+        """Store balance for one asset"""
+        self.set_many(network, address, {asset: value})
+
+    def invalidate(self, network: str, address: str) -> None:
+        """Drop all cached assets of address"""
+        with self._lock:
+            for asset in SUPPORTED_ASSETS.get(network, []):
+                if self._entries.pop(self._key(network, address, asset), None) is not None:
+                    self._stats['invalidations'] += 1
+
+    def begin_refresh(self, network: str, address: str) -> bool:
+        """Mark address as being refreshed, False if a refresh is already running"""
+        key = self._key(network, address, '')
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, network: str, address: str) -> None:
+        """Clear the refresh mark of address"""
+        with self._lock:
+            self._refreshing.discard(self._key(network, address, ''))
+
+    def get_stats(self) -> Dict[str, float]:
+        """Get hit/miss/eviction counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+# Global instance
+balance_cache = BalanceCache()
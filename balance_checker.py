@@ -1,22 +1,32 @@
+import asyncio
 import requests
 import json
-from web3 import Web3
-from tronpy import Tron
-from solana.rpc.api import Client
-from typing import Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from rpc_providers import provider_registry
+from network_adapters import network_adapters
+from balance_cache import balance_cache
+from http_client import http_client, RateLimitedError
+from typing import Dict, List, Optional, Tuple
 from config import (
     NETWORK_RPC_URLS, 
     USDT_CONTRACTS, 
     INFURA_URL, 
-    TRONGRID_API_KEY, 
-    SOLANA_RPC_URL
+    SUPPORTED_ASSETS,
+    EVM_NETWORKS,
+    NETWORK_CONCURRENCY_LIMITS,
+    BALANCE_WORKER_THREADS,
+    BALANCE_CALL_TIMEOUT
 )
 
 class BalanceChecker:
     def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider(INFURA_URL))
-        self.tron = Tron()
-        self.solana_client = Client(SOLANA_RPC_URL)
+        # Blocking SDK calls run here so they never stall the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=BALANCE_WORKER_THREADS,
+            thread_name_prefix='balance'
+        )
+        self._semaphores = {}
+        self._semaphores_loop = None
         
         # USDT ABI for ERC20
         self.usdt_abi = [
@@ -28,20 +38,51 @@ class BalanceChecker:
                 "type": "function"
             }
         ]
+        self._usdt_contract = None
+        self._trc20_usdt_contract = None
 
-    def get_ethereum_balance(self, address: str) -> Dict[str, float]:
-        """Get ETH and USDT balance for Ethereum address"""
+    @property
+    def w3(self):
+        """Ethereum Web3 client, built on first use"""
+        return network_adapters.get('ETH')
+
+    @property
+    def tron(self):
+        """Tron client, built on first use"""
+        return network_adapters.get('TRX')
+
+    @property
+    def solana_client(self):
+        """Solana client, built on first use"""
+        return network_adapters.get('SOL')
+
+    @property
+    def usdt_contract(self):
+        """ERC-20 USDT contract on Ethereum"""
+        if self._usdt_contract is None:
+            self._usdt_contract = self.w3.eth.contract(
+                address=USDT_CONTRACTS['ETH'], 
+                abi=self.usdt_abi
+            )
+        return self._usdt_contract
+
+    @property
+    def trc20_usdt_contract(self):
+        """TRC-20 USDT contract on Tron, its ABI is fetched from TronGrid once"""
+        if self._trc20_usdt_contract is None:
+            http_client.throttle('api.trongrid.io')
+            self._trc20_usdt_contract = self.tron.get_contract(USDT_CONTRACTS['TRX'])
+        return self._trc20_usdt_contract
+
+    def get_ethereum_balance(self, address: str) -> Dict[str, Optional[float]]:
+        """Get ETH and USDT balance for Ethereum address, None if the fetch failed"""
         try:
             # Check ETH balance
             eth_balance_wei = self.w3.eth.get_balance(address)
             eth_balance = self.w3.from_wei(eth_balance_wei, 'ether')
             
             # Check USDT balance
-            usdt_contract = self.w3.eth.contract(
-                address=USDT_CONTRACTS['ETH'], 
-                abi=self.usdt_abi
-            )
-            usdt_balance_wei = usdt_contract.functions.balanceOf(address).call()
+            usdt_balance_wei = self.usdt_contract.functions.balanceOf(address).call()
             usdt_balance = usdt_balance_wei / 10**6  # USDT has 6 decimals
             
             return {
@@ -50,17 +91,19 @@ class BalanceChecker:
             }
         except Exception as e:
             print(f"Error getting Ethereum balance: {e}")
-            return {'ETH': 0.0, 'USDT': 0.0}
+            return {'ETH': None, 'USDT': None}
 
-    def get_tron_balance(self, address: str) -> Dict[str, float]:
-        """Get TRX and USDT balance for Tron address"""
+    def get_tron_balance(self, address: str) -> Dict[str, Optional[float]]:
+        """Get TRX and USDT balance for Tron address, None if rate limited or the fetch failed"""
         try:
-            # Check TRX balance
+            # Every TronGrid call takes its own token from the host limit
+            http_client.throttle('api.trongrid.io')
             trx_balance_sun = self.tron.get_account_balance(address)
             trx_balance = trx_balance_sun / 1_000_000  # Convert from SUN to TRX
             
             # Check USDT balance
-            usdt_contract = self.tron.get_contract(USDT_CONTRACTS['TRX'])
+            usdt_contract = self.trc20_usdt_contract
+            http_client.throttle('api.trongrid.io')
             usdt_balance_sun = usdt_contract.functions.balanceOf(address)
             usdt_balance = usdt_balance_sun / 1_000_000  # USDT has 6 decimals
             
@@ -68,12 +111,19 @@ class BalanceChecker:
                 'TRX': float(trx_balance),
                 'USDT': float(usdt_balance)
             }
+        except RateLimitedError as e:
+            print(f"Error getting Tron balance: {e}")
+            return {'TRX': None, 'USDT': None}
         except Exception as e:
+            from tronpy.exceptions import AddressNotFound
+            if isinstance(e, AddressNotFound):
+                # Accounts are created on the first incoming transfer
+                return {'TRX': 0.0, 'USDT': 0.0}
             print(f"Error getting Tron balance: {e}")
-            return {'TRX': 0.0, 'USDT': 0.0}
+            return {'TRX': None, 'USDT': None}
 
-    def get_solana_balance(self, address: str) -> Dict[str, float]:
-        """Get SOL balance for Solana address"""
+    def get_solana_balance(self, address: str) -> Dict[str, Optional[float]]:
+        """Get SOL balance for Solana address, None if the fetch failed"""
         try:
             response = self.solana_client.get_balance(address)
             if response['result']['value']:
@@ -83,74 +133,76 @@ class BalanceChecker:
             return {'SOL': 0.0}
         except Exception as e:
             print(f"Error getting Solana balance: {e}")
-            return {'SOL': 0.0}
+            return {'SOL': None}
 
-    def get_bnb_balance(self, address: str) -> Dict[str, float]:
-        """Get BNB balance for BSC address"""
+    def get_bnb_balance(self, address: str) -> Dict[str, Optional[float]]:
+        """Get BNB balance for BSC address, None if the fetch failed"""
         try:
-            w3 = Web3(Web3.HTTPProvider(NETWORK_RPC_URLS['BSC']))
+            w3 = network_adapters.get('BNB')
             bnb_balance_wei = w3.eth.get_balance(address)
             bnb_balance = w3.from_wei(bnb_balance_wei, 'ether')
             return {'BNB': float(bnb_balance)}
         except Exception as e:
             print(f"Error getting BNB balance: {e}")
-            return {'BNB': 0.0}
+            return {'BNB': None}
 
-    def get_dogecoin_balance(self, address: str) -> Dict[str, float]:
-        """Get DOGE balance for Dogecoin address"""
+    def get_dogecoin_balance(self, address: str) -> Dict[str, Optional[float]]:
+        """Get DOGE balance for Dogecoin address, None if rate limited or the fetch failed"""
         try:
             url = f"https://sochain.com/api/v2/get_address_balance/DOGE/{address}"
-            response = requests.get(url, timeout=10)
+            response = http_client.get(url)
             if response.status_code == 200:
                 data = response.json()
                 if data['status'] == 'success':
                     doge_balance = float(data['data']['confirmed_balance'])
                     return {'DOGE': doge_balance}
-            return {'DOGE': 0.0}
+            return {'DOGE': None}
         except Exception as e:
             print(f"Error getting Dogecoin balance: {e}")
-            return {'DOGE': 0.0}
+            return {'DOGE': None}
 
-    def get_avalanche_balance(self, address: str) -> Dict[str, float]:
-        """Get AVAX balance for Avalanche address"""
+    def get_avalanche_balance(self, address: str) -> Dict[str, Optional[float]]:
+        """Get AVAX balance for Avalanche address, None if the fetch failed"""
         try:
-            w3 = Web3(Web3.HTTPProvider(NETWORK_RPC_URLS['AVAX']))
+            w3 = network_adapters.get('AVAX')
             avax_balance_wei = w3.eth.get_balance(address)
             avax_balance = w3.from_wei(avax_balance_wei, 'ether')
             return {'AVAX': float(avax_balance)}
         except Exception as e:
             print(f"Error getting Avalanche balance: {e}")
-            return {'AVAX': 0.0}
+            return {'AVAX': None}
 
-    def get_polygon_balance(self, address: str) -> Dict[str, float]:
-        """Get POL balance for Polygon address"""
+    def get_polygon_balance(self, address: str) -> Dict[str, Optional[float]]:
+        """Get POL balance for Polygon address, None if the fetch failed"""
         try:
-            w3 = Web3(Web3.HTTPProvider(NETWORK_RPC_URLS['POL']))
+            w3 = network_adapters.get('POL')
             pol_balance_wei = w3.eth.get_balance(address)
             pol_balance = w3.from_wei(pol_balance_wei, 'ether')
             return {'POL': float(pol_balance)}
         except Exception as e:
             print(f"Error getting Polygon balance: {e}")
-            return {'POL': 0.0}
+            return {'POL': None}
 
-    def get_xrp_balance(self, address: str) -> Dict[str, float]:
-        """Get XRP balance for XRP address"""
+    def get_xrp_balance(self, address: str) -> Dict[str, Optional[float]]:
+        """Get XRP balance for XRP address, None if rate limited or the fetch failed"""
         try:
             url = f"https://api.xrpscan.com/api/v1/account/{address}"
-            response = requests.get(url, timeout=10)
+            response = http_client.get(url)
             if response.status_code == 200:
                 data = response.json()
                 if 'account_data' in data:
                     xrp_balance_drops = int(data['account_data']['Balance'])
                     xrp_balance = xrp_balance_drops / 1_000_000  # Convert from drops to XRP
                     return {'XRP': float(xrp_balance)}
-            return {'XRP': 0.0}
+                # Accounts below the reserve are not activated yet
+                return {'XRP': 0.0}
+            return {'XRP': None}
         except Exception as e:
             print(f"Error getting XRP balance: {e}")
-            return {'XRP': 0.0}
+            return {'XRP': None}
 
-    def get_balance(self, address: str, network: str) -> Dict[str, float]:
-        """Get balance for address in specified network"""
+    def fetch_balance(self, address: str, network: str) -> Dict[str, float]:
+        """Get balance for address in specified network from the chain"""
         checkers = {
             'ETH': self.get_ethereum_balance,
             'TRX': self.get_tron_balance,
@@ -167,14 +219,148 @@ class BalanceChecker:
         
         return checkers[network](address)
 
+    def get_balance(self, address: str, network: str) -> Dict[str, float]:
+        """Get balance for address in specified network, served from cache when possible"""
+        assets = SUPPORTED_ASSETS.get(network, [])
+        if not assets:
+            return {}
+        
+        cached, fresh = balance_cache.get_many(network, address, assets)
+        if cached is not None:
+            if not fresh and balance_cache.begin_refresh(network, address):
+                # Serve the stale value now, refresh it in the background
+                self.executor.submit(self._refresh_balance, address, network)
+            return cached
+        
+        balance = self.fetch_balance(address, network)
+        balance_cache.set_many(network, address, balance)
+        return balance
+
+    def _refresh_balance(self, address: str, network: str) -> None:
+        """Refresh cached balance of address"""
+        try:
+            balance_cache.set_many(network, address, self.fetch_balance(address, network))
+        finally:
+            balance_cache.end_refresh(network, address)
+
+    def get_native_balances_bulk(
+        self, 
+        addresses: List[str], 
+        network: str, 
+        block_identifier: Optional[int] = None
+    ) -> Dict[str, Optional[float]]:
+        """Get native balances for many EVM addresses via JSON-RPC batches, None if unknown"""
+        if network not in EVM_NETWORKS:
+            raise ValueError(f"Unsupported network: {network}")
+        
+        block = 'latest' if block_identifier is None else hex(block_identifier)
+        results = provider_registry.batch_request(
+            EVM_NETWORKS[network],
+            'eth_getBalance',
+            [[address, block] for address in addresses]
+        )
+        
+        balances = {}
+        for address, result in zip(addresses, results):
+            if result is None:
+                balances[address] = None
+            else:
+                balances[address] = int(result, 16) / 10**18
+                balance_cache.set(network, address, network, balances[address])
+        return balances
+
+    def get_usdt_balances_bulk(
+        self, 
+        addresses: List[str], 
+        block_identifier: Optional[int] = None
+    ) -> Tuple[int, Dict[str, Optional[float]]]:
+        """Get ERC-20 USDT balances for many addresses in one Multicall3 snapshot"""
+        from multicall_reader import MulticallReader
+        reader = MulticallReader(self.w3)
+        block_number, balances = reader.get_token_balances(
+            USDT_CONTRACTS['ETH'], 
+            addresses, 
+            decimals=6, 
+            block_identifier=block_identifier
+        )
+        for address, balance in balances.items():
+            if balance is not None:
+                balance_cache.set('ETH', address, 'USDT', balance)
+        return block_number, balances
+
+    def get_evm_balances_bulk(
+        self, 
+        addresses: List[str], 
+        network: str
+    ) -> Tuple[int, Dict[str, Dict[str, Optional[float]]]]:
+        """Get all asset balances for many EVM addresses pinned to the current block"""
+        w3 = network_adapters.get(network)
+        block_number = w3.eth.block_number
+        
+        native = self.get_native_balances_bulk(addresses, network, block_number)
+        balances = {address: {network: native[address]} for address in addresses}
+        
+        if network == 'ETH':
+            _, usdt = self.get_usdt_balances_bulk(addresses, block_number)
+            for address in addresses:
+                balances[address]['USDT'] = usdt[address]
+        
+        return block_number, balances
+
+    def _get_semaphore(self, network: str) -> asyncio.Semaphore:
+        """Get the concurrency limiter for network in the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphores_loop is not loop:
+            self._semaphores = {}
+            self._semaphores_loop = loop
+        
+        if network not in self._semaphores:
+            limit = NETWORK_CONCURRENCY_LIMITS.get(network, 4)
+            self._semaphores[network] = asyncio.Semaphore(limit)
+        return self._semaphores[network]
+
+    async def get_balance_async(
+        self, 
+        address: str, 
+        network: str, 
+        timeout: float = BALANCE_CALL_TIMEOUT
+    ) -> Optional[Dict[str, float]]:
+        """Get balance without blocking the event loop, None if the deadline passes"""
+        loop = asyncio.get_running_loop()
+        async with self._get_semaphore(network):
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, self.get_balance, address, network),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                print(f"Balance request timed out for {network} address {address}")
+                return None
+
+    async def get_all_balances_async(
+        self, 
+        wallets: list, 
+        timeout: float = BALANCE_CALL_TIMEOUT
+    ) -> Tuple[Dict[str, Dict[str, float]], List[str]]:
+        """Get balances for all wallets concurrently (balances, timed out addresses)"""
+        results = await asyncio.gather(*[
+            self.get_balance_async(wallet.address, wallet.network, timeout)
+            for wallet in wallets
+        ])
+        
+        balances = {}
+        timed_out = []
+        for wallet, balance in zip(wallets, results):
+            if balance is None:
+                timed_out.append(wallet.address)
+            else:
+                # Compact EVM wallets share an address, their networks hold different assets
+                balances.setdefault(wallet.address, {}).update(balance)
+        return balances, timed_out
+
     def get_all_balances(self, wallets: list) -> Dict[str, Dict[str, float]]:
         """Get balances for all wallets"""
-        balances = {}
-        for wallet in wallets:
-            network = wallet.network
-            address = wallet.address
-            balance = self.get_balance(address, network)
-            balances[address] = balance
+        balances, _ = asyncio.run(self.get_all_balances_async(wallets))
         return balances
 
 # Global instance
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from database import SessionLocal, User, Wallet, upsert_wallet_balances
+from balance_checker import balance_checker
+from config import (
+    SUPPORTED_NETWORKS,
+    EVM_NETWORKS,
+    BALANCE_REFRESH_CHUNK_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+class BalanceRefresher:
+    def __init__(self, session_factory=SessionLocal, chunk_size: int = BALANCE_REFRESH_CHUNK_SIZE):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self._running = threading.Lock()
+        self.last_run = {}
+
+    def get_wallets_by_priority(self, db, network: str) -> List:
+        """Get (wallet id, user id, address) for network, recently active users first"""
+        return db.query(Wallet.id, Wallet.user_id, Wallet.address).join(
+            User, User.id == Wallet.user_id
+        ).filter(
+            Wallet.network == network
+        ).order_by(
+            User.last_active_at.desc().nullslast(),
+            Wallet.id
+        ).all()
+
+    def fetch_chunk(self, network: str, addresses: List[str]):
+        """Fetch balances for a chunk of addresses (block number or None, balances)"""
+        if network in EVM_NETWORKS:
+            return balance_checker.get_evm_balances_bulk(addresses, network)
+        
+        results = balance_checker.executor.map(
+            lambda address: balance_checker.fetch_balance(address, network),
+            addresses
+        )
+        return None, dict(zip(addresses, results))
+
+    def refresh_network(self, db, network: str) -> int:
+        """Refresh snapshots for all wallets of network, returns rows written"""
+        wallets = self.get_wallets_by_priority(db, network)
+        written = 0
+        
+        for start in range(0, len(wallets), self.chunk_size):
+            chunk = wallets[start:start + self.chunk_size]
+            try:
+                block_number, balances = self.fetch_chunk(network, [wallet.address for wallet in chunk])
+            except Exception as e:
+                logger.error(f"Error refreshing {network} balances: {e}")
+                continue
+            
+            written += self.write_snapshots(db, network, chunk, block_number, balances)
+        
+        return written
+
+    def write_snapshots(self, db, network: str, wallets: List, block_number: Optional[int], balances: Dict) -> int:
+        """Upsert fetched balances of wallets, unknown (None) amounts keep the old snapshot"""
+        fetched_at = datetime.utcnow()
+        rows = []
+        for wallet in wallets:
+            for asset, amount in balances.get(wallet.address, {}).items():
+                if amount is None:
+                    continue
+                rows.append({
+                    'wallet_id': wallet.id,
+                    'user_id': wallet.user_id,
+                    'network': network,
+                    'address': wallet.address,
+                    'asset': asset,
+                    'amount': float(amount),
+                    'block_number': block_number,
+                    'fetched_at': fetched_at
+                })
+        
+        upsert_wallet_balances(db, rows)
+        return len(rows)
+
+    def refresh_all(self) -> Optional[Dict[str, int]]:
+        """Refresh snapshots for every network, None if a refresh is already running"""
+        if not self._running.acquire(blocking=False):
+            return None
+        
+        db = self.session_factory()
+        try:
+            written = {}
+            for network in SUPPORTED_NETWORKS:
+                started = time.monotonic()
+                written[network] = self.refresh_network(db, network)
+                self.last_run[network] = {
+                    'rows': written[network],
+                    'seconds': time.monotonic() - started,
+                    'finished_at': datetime.utcnow()
+                }
+            return written
+        finally:
+            db.close()
+            self._running.release()
+
+    async def refresh_job(self, context) -> None:
+        """Job queue callback, runs the refresh off the event loop"""
+        loop = asyncio.get_running_loop()
+        written = await loop.run_in_executor(None, self.refresh_all)
+        if written is not None:
+            logger.info(f"Balance snapshots refreshed: {written}")
+
+# Global instance
+balance_refresher = BalanceRefresher()
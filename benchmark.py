@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for Crypto Wallet Telegram Bot
+"""
+
+import argparse
+import sys
+import time
+from config import SUPPORTED_NETWORKS
+
+def bench_wallets(args):
+    """Compare one seed per wallet against HD derivation from one seed"""
+    from wallet_generator import generate_multiple_wallets
+    
+    networks = args.networks or SUPPORTED_NETWORKS
+    print(f"{'network':<8} {'per-wallet seed':>18} {'one seed (HD)':>18} {'speedup':>9}")
+    for network in networks:
+        started = time.perf_counter()
+        generate_multiple_wallets(network, args.count, shared_seed=False)
+        separate = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        generate_multiple_wallets(network, args.count, shared_seed=True)
+        shared = time.perf_counter() - started
+        
+        print(
+            f"{network:<8} {args.count / separate:>12.1f} w/s {args.count / shared:>12.1f} w/s "
+            f"{separate / shared:>8.1f}x"
+        )
+
+def bench_generation(args):
+    """Compare serial HD derivation against the process pool service"""
+    import asyncio
+    from wallet_generator import derive_wallets, generate_seed_phrase
+    from wallet_service import WalletGenerationService
+    
+    seed_phrase = generate_seed_phrase()
+    service = WalletGenerationService(max_workers=args.workers)
+    try:
+        # Warm up worker processes so startup is not measured
+        asyncio.run(service.generate(args.network, service.max_workers * service.chunk_size))
+        
+        started = time.perf_counter()
+        derive_wallets(args.network, args.count, seed_phrase=seed_phrase)
+        serial = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        asyncio.run(service.generate(args.network, args.count, seed_phrase=seed_phrase))
+        pooled = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        for _ in service.generate_addresses(args.network, args.count, seed_phrase, task_size=max(args.count // (service.max_workers * 4), 1)):
+            pass
+        bulk = time.perf_counter() - started
+    finally:
+        service.shutdown()
+    
+    print(f"{args.count} {args.network} wallets, {service.max_workers} workers")
+    for name, elapsed in (('serial', serial), ('process pool', pooled), ('bulk addresses', bulk)):
+        print(f"{name:<16} {args.count / elapsed:>10.0f} w/s {args.count / elapsed * 3600:>14,.0f} w/h")
+
+def bench_persistence(args):
+    """Compare per-row create_wallet against create_wallets_bulk"""
+    import os
+    import tempfile
+    from sqlalchemy import create_engine, delete
+    from sqlalchemy.orm import sessionmaker
+    from database import Base, Wallet, create_wallet, create_wallets_bulk
+    
+    database_url = args.database_url
+    if database_url is None:
+        database_path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+        database_url = f"sqlite:///{database_path}"
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    
+    print(f"{'rows':>8} {'per-row':>14} {'bulk':>14} {'speedup':>9}  ({engine.dialect.name})")
+    for rows in args.rows:
+        wallets = [
+            {'address': f"0x{index:040x}", 'private_key': f"0x{index:064x}", 'seed_phrase': 'benchmark', 'derivation_index': index}
+            for index in range(rows)
+        ]
+        db = session_factory()
+        try:
+            per_row = None
+            if rows <= args.per_row_limit:
+                started = time.perf_counter()
+                for wallet in wallets:
+                    create_wallet(db, 0, 'ETH', wallet['address'], wallet['private_key'], wallet['seed_phrase'], wallet['derivation_index'])
+                per_row = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            create_wallets_bulk(db, 0, 'ETH', wallets)
+            bulk = time.perf_counter() - started
+            
+            db.execute(delete(Wallet).where(Wallet.user_id == 0))
+            db.commit()
+        finally:
+            db.close()
+        
+        per_row_text = f"{rows / per_row:>10.0f} r/s" if per_row else f"{'skipped':>14}"
+        speedup_text = f"{per_row / bulk:>8.1f}x" if per_row else f"{'-':>9}"
+        print(f"{rows:>8} {per_row_text} {rows / bulk:>10.0f} r/s {speedup_text}")
+
+def _baseline_validate_address(address, network):
+    """validate_address before precompiled patterns, kept for comparison"""
+    import re
+    patterns = {
+        'ETH': r'^0x[a-fA-F0-9]{40}$',
+        'TRX': r'^T[a-zA-Z0-9]{33}$',
+        'SOL': r'^[1-9A-HJ-NP-Za-km-z]{32,44}$',
+        'BNB': r'^0x[a-fA-F0-9]{40}$',
+        'DOGE': r'^D[a-zA-Z0-9]{33}$',
+        'AVAX': r'^0x[a-fA-F0-9]{40}$',
+        'POL': r'^0x[a-fA-F0-9]{40}$',
+        'XRP': r'^r[a-zA-Z0-9]{25,34}$',
+    }
+    if network not in patterns:
+        return False
+    return bool(re.match(patterns[network], address))
+
+def _baseline_get_network_from_address(address):
+    """get_network_from_address before prefix dispatch, kept for comparison"""
+    import re
+    for network, pattern in {
+        'ETH': r'^0x[a-fA-F0-9]{40}$',
+        'TRX': r'^T[a-zA-Z0-9]{33}$',
+        'SOL': r'^[1-9A-HJ-NP-Za-km-z]{32,44}$',
+        'BNB': r'^0x[a-fA-F0-9]{40}$',
+        'DOGE': r'^D[a-zA-Z0-9]{33}$',
+        'AVAX': r'^0x[a-fA-F0-9]{40}$',
+        'POL': r'^0x[a-fA-F0-9]{40}$',
+        'XRP': r'^r[a-zA-Z0-9]{25,34}$',
+    }.items():
+        if re.match(pattern, address):
+            return network
+    return None
+
+def bench_addresses(args):
+    """Compare address validation and classification against the old functions"""
+    from wallet_generator import derive_wallets
+    from utils import validate_address, validate_addresses, classify_addresses
+    
+    networks = ['ETH', 'TRX', 'SOL', 'DOGE', 'XRP']
+    samples = [wallet['address'] for network in networks for wallet in derive_wallets(network, 20)]
+    addresses = (samples * (args.count // len(samples) + 1))[:args.count]
+    evm_addresses = [address for address in addresses if address.startswith('0x')]
+    
+    cases = [
+        ('validate ETH, old', lambda: [_baseline_validate_address(a, 'ETH') for a in evm_addresses], len(evm_addresses)),
+        ('validate ETH, new', lambda: [validate_address(a, 'ETH') for a in evm_addresses], len(evm_addresses)),
+        ('validate ETH, batch', lambda: validate_addresses(evm_addresses, 'ETH'), len(evm_addresses)),
+        ('validate ETH, batch+EIP-55', lambda: validate_addresses(evm_addresses, 'ETH', checksum=True), len(evm_addresses)),
+        ('classify, old', lambda: [_baseline_get_network_from_address(a) for a in addresses], len(addresses)),
+        ('classify, batch', lambda: classify_addresses(addresses), len(addresses)),
+        ('classify, batch+checksum', lambda: classify_addresses(addresses, checksum=True), len(addresses)),
+    ]
+    for name, run, count in cases:
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        print(f"{name:<28} {count / elapsed:>12,.0f} addr/s")
+
+STARTUP_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+{use}
+print(json.dumps({{
+    'seconds': time.perf_counter() - started,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'sdks': [name for name in ('web3', 'eth_abi', 'tronpy', 'solana', 'bip_utils') if name in sys.modules]
+}}))
+"""
+
+def bench_startup(args):
+    """Measure import time, peak RSS and loaded chain SDKs in fresh interpreters"""
+    import json
+    import subprocess
+    
+    cases = [
+        ('bot', ''),
+        ('staking_manager', ''),
+        ('balance_checker', ''),
+        ('balance_checker', "balance_checker.balance_checker.tron"),
+        ('balance_checker', "balance_checker.balance_checker.solana_client"),
+    ]
+    print(f"{'import':<44} {'seconds':>8} {'RSS MB':>8}  SDKs loaded")
+    for module, use in cases:
+        samples = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, '-c', STARTUP_PROBE.format(module=module, use=use)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        best = min(samples, key=lambda sample: sample['seconds'])
+        name = module + (f" + {use.split('.')[-1]}" if use else '')
+        print(f"{name:<44} {best['seconds']:>8.2f} {best['rss_mb']:>8.0f}  {', '.join(best['sdks']) or '-'}")
+
+def _wallets_table_bytes(engine):
+    """Size of the wallets table and its indexes"""
+    from sqlalchemy import text
+    with engine.connect() as connection:
+        if engine.dialect.name == 'postgresql':
+            return connection.execute(text("SELECT pg_total_relation_size('wallets')")).scalar()
+        return connection.execute(text(
+            "SELECT sum(pgsize) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE tbl_name = 'wallets')"
+        )).scalar()
+
+def bench_storage(args):
+    """Compare wallets table size and listing latency of full and compact storage"""
+    import os
+    import random
+    import tempfile
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+    from database import Base, create_wallets_bulk, get_user_wallets
+    from wallet_generator import generate_seed_phrase
+    
+    from config import DATABASE_URL
+    if args.database_url == DATABASE_URL:
+        raise SystemExit("Refusing to recreate tables in the configured DATABASE_URL, use a scratch database")
+    
+    users = max(args.rows // 99, 1)
+    print(f"{'mode':<8} {'wallets':>9} {'table+indexes':>15} {'bytes/row':>10} {'list 99':>10}")
+    for compact in (False, True):
+        database_url = args.database_url
+        if database_url is None:
+            database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'storage.db')}"
+        engine = create_engine(database_url)
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        
+        db = session_factory()
+        try:
+            for user_id in range(1, users + 1):
+                seed_phrase = generate_seed_phrase()
+                wallets = [
+                    {
+                        'address': '0x' + os.urandom(20).hex(),
+                        'private_key': '0x' + os.urandom(32).hex(),
+                        'seed_phrase': seed_phrase,
+                        'derivation_index': index
+                    }
+                    for index in range(99)
+                ]
+                create_wallets_bulk(db, user_id, 'ETH', wallets, compact=compact)
+            
+            if engine.dialect.name == 'sqlite':
+                db.execute(text('VACUUM'))
+            else:
+                db.execute(text('ANALYZE wallets'))
+            
+            samples = random.sample(range(1, users + 1), min(200, users))
+            started = time.perf_counter()
+            for user_id in samples:
+                get_user_wallets(db, user_id)
+                db.expunge_all()
+            listing = (time.perf_counter() - started) / len(samples)
+        finally:
+            db.close()
+        
+        size = _wallets_table_bytes(engine)
+        rows = users * 99
+        print(f"{'compact' if compact else 'full':<8} {rows:>9} {size / 2**20:>12.1f} MB {size / rows:>10.0f} {listing * 1000:>7.2f} ms")
+        engine.dispose()
+
+HOT_PATH_INDEXES = [
+    ('wallets', 'ix_wallets_user_id'),
+    ('staking_logs', 'ix_staking_logs_user_status'),
+    ('staking_logs', 'ix_staking_logs_active_end_date'),
+    ('withdrawal_logs', 'ix_withdrawal_logs_user_timestamp'),
+]
+
+HOT_PATH_QUERIES = [
+    ('get_user_wallets', "SELECT * FROM wallets WHERE user_id = :user_id"),
+    ('get_active_stakes', "SELECT * FROM staking_logs WHERE user_id = :user_id AND status = 'active'"),
+    ('matured stakes', "SELECT id FROM staking_logs WHERE status = 'active' AND end_date <= :now"),
+    ('withdrawal history', "SELECT * FROM withdrawal_logs WHERE user_id = :user_id ORDER BY timestamp DESC LIMIT 20"),
+]
+
+def _seed_hot_path_tables(engine, args):
+    """Fill wallets, staking_logs and withdrawal_logs with synthetic rows"""
+    import random
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from database import Wallet, StakingLog, WithdrawalLog
+    
+    now = datetime.utcnow()
+    batch = 50000
+    matured = getattr(args, 'matured', 0.001)
+    with engine.begin() as connection:
+        for start in range(0, args.wallets, batch):
+            connection.execute(insert(Wallet), [
+                {'user_id': random.randint(1, args.users), 'network': 'ETH', 'address': f"0x{i:040x}",
+                 'private_key': 'k', 'seed_phrase': 's', 'derivation_index': i}
+                for i in range(start, min(start + batch, args.wallets))
+            ])
+        for start in range(0, args.stakes, batch):
+            rows = []
+            for i in range(start, min(start + batch, args.stakes)):
+                start_date = now - timedelta(days=random.randint(0, 400))
+                end_date = start_date + timedelta(days=random.choice([30, 90, 180, 365]))
+                # Most historical stakes are finished, matured-but-active ones are rare
+                status = 'active' if end_date > now or random.random() < matured else 'completed'
+                # One stake per wallet, a user can hold a single active stake per wallet and asset
+                rows.append({
+                    'user_id': random.randint(1, args.users), 'wallet_address': f"0x{i:040x}", 'amount': 100.0,
+                    'asset': 'USDT', 'rate': 10.0, 'start_date': start_date, 'end_date': end_date,
+                    'status': status, 'accrued_reward': 0.0
+                })
+            connection.execute(insert(StakingLog), rows)
+        for start in range(0, args.withdrawals, batch):
+            connection.execute(insert(WithdrawalLog), [
+                {'user_id': random.randint(1, args.users), 'from_address': '0x0', 'to_address': '0x1',
+                 'amount': 1.0, 'token_type': 'ETH', 'network': 'ETH', 'status': 'completed',
+                 'timestamp': now - timedelta(minutes=random.randint(0, 10**6))}
+                for _ in range(start, min(start + batch, args.withdrawals))
+            ])
+
+def _measure_hot_path_queries(engine, args, label):
+    """Print plan and mean latency of each hot path query"""
+    import random
+    from datetime import datetime
+    from sqlalchemy import text
+    
+    explain = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN ANALYZE '
+    print(f"\n== {label} ==")
+    with engine.connect() as connection:
+        for name, query in HOT_PATH_QUERIES:
+            params = [{'user_id': random.randint(1, args.users), 'now': datetime.utcnow()} for _ in range(args.samples)]
+            plan = connection.execute(text(explain + query), params[0]).all()
+            started = time.perf_counter()
+            for param in params:
+                connection.execute(text(query), param).all()
+            latency = (time.perf_counter() - started) / len(params)
+            print(f"{name:<20} {latency * 1000:>9.3f} ms")
+            for row in plan:
+                print(f"    {row[-1]}")
+
+def _scratch_engine(args, name):
+    """Create empty tables in a scratch database, never the configured one"""
+    import os
+    import tempfile
+    from sqlalchemy import create_engine
+    from database import Base
+    from config import DATABASE_URL
+    
+    if args.database_url == DATABASE_URL:
+        raise SystemExit("Refusing to recreate tables in the configured DATABASE_URL, use a scratch database")
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), name)}"
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+def bench_queries(args):
+    """Query plans and latencies of hot paths without and with the migration 4 indexes"""
+    from sqlalchemy import text
+    from database import Base
+    from migrations import upgrade_4
+    
+    engine = _scratch_engine(args, 'queries.db')
+    
+    with engine.begin() as connection:
+        for table, name in HOT_PATH_INDEXES:
+            next(i for i in Base.metadata.tables[table].indexes if i.name == name).drop(bind=connection, checkfirst=True)
+    
+    started = time.perf_counter()
+    _seed_hot_path_tables(engine, args)
+    print(f"Seeded {args.wallets} wallets, {args.stakes} stakes, {args.withdrawals} withdrawals in {time.perf_counter() - started:.0f}s")
+    
+    with engine.begin() as connection:
+        connection.execute(text('ANALYZE'))
+    _measure_hot_path_queries(engine, args, 'before')
+    
+    with engine.begin() as connection:
+        upgrade_4(connection)
+        connection.execute(text('ANALYZE'))
+    _measure_hot_path_queries(engine, args, 'after')
+    engine.dispose()
+
+def bench_staking(args):
+    """Reward accrual, staking stats via per-stake Python loop vs SQL, matured stake completion"""
+    import random
+    from sqlalchemy import text
+    from sqlalchemy.orm import sessionmaker
+    from database import StakingLog
+    from staking_manager import staking_manager
+    
+    engine = _scratch_engine(args, 'staking.db')
+    args.wallets = args.withdrawals = 0
+    started = time.perf_counter()
+    _seed_hot_path_tables(engine, args)
+    with engine.begin() as connection:
+        connection.execute(text('ANALYZE'))
+    print(f"Seeded {args.stakes} stakes for {args.users} users in {time.perf_counter() - started:.0f}s")
+    
+    db = sessionmaker(bind=engine)()
+    result = staking_manager.accrue_rewards(db)
+    print(f"accrual    {result['accrued']} active stakes in {result['seconds']:.2f}s ({result['rows_per_sec']:.0f} rows/s)")
+    user_ids = [random.randint(1, args.users) for _ in range(args.samples)]
+    
+    def python_stats(user_id):
+        query = db.query(StakingLog).filter(StakingLog.status == 'active')
+        stakes = (query.filter(StakingLog.user_id == user_id) if user_id else query).all()
+        return sum(stake.amount for stake in stakes), sum(staking_manager.calculate_current_reward(stake) for stake in stakes)
+    
+    for label, python_call, sql_call, samples in [
+        ('per user', python_stats, staking_manager.get_staking_stats, user_ids),
+        ('global', lambda _: python_stats(None), lambda _db, _: staking_manager.get_global_staking_stats(_db), [None])
+    ]:
+        started = time.perf_counter()
+        for user_id in samples:
+            python_call(user_id)
+            db.expunge_all()
+        python_latency = (time.perf_counter() - started) / len(samples)
+        started = time.perf_counter()
+        for user_id in samples:
+            sql_call(db, user_id)
+        sql_latency = (time.perf_counter() - started) / len(samples)
+        print(f"{label:<10} python {python_latency * 1000:>10.3f} ms   sql {sql_latency * 1000:>10.3f} ms")
+    
+    result = staking_manager.process_completed_stakes(db)
+    print(f"completion {result['completed']} matured stakes in {result['seconds']:.2f}s ({result['rows_per_sec']:.0f} rows/s)")
+    db.close()
+    engine.dispose()
+
+def bench_rewards(args):
+    """Per-stake reward summaries vs one vectorized pass"""
+    import random
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    from config import EARLY_WITHDRAWAL_PENALTY
+    from reward_engine import reward_engine
+    from staking_manager import StakingManager
+    
+    now = datetime.utcnow()
+    stakes = []
+    for i in range(args.stakes):
+        start_date = now - timedelta(seconds=random.randint(0, 365 * 86400))
+        stakes.append(SimpleNamespace(
+            id=i, wallet_address='0x0', asset='USDT', amount=random.uniform(1, 1000), rate=random.choice([16, 18, 20, 22]),
+            start_date=start_date, end_date=start_date + timedelta(days=random.choice([30, 90, 180, 270])), status='active'
+        ))
+    manager = StakingManager()
+    
+    # Per-stake path as before, utcnow() per stake
+    started = time.perf_counter()
+    for stake in stakes:
+        current_reward = manager.calculate_current_reward(stake)
+        penalty_amount = current_reward * EARLY_WITHDRAWAL_PENALTY
+        days_remaining = max(0, (stake.end_date - datetime.utcnow()).days)
+    scalar = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    columns = reward_engine.to_columns(stakes)
+    convert = time.perf_counter() - started
+    started = time.perf_counter()
+    reward_engine.compute(as_of=now, **columns)
+    vectorized = time.perf_counter() - started
+    
+    print(f"{args.stakes} stakes")
+    print(f"per stake      {scalar:>8.3f}s  {args.stakes / scalar:>12.0f} stakes/s")
+    print(f"to columns     {convert:>8.3f}s")
+    print(f"vectorized     {vectorized:>8.3f}s  {args.stakes / vectorized:>12.0f} stakes/s")
+
+def main():
+    """Parse arguments and run the selected benchmark"""
+    parser = argparse.ArgumentParser(description='Crypto Wallet Bot benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    
+    wallets_parser = subparsers.add_parser('wallets', help='wallet generation throughput')
+    wallets_parser.add_argument('--count', type=int, default=100)
+    wallets_parser.add_argument('--networks', nargs='*', choices=SUPPORTED_NETWORKS)
+    wallets_parser.set_defaults(func=bench_wallets)
+    
+    generation_parser = subparsers.add_parser('generation', help='process pool wallet generation throughput')
+    generation_parser.add_argument('--network', default='ETH', choices=SUPPORTED_NETWORKS)
+    generation_parser.add_argument('--count', type=int, default=10000)
+    generation_parser.add_argument('--workers', type=int, default=0)
+    generation_parser.set_defaults(func=bench_generation)
+    
+    persistence_parser = subparsers.add_parser('persistence', help='wallet insert throughput')
+    persistence_parser.add_argument('--rows', type=int, nargs='*', default=[1000, 10000, 100000])
+    persistence_parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    persistence_parser.add_argument('--per-row-limit', type=int, default=100000, help='skip the per-row path above this many rows')
+    persistence_parser.set_defaults(func=bench_persistence)
+    
+    addresses_parser = subparsers.add_parser('addresses', help='address validation throughput')
+    addresses_parser.add_argument('--count', type=int, default=100000)
+    addresses_parser.set_defaults(func=bench_addresses)
+    
+    startup_parser = subparsers.add_parser('startup', help='import time and memory of bot modules')
+    startup_parser.add_argument('--repeat', type=int, default=3)
+    startup_parser.set_defaults(func=bench_startup)
+    
+    storage_parser = subparsers.add_parser('storage', help='full vs compact wallet storage size')
+    storage_parser.add_argument('--rows', type=int, default=100000)
+    storage_parser.add_argument('--database-url', help='defaults to temporary SQLite files, tables are recreated')
+    storage_parser.set_defaults(func=bench_storage)
+    
+    queries_parser = subparsers.add_parser('queries', help='hot path query plans before and after indexing')
+    queries_parser.add_argument('--users', type=int, default=100000)
+    queries_parser.add_argument('--wallets', type=int, default=1000000)
+    queries_parser.add_argument('--stakes', type=int, default=1000000)
+    queries_parser.add_argument('--withdrawals', type=int, default=500000)
+    queries_parser.add_argument('--samples', type=int, default=20)
+    queries_parser.add_argument('--database-url', help='defaults to a temporary SQLite file, tables are recreated')
+    queries_parser.set_defaults(func=bench_queries)
+    
+    staking_parser = subparsers.add_parser('staking', help='reward accrual, staking stats and matured stake completion')
+    staking_parser.add_argument('--users', type=int, default=100000)
+    staking_parser.add_argument('--stakes', type=int, default=1000000)
+    staking_parser.add_argument('--samples', type=int, default=20)
+    staking_parser.add_argument('--matured', type=float, default=0.1, help='share of finished stakes left active')
+    staking_parser.add_argument('--database-url', help='defaults to a temporary SQLite file, tables are recreated')
+    staking_parser.set_defaults(func=bench_staking)
+    
+    rewards_parser = subparsers.add_parser('rewards', help='per-stake vs vectorized reward calculation')
+    rewards_parser.add_argument('--stakes', type=int, default=1000000)
+    rewards_parser.set_defaults(func=bench_rewards)
+    
+    args = parser.parse_args()
+    args.func(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
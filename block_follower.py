@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Set
+from database import SessionLocal, Wallet
+from rpc_providers import provider_registry
+from balance_checker import balance_checker
+from balance_cache import balance_cache
+from balance_refresher import balance_refresher
+from config import (
+    EVM_NETWORKS,
+    USDT_CONTRACTS,
+    BLOCK_FOLLOWER_NETWORKS,
+    BLOCK_FOLLOWER_CONFIRMATIONS,
+    BLOCK_FOLLOWER_MAX_BLOCKS,
+    BLOCK_FOLLOWER_RELOAD_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+# keccak256('Transfer(address,address,uint256)')
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+
+TrackedWallet = namedtuple('TrackedWallet', ['id', 'user_id', 'address'])
+
+class BlockFollower:
+    def __init__(
+        self,
+        network: str,
+        session_factory=SessionLocal,
+        confirmations: int = BLOCK_FOLLOWER_CONFIRMATIONS,
+        max_blocks: int = BLOCK_FOLLOWER_MAX_BLOCKS
+    ):
+        if network not in EVM_NETWORKS:
+            raise ValueError(f"Unsupported network: {network}")
+        
+        self.network = network
+        self.rpc_network = EVM_NETWORKS[network]
+        self.session_factory = session_factory
+        self.confirmations = confirmations
+        self.max_blocks = max_blocks
+        self.token = USDT_CONTRACTS.get(network) if network == 'ETH' else None
+        
+        self.tracked = {}
+        self.tracked_loaded_at = None
+        self.last_block = None
+        self.block_hashes = {}
+        self.block_touched = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'blocks': 0,
+            'reorged_blocks': 0,
+            'touched_addresses': 0,
+            'seconds': 0.0,
+            'blocks_per_sec': 0.0
+        }
+
+    def load_addresses(self, db) -> None:
+        """Load our addresses for network into memory"""
+        tracked = {}
+        for wallet in db.query(Wallet.id, Wallet.user_id, Wallet.address).filter(
+            Wallet.network == self.network,
+            Wallet.user_id.isnot(None)
+        ):
+            tracked.setdefault(wallet.address.lower(), []).append(
+                TrackedWallet(wallet.id, wallet.user_id, wallet.address)
+            )
+        self.tracked = tracked
+        self.tracked_loaded_at = time.monotonic()
+
+    def get_touched_addresses(self, blocks: List[Dict]) -> Dict[int, Set[str]]:
+        """Get our addresses that sent or received native coins or USDT, per block number"""
+        touched = {int(block['number'], 16): set() for block in blocks}
+        for block in blocks:
+            for tx in block.get('transactions', []):
+                for party in (tx.get('from'), tx.get('to')):
+                    if party and party.lower() in self.tracked:
+                        touched[int(block['number'], 16)].add(party.lower())
+        
+        if self.token and blocks:
+            logs = provider_registry.request(self.rpc_network, 'eth_getLogs', [{
+                'fromBlock': hex(min(touched)),
+                'toBlock': hex(max(touched)),
+                'address': self.token,
+                'topics': [TRANSFER_TOPIC]
+            }])
+            for log in logs or []:
+                number = int(log['blockNumber'], 16)
+                if number not in touched:
+                    # Unchanged block between re-read reorged ones and new ones
+                    continue
+                for topic in log['topics'][1:3]:
+                    party = '0x' + topic[-40:].lower()
+                    if party in self.tracked:
+                        touched[number].add(party)
+        
+        return touched
+
+    def find_reorged_blocks(self) -> List[int]:
+        """Re-check hashes of recent blocks, return numbers that changed"""
+        numbers = sorted(self.block_hashes)
+        if not numbers:
+            return []
+        
+        headers = provider_registry.batch_request(
+            self.rpc_network,
+            'eth_getBlockByNumber',
+            [[hex(number), False] for number in numbers]
+        )
+        return [
+            number for number, header in zip(numbers, headers)
+            if header is None or header['hash'] != self.block_hashes[number]
+        ]
+
+    def poll(self) -> Set[str]:
+        """Process new blocks since the last poll, returns touched addresses"""
+        head = int(provider_registry.request(self.rpc_network, 'eth_blockNumber', []), 16)
+        if self.last_block is None:
+            # Start following from the current head, snapshots cover the past
+            self.last_block = head
+            return set()
+        
+        started = time.monotonic()
+        reorged = self.find_reorged_blocks()
+        new_numbers = list(range(self.last_block + 1, min(head, self.last_block + self.max_blocks) + 1))
+        numbers = sorted(set(reorged) | set(new_numbers))
+        if not numbers:
+            return set()
+        
+        results = provider_registry.batch_request(
+            self.rpc_network,
+            'eth_getBlockByNumber',
+            [[hex(number), True] for number in numbers]
+        )
+        
+        blocks = []
+        for number, block in zip(numbers, results):
+            if block is None:
+                # Node does not serve this block yet, continue from here next poll
+                break
+            blocks.append(block)
+        
+        # Orphaned blocks may have moved balances the replacement blocks do not touch
+        touched_by_block = self.get_touched_addresses(blocks)
+        touched = set().union(
+            *touched_by_block.values(),
+            *(self.block_touched.get(number, set()) for number in reorged)
+        )
+        self.refresh_addresses(touched)
+        
+        # Advance only once the touched balances are stored, a failed refresh retries these blocks
+        for block in blocks:
+            number = int(block['number'], 16)
+            self.block_hashes[number] = block['hash']
+            self.block_touched[number] = touched_by_block[number]
+            if number > self.last_block:
+                self.last_block = number
+        
+        for number in [n for n in self.block_hashes if n <= self.last_block - self.confirmations]:
+            del self.block_hashes[number]
+            self.block_touched.pop(number, None)
+        
+        elapsed = time.monotonic() - started
+        self.stats['blocks'] += len(blocks)
+        self.stats['reorged_blocks'] += len(reorged)
+        self.stats['touched_addresses'] += len(touched)
+        self.stats['seconds'] += elapsed
+        if self.stats['seconds'] > 0:
+            self.stats['blocks_per_sec'] = self.stats['blocks'] / self.stats['seconds']
+        return touched
+
+    def refresh_addresses(self, addresses: Set[str]) -> None:
+        """Re-read balances of touched addresses and update their snapshots"""
+        if not addresses:
+            return
+        
+        # Addresses of orphaned blocks may have been dropped by a reload since
+        wallets = [wallet for address in addresses for wallet in self.tracked.get(address, [])]
+        # Drop stale entries first, the bulk read caches every balance it gets
+        for wallet in wallets:
+            balance_cache.invalidate(self.network, wallet.address)
+        block_number, balances = balance_checker.get_evm_balances_bulk(
+            sorted({wallet.address for wallet in wallets}),
+            self.network
+        )
+        
+        db = self.session_factory()
+        try:
+            balance_refresher.write_snapshots(db, self.network, wallets, block_number, balances)
+        finally:
+            db.close()
+
+    def run_once(self) -> Optional[Set[str]]:
+        """Reload addresses when due and poll if any are tracked, None if a poll is already running"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        
+        try:
+            if self.tracked_loaded_at is None or time.monotonic() - self.tracked_loaded_at > BLOCK_FOLLOWER_RELOAD_INTERVAL:
+                db = self.session_factory()
+                try:
+                    self.load_addresses(db)
+                finally:
+                    db.close()
+            if not self.tracked:
+                # Nothing to follow, start again from the head once wallets appear
+                self.last_block = None
+                self.block_hashes = {}
+                self.block_touched = {}
+                return set()
+            return self.poll()
+        finally:
+            self._lock.release()
+
+    async def follow_job(self, context) -> None:
+        """Job queue callback, polls off the event loop"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.run_once)
+        except Exception as e:
+            logger.error(f"Error following {self.network} blocks: {e}")
+
+# Global instances
+block_followers = {network: BlockFollower(network) for network in BLOCK_FOLLOWER_NETWORKS}
@@ -11,15 +11,30 @@ from telegram.ext import (
 )
 from telegram.constants import ParseMode
 
-from config import TELEGRAM_TOKEN
-from database import get_db, create_user, get_user_by_telegram_id, get_user_wallets, create_wallet, log_withdrawal
-from wallet_generator import generate_multiple_wallets
+from datetime import datetime, time, timezone
+from typing import Dict, List, Optional
+from sqlalchemy.exc import IntegrityError
+from config import (
+    TELEGRAM_TOKEN, BALANCE_REFRESH_INTERVAL, BLOCK_FOLLOWER_INTERVAL, WALLET_RESERVOIR_REFILL_INTERVAL,
+    WALLET_STORAGE_MODE
+)
+from async_database import (
+    async_database, with_session, create_user_async, get_user_identity_async, get_user_wallets_async,
+    create_wallets_bulk_async, log_withdrawal_async, touch_user_async, get_user_balances_async,
+    get_next_derivation_index_async
+)
+from wallet_service import wallet_generation_service
+from wallet_reservoir import wallet_reservoir
+from seed_vault import seed_vault
 from balance_checker import balance_checker
+from balance_refresher import balance_refresher
+from block_follower import block_followers
 from staking_manager import staking_manager
+from maturity_scheduler import maturity_scheduler
 from utils import (
     escape_markdown, format_balance_message, format_wallet_list, validate_address,
     validate_amount, get_network_from_address, create_main_keyboard, create_network_keyboard,
-    create_asset_keyboard, create_staking_period_keyboard, create_swap_keyboard
+    create_asset_keyboard, create_staking_period_keyboard, create_swap_keyboard, get_available_assets
 )
 
 # Enable logging
@@ -37,21 +52,23 @@ CHOOSING_SWAP_OPTION, ENTERING_SWAP_AMOUNT, CONFIRMING_SWAP = range(9, 12)
 # User states storage
 user_states = {}
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+@with_session
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> None:
     """Handle /start command"""
-    db = next(get_db())
     telegram_id = update.effective_user.id
     
-    # Check if user exists
-    user = get_user_by_telegram_id(db, telegram_id)
+    # Check if user exists, this also warms the identity cache
+    user = await get_user_identity_async(db, telegram_id)
     if not user:
-        user = create_user(db, telegram_id)
+        user = await create_user_async(db, telegram_id)
+    await touch_user_async(db, user.id)
     
     # Welcome message
+    creation_date = user.creation_date.strftime('%d\\.%m\\.%Y %H:%M')
     welcome_text = (
         f"🌸 Добро пожаловать, самурай\\! 🌸\n"
         f"Ваш аккаунт: `{user.account_id}`\n"
-        f"Создан: {user.creation_date.strftime('%d\\.%m\\.%Y %H:%M')}\n"
+        f"Создан: {creation_date}\n"
         f"Выберите действие ниже\\! 🗡️"
     )
     
@@ -83,56 +100,83 @@ async def handle_network_choice(update: Update, context: ContextTypes.DEFAULT_TY
     )
     return CHOOSING_COUNT
 
-async def handle_wallet_count(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+# Attempts to store compact wallets when concurrent requests claim the same indexes
+COMPACT_INDEX_RETRIES = 3
+
+async def generate_compact_wallets(db, user_id: int, network: str, count: int) -> Optional[List[Dict]]:
+    """Derive and store the next count wallets of the user's master seed, None if indexes stayed contended"""
+    seed_phrase = await db.run_sync(seed_vault.get_or_create_master_seed, user_id)
+    for _ in range(COMPACT_INDEX_RETRIES):
+        start_index = await get_next_derivation_index_async(db, user_id, network)
+        await db.commit()  # release the connection while deriving
+        wallets = await wallet_generation_service.generate(
+            network,
+            count,
+            seed_phrase=seed_phrase,
+            start_index=start_index
+        )
+        try:
+            await create_wallets_bulk_async(db, user_id, network, wallets, compact=True)
+            return wallets
+        except IntegrityError:
+            # Another request of the user stored these indexes first, continue after them
+            await db.rollback()
+    return None
+
+@with_session
+async def handle_wallet_count(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> int:
     """Handle wallet count input"""
     try:
         count = int(update.message.text)
-        if count < 1 or count > 99:
-            await update.message.reply_text("Введите корректное число от 1 до 99\\.")
-            return CHOOSING_COUNT
-        
-        network = context.user_data['selected_network']
-        db = next(get_db())
-        user = get_user_by_telegram_id(db, update.effective_user.id)
-        
-        # Generate wallets
-        await update.message.reply_text(f"⏳ Генерирую {count} кошельков в сети {network}\\.\\.\\. Это может занять некоторое время\\.")
-        
-        generated_wallets = generate_multiple_wallets(network, count)
-        
-        # Save to database
-        for wallet_data in generated_wallets:
-            create_wallet(
-                db=db,
-                user_id=user.id,
-                network=network,
-                address=wallet_data['address'],
-                private_key=wallet_data['private_key'],
-                seed_phrase=wallet_data['seed_phrase']
-            )
-        
-        # Format response
-        response = f"🗡️ Сгенерированы кошельки:\n\n"
-        for i, wallet_data in enumerate(generated_wallets, 1):
-            response += f"{i}\\. `{wallet_data['address']}`\n"
-        
-        await update.message.reply_text(
-            escape_markdown(response),
-            parse_mode=ParseMode.MARKDOWN_V2,
-            reply_markup=create_main_keyboard()
-        )
-        
-        return ConversationHandler.END
-        
     except ValueError:
+        count = 0
+    if count < 1 or count > 99:
         await update.message.reply_text("Введите корректное число от 1 до 99\\.")
         return CHOOSING_COUNT
+    
+    network = context.user_data['selected_network']
+    user = await get_user_identity_async(db, update.effective_user.id)
+    
+    if WALLET_STORAGE_MODE == 'compact':
+        # Derive the next indexes of the user's master seed, no key material is stored
+        generated_wallets = await generate_compact_wallets(db, user.id, network, count)
+        if generated_wallets is None:
+            await update.message.reply_text("❌ Не удалось сгенерировать кошельки\\. Попробуйте ещё раз\\.")
+            return ConversationHandler.END
+    else:
+        # Take pre-generated wallets from the reservoir, generate only the shortfall
+        generated_wallets = [
+            {'address': wallet.address, 'derivation_index': wallet.derivation_index}
+            for wallet in await db.run_sync(wallet_reservoir.claim, user.id, network, count)
+        ]
+        
+        if len(generated_wallets) < count:
+            await update.message.reply_text(f"⏳ Генерирую {count} кошельков в сети {network}\\.\\.\\. Это может занять некоторое время\\.")
+            
+            new_wallets = await wallet_generation_service.generate(network, count - len(generated_wallets))
+            
+            # Save to database
+            await create_wallets_bulk_async(db, user.id, network, new_wallets)
+            generated_wallets.extend(new_wallets)
+    
+    # Format response
+    response = f"🗡️ Сгенерированы кошельки:\n\n"
+    for i, wallet_data in enumerate(generated_wallets, 1):
+        response += f"{i}\\. `{wallet_data['address']}`\n"
+    
+    await update.message.reply_text(
+        escape_markdown(response),
+        parse_mode=ParseMode.MARKDOWN_V2,
+        reply_markup=create_main_keyboard()
+    )
+    
+    return ConversationHandler.END
 
-async def handle_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+@with_session
+async def handle_balance(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> None:
     """Handle balance check request"""
-    db = next(get_db())
-    user = get_user_by_telegram_id(db, update.effective_user.id)
-    wallets = get_user_wallets(db, user.id)
+    user = await get_user_identity_async(db, update.effective_user.id)
+    wallets = await get_user_wallets_async(db, user.id)
     
     if not wallets:
         await update.message.reply_text(
@@ -141,26 +185,47 @@ async def handle_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
     
-    await update.message.reply_text("💰 Собираю общий баланс по всем кошелькам\\.\\.\\.")
+    await touch_user_async(db, user.id)
     
-    # Get balances
+    # Answer from the background snapshots, assets of one address in several networks are merged
     balances = {}
-    for wallet in wallets:
-        balance = balance_checker.get_balance(wallet.address, wallet.network)
-        balances[wallet.address] = balance
+    snapshotted = set()
+    oldest_fetch = None
+    for snapshot in await get_user_balances_async(db, user.id):
+        balances.setdefault(snapshot.address, {})[snapshot.asset] = snapshot.amount
+        snapshotted.add((snapshot.network, snapshot.address))
+        if oldest_fetch is None or snapshot.fetched_at < oldest_fetch:
+            oldest_fetch = snapshot.fetched_at
+    
+    # Wallets without a snapshot yet are fetched live, slow RPCs are reported instead of awaited
+    missing = [wallet for wallet in wallets if (wallet.network, wallet.address) not in snapshotted]
+    await db.commit()  # release the connection before slow RPCs
+    timed_out = []
+    if missing:
+        await update.message.reply_text("💰 Собираю общий баланс по всем кошелькам\\.\\.\\.")
+        live_balances, timed_out = await balance_checker.get_all_balances_async(missing)
+        for address, balance in live_balances.items():
+            balances.setdefault(address, {}).update(balance)
     
     # Format and send response
-    balance_message = format_balance_message(balances)
+    balance_message = format_balance_message(balances) if balances else ""
+    if oldest_fetch is not None:
+        age = int((datetime.utcnow() - oldest_fetch).total_seconds())
+        balance_message += escape_markdown(f"🕒 Обновлено {age} сек. назад\n")
+    if timed_out:
+        balance_message += escape_markdown(
+            f"⏳ Не удалось получить баланс {len(timed_out)} кошельков вовремя, попробуйте позже."
+        )
     await update.message.reply_text(
         balance_message,
         parse_mode=ParseMode.MARKDOWN_V2
     )
 
-async def handle_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+@with_session
+async def handle_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> None:
     """Handle deposit request"""
-    db = next(get_db())
-    user = get_user_by_telegram_id(db, update.effective_user.id)
-    wallets = get_user_wallets(db, user.id)
+    user = await get_user_identity_async(db, update.effective_user.id)
+    wallets = await get_user_wallets_async(db, user.id)
     
     if not wallets:
         await update.message.reply_text(
@@ -175,11 +240,11 @@ async def handle_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         parse_mode=ParseMode.MARKDOWN_V2
     )
 
-async def handle_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@with_session
+async def handle_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> int:
     """Handle withdrawal request"""
-    db = next(get_db())
-    user = get_user_by_telegram_id(db, update.effective_user.id)
-    wallets = get_user_wallets(db, user.id)
+    user = await get_user_identity_async(db, update.effective_user.id)
+    wallets = await get_user_wallets_async(db, user.id)
     
     if not wallets:
         await update.message.reply_text(
@@ -195,24 +260,34 @@ async def handle_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
     return CHOOSING_WALLET
 
-async def handle_withdraw_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@with_session
+async def handle_withdraw_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> int:
     """Handle wallet selection for withdrawal"""
-    address = update.message.text.strip()
-    db = next(get_db())
-    user = get_user_by_telegram_id(db, update.effective_user.id)
-    wallets = get_user_wallets(db, user.id)
+    # Compact EVM wallets share one address across networks, "BNB 0x..." picks the network
+    parts = update.message.text.split()
+    network = parts[0].upper() if len(parts) == 2 else None
+    address = parts[-1] if parts else ''
+    user = await get_user_identity_async(db, update.effective_user.id)
+    wallets = await get_user_wallets_async(db, user.id)
     
     # Find wallet
-    selected_wallet = None
-    for wallet in wallets:
-        if wallet.address.lower() == address.lower():
-            selected_wallet = wallet
-            break
+    matches = [
+        wallet for wallet in wallets
+        if wallet.address.lower() == address.lower() and network in (None, wallet.network)
+    ]
     
-    if not selected_wallet:
+    if not matches:
         await update.message.reply_text("Адрес не найден в вашем списке\\.")
         return CHOOSING_WALLET
     
+    if len(matches) > 1:
+        networks = ', '.join(wallet.network for wallet in matches)
+        await update.message.reply_text(
+            escape_markdown(f"Адрес используется в сетях {networks}. Введите сеть и адрес, например: {matches[0].network} {address}")
+        )
+        return CHOOSING_WALLET
+    
+    selected_wallet = matches[0]
     context.user_data['withdraw_wallet'] = selected_wallet
     
     # Get available assets
@@ -256,7 +331,8 @@ async def handle_withdraw_amount(update: Update, context: ContextTypes.DEFAULT_T
     await update.message.reply_text("Введите адрес получателя:")
     return ENTERING_RECIPIENT
 
-async def handle_withdraw_recipient(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@with_session
+async def handle_withdraw_recipient(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> int:
     """Handle recipient address input"""
     recipient = update.message.text.strip()
     wallet = context.user_data['withdraw_wallet']
@@ -269,11 +345,10 @@ async def handle_withdraw_recipient(update: Update, context: ContextTypes.DEFAUL
         return ENTERING_RECIPIENT
     
     # Log withdrawal
-    db = next(get_db())
-    user = get_user_by_telegram_id(db, update.effective_user.id)
+    user = await get_user_identity_async(db, update.effective_user.id)
     
-    log_withdrawal(
-        db=db,
+    await log_withdrawal_async(
+        db,
         user_id=user.id,
         from_address=wallet.address,
         to_address=recipient,
@@ -293,11 +368,11 @@ async def handle_withdraw_recipient(update: Update, context: ContextTypes.DEFAUL
     
     return ConversationHandler.END
 
-async def handle_swap(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@with_session
+async def handle_swap(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> int:
     """Handle swap request"""
-    db = next(get_db())
-    user = get_user_by_telegram_id(db, update.effective_user.id)
-    wallets = get_user_wallets(db, user.id)
+    user = await get_user_identity_async(db, update.effective_user.id)
+    wallets = await get_user_wallets_async(db, user.id)
     
     if not wallets:
         await update.message.reply_text(
@@ -313,11 +388,11 @@ async def handle_swap(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     )
     return CHOOSING_WALLET
 
-async def handle_staking(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@with_session
+async def handle_staking(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> int:
     """Handle staking request"""
-    db = next(get_db())
-    user = get_user_by_telegram_id(db, update.effective_user.id)
-    wallets = get_user_wallets(db, user.id)
+    user = await get_user_identity_async(db, update.effective_user.id)
+    wallets = await get_user_wallets_async(db, user.id)
     
     if not wallets:
         await update.message.reply_text(
@@ -333,11 +408,11 @@ async def handle_staking(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
     return CHOOSING_WALLET
 
-async def handle_my_stakes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+@with_session
+async def handle_my_stakes(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> None:
     """Handle my stakes request"""
-    db = next(get_db())
-    user = get_user_by_telegram_id(db, update.effective_user.id)
-    stakes = staking_manager.get_user_stakes(db, user.id)
+    user = await get_user_identity_async(db, update.effective_user.id)
+    stakes = await db.run_sync(staking_manager.get_user_stakes, user.id)
     
     if not stakes:
         await update.message.reply_text(
@@ -347,8 +422,7 @@ async def handle_my_stakes(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
     
     message = "📋 Ваши активные стейки:\n\n"
-    for stake in stakes:
-        summary = staking_manager.get_stake_summary(stake)
+    for summary in staking_manager.get_stake_summaries(stakes):
         message += f"*ID:* {summary['id']}\n"
         message += f"*Кошелек:* `{summary['wallet_address']}`\n"
         message += f"*Актив:* {summary['asset']}\n"
@@ -357,6 +431,10 @@ async def handle_my_stakes(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         message += f"*Текущее вознаграждение:* {summary['current_reward']:.8f}\n"
         message += f"*Дней осталось:* {summary['days_remaining']}\n\n"
     
+    stats = await db.run_sync(staking_manager.get_staking_stats, user.id)
+    for asset, totals in sorted(stats['assets'].items()):
+        message += f"*Итого {asset}:* {totals['staked']:.8f} (+{totals['reward']:.8f})\n"
+    
     await update.message.reply_text(
         escape_markdown(message),
         parse_mode=ParseMode.MARKDOWN_V2
@@ -407,14 +485,23 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             parse_mode=ParseMode.MARKDOWN_V2
         )
 
+async def shutdown(application: Application) -> None:
+    """Stop background workers and close pooled connections"""
+    wallet_generation_service.shutdown()
+    await async_database.dispose()
+
 def main() -> None:
     """Start the bot"""
+    # Compact wallets cannot be stored or signed without the seed encryption key
+    if WALLET_STORAGE_MODE == 'compact':
+        seed_vault.get_fernet()
+    
     # Initialize database
     from database import init_db
     init_db()
     
     # Create application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_TOKEN).post_shutdown(shutdown).build()
     
     # Add conversation handler for wallet generation
     conv_handler = ConversationHandler(
@@ -444,6 +531,32 @@ def main() -> None:
     application.add_handler(withdraw_handler)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
     
+    # Keep balance snapshots fresh in the background
+    if application.job_queue:
+        application.job_queue.run_repeating(
+            balance_refresher.refresh_job,
+            interval=BALANCE_REFRESH_INTERVAL,
+            first=10
+        )
+        for follower in block_followers.values():
+            application.job_queue.run_repeating(
+                follower.follow_job,
+                interval=BLOCK_FOLLOWER_INTERVAL,
+                first=5
+            )
+        maturity_scheduler.start(application.job_queue, staking_manager.run_completion)
+        # Catch up on a missed accrual after downtime, then accrue after each UTC midnight
+        application.job_queue.run_once(staking_manager.accrual_job, when=30)
+        application.job_queue.run_daily(staking_manager.accrual_job, time=time(0, 5, tzinfo=timezone.utc))
+        if WALLET_STORAGE_MODE != 'compact':
+            application.job_queue.run_repeating(
+                wallet_reservoir.refill_job,
+                interval=WALLET_RESERVOIR_REFILL_INTERVAL,
+                first=15
+            )
+    else:
+        logger.warning("Job queue is not available, background jobs will not run")
+    
     # Start the bot
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
@@ -1,9 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, Boolean
+from sqlalchemy import (
+    create_engine, Column, Integer, BigInteger, String, DateTime, Float, Text, Boolean, UniqueConstraint, Index,
+    select, insert, update, text, func, bindparam
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import random
-from config import DATABASE_URL
+from config import DATABASE_URL, WALLET_COPY_THRESHOLD
+from balance_cache import balance_cache
+from identity_cache import user_identity_cache
 
 Base = declarative_base()
 
@@ -15,19 +20,68 @@ class User(Base):
     telegram_id = Column(Integer, unique=True, nullable=False)
     account_id = Column(String(9), unique=True, nullable=False)
     creation_date = Column(DateTime, default=datetime.utcnow)
+    last_active_at = Column(DateTime)
+    # Active stakes of the user, kept in the same transactions that change them
+    active_stakes = Column(Integer, default=0, server_default=text('0'), nullable=False)
 
 class Wallet(Base):
     __tablename__ = 'wallets'
+    __table_args__ = (
+        # Unassigned (reservoir) wallets, claimed in id order per network
+        Index(
+            'ix_wallets_reservoir', 'network', 'id',
+            postgresql_where=text('user_id IS NULL'),
+            sqlite_where=text('user_id IS NULL')
+        ),
+        # Compact wallets: one per index of the user's master seed
+        Index(
+            'uq_wallets_user_derivation', 'user_id', 'network', 'derivation_index',
+            unique=True,
+            postgresql_where=text('seed_phrase IS NULL'),
+            sqlite_where=text('seed_phrase IS NULL')
+        ),
+        Index('ix_wallets_user_id', 'user_id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)  # NULL while the wallet waits in the reservoir
+    network = Column(String(10), nullable=False)
+    address = Column(String(100), nullable=False)
+    # NULL for compact wallets, keys are re-derived from the user's master seed
+    private_key = Column(Text)
+    seed_phrase = Column(Text)
+    derivation_index = Column(Integer)
+
+class UserSeed(Base):
+    __tablename__ = 'user_seeds'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, unique=True, nullable=False)
+    encrypted_seed = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Column order of COPY rows in create_wallets_bulk
+WALLET_COPY_COLUMNS = ['user_id', 'network', 'address', 'private_key', 'seed_phrase', 'derivation_index']
+
+class WalletBalance(Base):
+    __tablename__ = 'wallet_balances'
+    __table_args__ = (UniqueConstraint('wallet_id', 'asset'),)
     
     id = Column(Integer, primary_key=True)
+    wallet_id = Column(Integer, nullable=False)
     user_id = Column(Integer, nullable=False)
     network = Column(String(10), nullable=False)
     address = Column(String(100), nullable=False)
-    private_key = Column(Text, nullable=False)
-    seed_phrase = Column(Text, nullable=False)
+    asset = Column(String(10), nullable=False)
+    amount = Column(Float, nullable=False)
+    block_number = Column(BigInteger)
+    fetched_at = Column(DateTime, nullable=False)
 
 class WithdrawalLog(Base):
     __tablename__ = 'withdrawal_logs'
+    __table_args__ = (
+        Index('ix_withdrawal_logs_user_timestamp', 'user_id', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False)
@@ -42,6 +96,35 @@ class WithdrawalLog(Base):
 
 class StakingLog(Base):
     __tablename__ = 'staking_logs'
+    __table_args__ = (
+        Index('ix_staking_logs_user_status', 'user_id', 'status'),
+        # Maturity scans only look at active stakes
+        Index(
+            'ix_staking_logs_active_end_date', 'end_date',
+            postgresql_where=text("status = 'active'"),
+            sqlite_where=text("status = 'active'")
+        ),
+        # At most one active stake per wallet and asset
+        Index(
+            'uq_staking_logs_active_wallet_asset', 'user_id', 'wallet_address', 'asset',
+            unique=True,
+            postgresql_where=text("status = 'active'"),
+            sqlite_where=text("status = 'active'")
+        ),
+        # Accrual walks active stakes by id and checks the watermark in the index,
+        # status is repeated so SQLite also treats these partial indexes as covering
+        Index(
+            'ix_staking_logs_active_accrual', 'id', 'last_accrued_at', 'status',
+            postgresql_where=text("status = 'active'"),
+            sqlite_where=text("status = 'active'")
+        ),
+        # Covers per-asset totals of active stakes
+        Index(
+            'ix_staking_logs_active_totals', 'asset', 'amount', 'accrued_reward', 'status',
+            postgresql_where=text("status = 'active'"),
+            sqlite_where=text("status = 'active'")
+        ),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False)
@@ -53,6 +136,8 @@ class StakingLog(Base):
     end_date = Column(DateTime, nullable=False)
     status = Column(String(20), default='active')
     accrued_reward = Column(Float, default=0.0)
+    # accrued_reward of an active stake is as of this time
+    last_accrued_at = Column(DateTime, nullable=True)
 
 # Database connection
 engine = create_engine(DATABASE_URL)
@@ -66,7 +151,9 @@ def get_db():
         db.close()
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """Create missing tables and apply pending schema migrations"""
+    from migrations import migrate
+    migrate(engine)
 
 def generate_account_id():
     """Generate a random 9-digit account ID"""
@@ -83,30 +170,177 @@ def create_user(db, telegram_id):
     db.add(user)
     db.commit()
     db.refresh(user)
+    user_identity_cache.put(user)
     return user
 
 def get_user_by_telegram_id(db, telegram_id):
     """Get user by telegram ID"""
     return db.query(User).filter(User.telegram_id == telegram_id).first()
 
+def get_user_identity(db, telegram_id):
+    """Get immutable identity of a user from the cache or the database, None if unknown"""
+    identity = user_identity_cache.get(telegram_id)
+    if identity is not None:
+        return identity
+    return load_user_identity(db, telegram_id)
+
+def load_user_identity(db, telegram_id):
+    """Read identity of a user from the database into the cache after a miss, None if unknown"""
+    user = get_user_by_telegram_id(db, telegram_id)
+    return user_identity_cache.put(user) if user else None
+
 def get_user_wallets(db, user_id):
     """Get all wallets for a user"""
     return db.query(Wallet).filter(Wallet.user_id == user_id).all()
 
-def create_wallet(db, user_id, network, address, private_key, seed_phrase):
+def touch_user(db, user_id):
+    """Record user activity, used to prioritise balance refreshes"""
+    db.query(User).filter(User.id == user_id).update(
+        {User.last_active_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.commit()
+
+def get_user_balances(db, user_id):
+    """Get balance snapshots for all wallets of a user"""
+    return db.query(WalletBalance).filter(WalletBalance.user_id == user_id).all()
+
+def upsert_wallet_balances(db, rows):
+    """Insert or update balance snapshots keyed by (wallet_id, asset)"""
+    if not rows:
+        return
+    
+    if db.bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    
+    statement = insert(WalletBalance).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['wallet_id', 'asset'],
+        set_={
+            'amount': statement.excluded.amount,
+            'block_number': statement.excluded.block_number,
+            'fetched_at': statement.excluded.fetched_at,
+        }
+    )
+    db.execute(statement)
+    db.commit()
+
+def create_wallet(db, user_id, network, address, private_key, seed_phrase, derivation_index=None):
     """Create a new wallet"""
     wallet = Wallet(
         user_id=user_id,
         network=network,
         address=address,
         private_key=private_key,
-        seed_phrase=seed_phrase
+        seed_phrase=seed_phrase,
+        derivation_index=derivation_index
     )
     db.add(wallet)
     db.commit()
     db.refresh(wallet)
     return wallet
 
+def _copy_wallets(db, rows):
+    """Stream wallet rows through Postgres COPY on the session's connection"""
+    import csv
+    import io
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] if row[column] is not None else '' for column in WALLET_COPY_COLUMNS])
+    buffer.seek(0)
+    
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY wallets ({', '.join(WALLET_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def create_wallets_bulk(db, user_id, network, wallets, compact=False):
+    """Create many wallets in one transaction, returns rows inserted
+    
+    Uses Postgres COPY from WALLET_COPY_THRESHOLD rows, a batched
+    executemany otherwise. Compact wallets store no key material.
+    """
+    rows = [
+        {
+            'user_id': user_id,
+            'network': network,
+            'address': wallet['address'],
+            'private_key': None if compact else wallet['private_key'],
+            'seed_phrase': None if compact else wallet['seed_phrase'],
+            'derivation_index': wallet.get('derivation_index')
+        }
+        for wallet in wallets
+    ]
+    if not rows:
+        return 0
+    
+    try:
+        if db.bind.dialect.driver == 'psycopg2' and len(rows) >= WALLET_COPY_THRESHOLD:
+            _copy_wallets(db, rows)
+        else:
+            db.execute(insert(Wallet), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(rows)
+
+def add_reservoir_wallets(db, network, wallets):
+    """Store pre-generated unassigned wallets in one transaction"""
+    return create_wallets_bulk(db, None, network, wallets)
+
+def claim_reservoir_wallets(db, user_id, network, count):
+    """Assign up to count reservoir wallets to a user in one UPDATE ... RETURNING"""
+    candidates = select(Wallet.id).where(
+        Wallet.network == network,
+        Wallet.user_id.is_(None)
+    ).order_by(Wallet.id).limit(count).with_for_update(skip_locked=True)
+    
+    claimed = db.execute(
+        update(Wallet).where(Wallet.id.in_(candidates.scalar_subquery())).values(
+            user_id=user_id
+        ).returning(
+            Wallet.id, Wallet.address, Wallet.derivation_index
+        ).execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return sorted(claimed, key=lambda wallet: wallet.id)
+
+def get_reservoir_depths(db):
+    """Get number of unassigned wallets per network"""
+    return dict(db.query(Wallet.network, func.count(Wallet.id)).filter(
+        Wallet.user_id.is_(None)
+    ).group_by(Wallet.network).all())
+
+def get_user_seed(db, user_id):
+    """Get encrypted master seed record of a user"""
+    return db.query(UserSeed).filter(UserSeed.user_id == user_id).first()
+
+def create_user_seed(db, user_id, encrypted_seed):
+    """Store encrypted master seed of a user"""
+    user_seed = UserSeed(user_id=user_id, encrypted_seed=encrypted_seed)
+    db.add(user_seed)
+    db.commit()
+    db.refresh(user_seed)
+    return user_seed
+
+def get_next_derivation_index(db, user_id, network):
+    """Get first unused master seed index of a user in network"""
+    last_index = db.query(func.max(Wallet.derivation_index)).filter(
+        Wallet.user_id == user_id,
+        Wallet.network == network,
+        Wallet.seed_phrase.is_(None)
+    ).scalar()
+    return 0 if last_index is None else last_index + 1
+
 def get_active_stakes(db, user_id):
     """Get active stakes for a user"""
     return db.query(StakingLog).filter(
@@ -114,6 +348,42 @@ def get_active_stakes(db, user_id):
         StakingLog.status == 'active'
     ).all()
 
+def reserve_stake_slot(db, user_id, max_active):
+    """Count a new active stake for a user unless already at max_active, not committed"""
+    return db.execute(
+        update(User).where(
+            User.id == user_id,
+            User.active_stakes < max_active
+        ).values(
+            active_stakes=User.active_stakes + 1
+        ).returning(User.active_stakes).execution_options(synchronize_session=False)
+    ).first() is not None
+
+def release_stake_slots(db, released):
+    """Uncount stakes that left the active state, released maps user id to count, not committed"""
+    if not released:
+        return
+    users = User.__table__
+    db.execute(
+        update(users).where(users.c.id == bindparam('stake_user_id')).values(
+            active_stakes=users.c.active_stakes - bindparam('released')
+        ),
+        [{'stake_user_id': user_id, 'released': count} for user_id, count in released.items()]
+    )
+
+def get_active_stake_count(db, user_id):
+    """Get maintained number of active stakes of a user"""
+    return db.query(User.active_stakes).filter(User.id == user_id).scalar() or 0
+
+def has_active_stake(db, user_id, wallet_address, asset):
+    """Check for an active stake of a wallet and asset"""
+    return db.query(StakingLog.id).filter(
+        StakingLog.user_id == user_id,
+        StakingLog.wallet_address == wallet_address,
+        StakingLog.asset == asset,
+        StakingLog.status == 'active'
+    ).first() is not None
+
 def create_stake(db, user_id, wallet_address, amount, asset, rate, end_date):
     """Create a new stake"""
     stake = StakingLog(
@@ -129,6 +399,12 @@ def create_stake(db, user_id, wallet_address, amount, asset, rate, end_date):
     db.refresh(stake)
     return stake
 
+def get_user_withdrawals(db, user_id, limit=20):
+    """Get latest withdrawals of a user"""
+    return db.query(WithdrawalLog).filter(
+        WithdrawalLog.user_id == user_id
+    ).order_by(WithdrawalLog.timestamp.desc()).limit(limit).all()
+
 def log_withdrawal(db, user_id, from_address, to_address, amount, token_type, network, status='pending', tx_hash=None):
     """Log a withdrawal transaction"""
     withdrawal = WithdrawalLog(
@@ -144,4 +420,8 @@ def log_withdrawal(db, user_id, from_address, to_address, amount, token_type, ne
     db.add(withdrawal)
     db.commit()
     db.refresh(withdrawal)
+    
+    # Balances of both sides are about to change
+    balance_cache.invalidate(network, from_address)
+    balance_cache.invalidate(network, to_address)
     return withdrawal
\ No newline at end of file
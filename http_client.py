@@ -0,0 +1,145 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from typing import Dict, Optional, Tuple
+from config import (
+    TRONGRID_API_KEY,
+    HOST_RATE_LIMITS,
+    HTTP_MAX_WAIT,
+    HTTP_REQUEST_TIMEOUT,
+    RPC_POOL_CONNECTIONS,
+    RPC_POOL_MAXSIZE
+)
+
+class RateLimitedError(Exception):
+    """Provider rate limit reached, the result is unknown rather than zero"""
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token if possible, otherwise return seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, max_wait: float = HTTP_MAX_WAIT) -> bool:
+        """Wait for a token, False if it would take longer than max_wait"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self._reserve()
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def block(self, seconds: float) -> None:
+        """Pause the bucket, used for provider Retry-After responses"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+class HttpClient:
+    def __init__(
+        self,
+        rate_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        api_key_headers: Optional[Dict[str, Dict[str, str]]] = None,
+        max_wait: float = HTTP_MAX_WAIT
+    ):
+        self.rate_limits = dict(HOST_RATE_LIMITS if rate_limits is None else rate_limits)
+        if api_key_headers is None:
+            api_key_headers = {}
+            if TRONGRID_API_KEY:
+                api_key_headers['api.trongrid.io'] = {'TRON-PRO-API-KEY': TRONGRID_API_KEY}
+        self.api_key_headers = api_key_headers
+        self.max_wait = max_wait
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=RPC_POOL_CONNECTIONS, pool_maxsize=RPC_POOL_MAXSIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'rate_limited': 0, 'retries': 0}
+
+    def get_bucket(self, host: str) -> Optional[TokenBucket]:
+        """Get the token bucket for host, None if host is not limited"""
+        if host not in self.rate_limits:
+            return None
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(*self.rate_limits[host])
+            return self._buckets[host]
+
+    def throttle(self, host: str) -> None:
+        """Take a token for host, raise RateLimitedError if none comes in time"""
+        bucket = self.get_bucket(host)
+        if bucket is not None and not bucket.acquire(self.max_wait):
+            with self._lock:
+                self._stats['rate_limited'] += 1
+            raise RateLimitedError(f"Rate limit reached for {host}")
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET url through the shared pool, respecting host limits and Retry-After"""
+        host = urlparse(url).hostname
+        headers = dict(self.api_key_headers.get(host, {}))
+        headers.update(kwargs.pop('headers', {}))
+        kwargs.setdefault('timeout', HTTP_REQUEST_TIMEOUT)
+        
+        for attempt in range(2):
+            self.throttle(host)
+            response = self.session.get(url, headers=headers, **kwargs)
+            with self._lock:
+                self._stats['requests'] += 1
+            
+            if response.status_code != 429:
+                return response
+            
+            retry_after = self._parse_retry_after(response)
+            bucket = self.get_bucket(host)
+            if bucket is not None:
+                bucket.block(retry_after)
+            if attempt == 0 and retry_after <= self.max_wait:
+                with self._lock:
+                    self._stats['retries'] += 1
+                if bucket is None:
+                    time.sleep(retry_after)
+                continue
+            break
+        
+        with self._lock:
+            self._stats['rate_limited'] += 1
+        raise RateLimitedError(f"Rate limited by {host}, retry after {retry_after:.0f}s")
+
+    def _parse_retry_after(self, response: requests.Response) -> float:
+        """Get Retry-After seconds from a 429 response"""
+        try:
+            return max(0.0, float(response.headers.get('Retry-After', 1)))
+        except ValueError:
+            return 1.0
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get request, retry and rate limit counters"""
+        with self._lock:
+            return dict(self._stats)
+
+# Global instance
+http_client = HttpClient()
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Dict, Optional
+from config import USER_IDENTITY_CACHE_SIZE
+
+# Columns of a user that never change after creation
+UserIdentity = namedtuple('UserIdentity', ['id', 'telegram_id', 'account_id', 'creation_date'])
+
+class UserIdentityCache:
+    """Bounded LRU of telegram_id -> UserIdentity
+    
+    Only existing users are cached and their identity columns are
+    immutable, so every worker process can fill its own cache without
+    coordination. Unknown telegram ids always go to the database.
+    """
+
+    def __init__(self, max_entries: int = USER_IDENTITY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+    def get(self, telegram_id: int) -> Optional[UserIdentity]:
+        """Get cached identity, None on a miss"""
+        with self._lock:
+            identity = self._entries.get(telegram_id)
+            if identity is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(telegram_id)
+            self._stats['hits'] += 1
+            return identity
+
+    def put(self, user) -> UserIdentity:
+        """Cache identity of a User row, returns it"""
+        identity = UserIdentity(user.id, user.telegram_id, user.account_id, user.creation_date)
+        with self._lock:
+            self._entries[identity.telegram_id] = identity
+            self._entries.move_to_end(identity.telegram_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return identity
+
+    def forget(self, telegram_id: int) -> None:
+        """Drop a cached identity"""
+        with self._lock:
+            self._entries.pop(telegram_id, None)
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters and hit rate"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """Drop all entries and reset counters"""
+        with self._lock:
+            self._entries.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+
+# Global instance
+user_identity_cache = UserIdentityCache()
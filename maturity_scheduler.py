@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+from database import SessionLocal, StakingLog
+from config import STAKING_SCHEDULER_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+class MaturityScheduler:
+    def __init__(self, session_factory=SessionLocal, retry_delay: float = STAKING_SCHEDULER_RETRY_DELAY):
+        self.session_factory = session_factory
+        self.retry_delay = retry_delay
+        self.heap = []
+        self.cancelled = set()
+        self.job_queue = None
+        self.on_due = None
+        self.job = None
+        self.wake_at = None
+        self.loop = None
+        self._lock = threading.Lock()
+
+    def load(self, db) -> int:
+        """Rebuild the heap from active stakes, read in end_date index order"""
+        heap = [
+            (row.end_date, row.id)
+            for row in db.query(StakingLog.end_date, StakingLog.id).filter(
+                StakingLog.status == 'active'
+            ).order_by(StakingLog.end_date, StakingLog.id)
+        ]
+        with self._lock:
+            # Keep stakes added while the scan ran, duplicates only cause an extra wake-up
+            heap.extend(self.heap)
+            heapq.heapify(heap)
+            self.heap = heap
+        return len(heap)
+
+    def add(self, stake_id: int, end_date: datetime) -> None:
+        """Track a new active stake, wake earlier if it matures first"""
+        with self._lock:
+            heapq.heappush(self.heap, (end_date, stake_id))
+            earlier = self.wake_at is None or end_date < self.wake_at
+        if earlier:
+            self.request_schedule()
+
+    def cancel(self, stake_id: int) -> None:
+        """Stop tracking a stake that left the active state early"""
+        with self._lock:
+            self.cancelled.add(stake_id)
+
+    def next_due(self) -> Optional[datetime]:
+        """Get end date of the next stake to mature"""
+        with self._lock:
+            while self.heap and self.heap[0][1] in self.cancelled:
+                self.cancelled.discard(heapq.heappop(self.heap)[1])
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, as_of: datetime) -> List[Tuple[datetime, int]]:
+        """Remove and return (end_date, stake_id) of stakes matured by as_of"""
+        due = []
+        with self._lock:
+            while self.heap and self.heap[0][0] <= as_of:
+                entry = heapq.heappop(self.heap)
+                if entry[1] in self.cancelled:
+                    self.cancelled.discard(entry[1])
+                else:
+                    due.append(entry)
+        return due
+
+    def push_back(self, entries: List[Tuple[datetime, int]]) -> None:
+        """Return popped entries to the heap after a failed run"""
+        with self._lock:
+            for entry in entries:
+                heapq.heappush(self.heap, entry)
+
+    def reload(self) -> int:
+        """Rebuild the heap in own session"""
+        db = self.session_factory()
+        try:
+            return self.load(db)
+        finally:
+            db.close()
+
+    def run_due(self) -> int:
+        """Run on_due if any tracked stake matured, returns number of matured entries"""
+        due = self.pop_due(datetime.utcnow())
+        if not due:
+            return 0
+        
+        try:
+            result = self.on_due()
+        except Exception:
+            self.push_back(due)
+            raise
+        if result is None:
+            # Another completion pass is running, try again shortly
+            self.push_back(due)
+            raise RuntimeError("Completion pass already running")
+        return len(due)
+
+    def schedule(self, min_delay: float = 0.0) -> None:
+        """Replace the pending wake-up with one at the next maturity"""
+        if self.job_queue is None:
+            return
+        if self.job is not None:
+            self.job.schedule_removal()
+            self.job = None
+        
+        next_due = self.next_due()
+        self.wake_at = next_due
+        if next_due is None:
+            return
+        delay = max(min_delay, (next_due - datetime.utcnow()).total_seconds())
+        self.job = self.job_queue.run_once(self.wake_job, when=delay)
+
+    def request_schedule(self) -> None:
+        """Reschedule on the event loop, safe to call from any thread"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.schedule)
+
+    def start(self, job_queue, on_due: Callable[[], Optional[dict]]) -> None:
+        """Rebuild the heap and call on_due on the job queue whenever stakes mature"""
+        self.job_queue = job_queue
+        self.on_due = on_due
+        job_queue.run_once(self.start_job, when=0)
+
+    async def start_job(self, context) -> None:
+        """Job queue callback, loads the heap off the event loop"""
+        self.loop = asyncio.get_running_loop()
+        try:
+            count = await self.loop.run_in_executor(None, self.reload)
+            logger.info(f"Tracking {count} active stakes for maturity")
+            self.schedule()
+        except Exception as e:
+            logger.error(f"Error loading stake maturities: {e}")
+            self.job_queue.run_once(self.start_job, when=self.retry_delay)
+
+    async def wake_job(self, context) -> None:
+        """Job queue callback at the next maturity, completes stakes off the event loop"""
+        self.job = None
+        self.wake_at = None
+        try:
+            await self.loop.run_in_executor(None, self.run_due)
+            self.schedule()
+        except Exception as e:
+            logger.error(f"Error completing matured stakes: {e}")
+            self.schedule(min_delay=self.retry_delay)
+
+# Global instance
+maturity_scheduler = MaturityScheduler()
@@ -0,0 +1,129 @@
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import Column, Integer, String, DateTime, inspect, select, insert, text
+from sqlalchemy.schema import CreateColumn
+from database import Base
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the Postgres advisory lock held while migrating
+MIGRATION_LOCK_KEY = 7301
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+    
+    version = Column(Integer, primary_key=True)
+    description = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+def add_column(connection, table: str, column: str) -> None:
+    """Add a model column to an existing table unless it is already there"""
+    if column in {c['name'] for c in inspect(connection).get_columns(table)}:
+        return
+    
+    # Type, server default and NOT NULL as declared on the model
+    model_column = Base.metadata.tables[table].columns[column]
+    column_spec = CreateColumn(model_column).compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column_spec}"))
+
+def create_index(connection, table: str, name: str) -> None:
+    """Create a model index unless it already exists"""
+    index = next(index for index in Base.metadata.tables[table].indexes if index.name == name)
+    index.create(bind=connection, checkfirst=True)
+
+def drop_not_null(connection, table: str, column: str) -> None:
+    """Make a column nullable, SQLite columns are left as created"""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL"))
+
+def create_active_stake_index(connection) -> bool:
+    """Create the one active stake per wallet and asset index, postponed while older duplicates are active"""
+    duplicates = connection.execute(text(
+        "SELECT user_id, wallet_address, asset, count(*) FROM staking_logs WHERE status = 'active' "
+        "GROUP BY user_id, wallet_address, asset HAVING count(*) > 1"
+    )).all()
+    if duplicates:
+        for user_id, wallet_address, asset, count in duplicates:
+            logger.warning(f"User {user_id} has {count} active {asset} stakes on wallet {wallet_address}")
+        logger.warning(
+            f"Postponing uq_staking_logs_active_wallet_asset until {len(duplicates)} duplicate "
+            "active stakes are completed or withdrawn"
+        )
+        return False
+    
+    create_index(connection, 'staking_logs', 'uq_staking_logs_active_wallet_asset')
+    return True
+
+def upgrade_1(connection) -> None:
+    add_column(connection, 'users', 'last_active_at')
+    add_column(connection, 'wallets', 'derivation_index')
+
+def upgrade_2(connection) -> None:
+    for column in ('user_id', 'private_key', 'seed_phrase'):
+        drop_not_null(connection, 'wallets', column)
+
+def upgrade_3(connection) -> None:
+    create_index(connection, 'wallets', 'ix_wallets_reservoir')
+    create_index(connection, 'wallets', 'uq_wallets_user_derivation')
+
+def upgrade_4(connection) -> None:
+    create_index(connection, 'wallets', 'ix_wallets_user_id')
+    create_index(connection, 'staking_logs', 'ix_staking_logs_user_status')
+    create_index(connection, 'staking_logs', 'ix_staking_logs_active_end_date')
+    create_index(connection, 'withdrawal_logs', 'ix_withdrawal_logs_user_timestamp')
+
+def upgrade_5(connection) -> None:
+    add_column(connection, 'staking_logs', 'last_accrued_at')
+    create_index(connection, 'staking_logs', 'ix_staking_logs_active_accrual')
+    create_index(connection, 'staking_logs', 'ix_staking_logs_active_totals')
+
+def upgrade_6(connection) -> None:
+    add_column(connection, 'users', 'active_stakes')
+    connection.execute(text(
+        "UPDATE users SET active_stakes = (SELECT count(*) FROM staking_logs "
+        "WHERE staking_logs.user_id = users.id AND staking_logs.status = 'active')"
+    ))
+    create_active_stake_index(connection)
+
+# (version, description, upgrade), applied in order and recorded in schema_migrations.
+# Upgrades must tolerate a schema that create_all already brought up to date
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'Add users.last_active_at and wallets.derivation_index', upgrade_1),
+    (2, 'Allow reservoir and compact wallets without user or key material', upgrade_2),
+    (3, 'Index reservoir and compact wallets', upgrade_3),
+    (4, 'Index wallets, stakes and withdrawals on hot query paths', upgrade_4),
+    (5, 'Add staking_logs.last_accrued_at and accrual indexes', upgrade_5),
+    (6, 'Count active stakes per user and allow one active stake per wallet and asset', upgrade_6),
+]
+
+def migrate(engine) -> List[int]:
+    """Create missing tables and apply pending migrations, returns applied versions"""
+    applied = []
+    with engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Several bot workers may start at once
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        
+        Base.metadata.create_all(bind=connection)
+        done = set(connection.execute(select(SchemaMigration.version)).scalars())
+        
+        for version, description, upgrade in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info(f"Applying schema migration {version}: {description}")
+            upgrade(connection)
+            connection.execute(insert(SchemaMigration).values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+            applied.append(version)
+        
+        if 6 in done and 'uq_staking_logs_active_wallet_asset' not in {
+            index['name'] for index in inspect(connection).get_indexes('staking_logs')
+        }:
+            # Postponed by upgrade 6, retry once the duplicates are gone
+            create_active_stake_index(connection)
+    
+    return applied
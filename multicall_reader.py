@@ -0,0 +1,85 @@
+from eth_abi import encode, decode
+from web3 import Web3
+from typing import Dict, List, Optional, Tuple
+from config import MULTICALL3_ADDRESS, MULTICALL_CHUNK_SIZE
+
+TRY_BLOCK_AND_AGGREGATE = Web3.keccak(text='tryBlockAndAggregate(bool,(address,bytes)[])')[:4]
+GET_ETH_BALANCE = Web3.keccak(text='getEthBalance(address)')[:4]
+BALANCE_OF = Web3.keccak(text='balanceOf(address)')[:4]
+
+class MulticallReader:
+    def __init__(self, w3: Web3, multicall_address: str = MULTICALL3_ADDRESS, chunk_size: int = MULTICALL_CHUNK_SIZE):
+        self.w3 = w3
+        self.multicall_address = Web3.to_checksum_address(multicall_address)
+        self.chunk_size = chunk_size
+
+    def aggregate(
+        self, 
+        calls: List[Tuple[str, bytes]], 
+        block_identifier: Optional[int] = None
+    ) -> Tuple[int, List[Tuple[bool, bytes]]]:
+        """Run (target, calldata) calls through Multicall3 at one block (block_number, results)"""
+        results = []
+        for start in range(0, len(calls), self.chunk_size):
+            chunk = calls[start:start + self.chunk_size]
+            data = TRY_BLOCK_AND_AGGREGATE + encode(
+                ['bool', '(address,bytes)[]'],
+                [False, chunk]
+            )
+            raw = self.w3.eth.call(
+                {'to': self.multicall_address, 'data': data},
+                block_identifier if block_identifier is not None else 'latest'
+            )
+            block_number, _, chunk_results = decode(
+                ['uint256', 'bytes32', '(bool,bytes)[]'],
+                raw
+            )
+            # Later chunks are pinned to the block of the first one
+            if block_identifier is None:
+                block_identifier = block_number
+            results.extend(chunk_results)
+        return block_identifier, results
+
+    def get_token_balances(
+        self, 
+        token: str, 
+        holders: List[str], 
+        decimals: int = 18, 
+        block_identifier: Optional[int] = None
+    ) -> Tuple[int, Dict[str, Optional[float]]]:
+        """Get ERC-20 balanceOf for many holders in one snapshot, None for failed calls"""
+        token = Web3.to_checksum_address(token)
+        calls = [
+            (token, BALANCE_OF + encode(['address'], [Web3.to_checksum_address(holder)]))
+            for holder in holders
+        ]
+        block_number, results = self.aggregate(calls, block_identifier)
+        return block_number, self._decode_amounts(holders, results, decimals)
+
+    def get_native_balances(
+        self, 
+        holders: List[str], 
+        block_identifier: Optional[int] = None
+    ) -> Tuple[int, Dict[str, Optional[float]]]:
+        """Get native balances for many holders via Multicall3.getEthBalance"""
+        calls = [
+            (self.multicall_address, GET_ETH_BALANCE + encode(['address'], [Web3.to_checksum_address(holder)]))
+            for holder in holders
+        ]
+        block_number, results = self.aggregate(calls, block_identifier)
+        return block_number, self._decode_amounts(holders, results, 18)
+
+    def _decode_amounts(
+        self, 
+        holders: List[str], 
+        results: List[Tuple[bool, bytes]], 
+        decimals: int
+    ) -> Dict[str, Optional[float]]:
+        """Decode uint256 call results into token amounts"""
+        balances = {}
+        for holder, (success, return_data) in zip(holders, results):
+            if not success or len(return_data) < 32:
+                balances[holder] = None
+            else:
+                balances[holder] = decode(['uint256'], return_data)[0] / 10**decimals
+        return balances
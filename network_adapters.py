@@ -0,0 +1,62 @@
+import threading
+from typing import Any, Callable, Dict, List
+from rpc_providers import provider_registry
+from config import EVM_NETWORKS, TRONGRID_API_KEY, SOLANA_RPC_URL
+
+class AdapterRegistry:
+    """Chain clients per network, each SDK is imported when its client is first requested"""
+
+    def __init__(self):
+        self._factories = {}
+        self._adapters = {}
+        self._lock = threading.Lock()
+
+    def register(self, network: str, factory: Callable[[], Any]) -> None:
+        """Register a client factory for network"""
+        with self._lock:
+            self._factories[network] = factory
+            self._adapters.pop(network, None)
+
+    def get(self, network: str) -> Any:
+        """Get the client for network, built on first use"""
+        adapter = self._adapters.get(network)
+        if adapter is not None:
+            return adapter
+        
+        with self._lock:
+            if network not in self._adapters:
+                if network not in self._factories:
+                    raise ValueError(f"Unsupported network: {network}")
+                self._adapters[network] = self._factories[network]()
+            return self._adapters[network]
+
+    def is_loaded(self, network: str) -> bool:
+        """Check if the client for network has been built"""
+        return network in self._adapters
+
+    def get_loaded(self) -> List[str]:
+        """Get networks whose clients have been built"""
+        return sorted(self._adapters)
+
+def create_tron_client():
+    """Create TronGrid client"""
+    from tronpy import Tron
+    from tronpy.providers import HTTPProvider as TronHTTPProvider
+    return Tron(TronHTTPProvider(api_key=TRONGRID_API_KEY))
+
+def create_solana_client():
+    """Create Solana RPC client"""
+    from solana.rpc.api import Client
+    return Client(SOLANA_RPC_URL)
+
+def create_registry() -> AdapterRegistry:
+    """Create registry with the default client for every network"""
+    registry = AdapterRegistry()
+    for network, rpc_network in EVM_NETWORKS.items():
+        registry.register(network, lambda rpc_network=rpc_network: provider_registry.get_web3(rpc_network))
+    registry.register('TRX', create_tron_client)
+    registry.register('SOL', create_solana_client)
+    return registry
+
+# Global instance
+network_adapters = create_registry()
@@ -0,0 +1,365 @@
+import json
+import threading
+import time
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, List, Optional, Union
+from config import (
+    NETWORK_RPC_ENDPOINTS,
+    RPC_POOL_CONNECTIONS,
+    RPC_POOL_MAXSIZE,
+    RPC_REQUEST_TIMEOUT,
+    RPC_BATCH_SIZE,
+    RPC_BATCH_MAX_SIZE,
+    RPC_EWMA_ALPHA,
+    RPC_HEDGE_MIN_DELAY,
+    RPC_HEDGE_MAX_DELAY,
+    RPC_BREAKER_FAILURES,
+    RPC_BREAKER_COOLDOWN,
+    RPC_EXECUTOR_WORKERS
+)
+
+class EndpointHealth:
+    def __init__(self, url: str):
+        self.url = url
+        self.ewma_latency = None
+        self.ewma_error_rate = 0.0
+        self.latencies = deque(maxlen=100)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.requests = 0
+        self.failures = 0
+
+    def record_success(self, latency: float) -> None:
+        """Update latency and error rate after a successful request"""
+        self.requests += 1
+        self.latencies.append(latency)
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += RPC_EWMA_ALPHA * (latency - self.ewma_latency)
+        self.ewma_error_rate *= 1 - RPC_EWMA_ALPHA
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def record_failure(self) -> None:
+        """Update error rate after a failed request, open the breaker if needed"""
+        self.probing = False
+        self.requests += 1
+        self.failures += 1
+        self.ewma_error_rate += RPC_EWMA_ALPHA * (1 - self.ewma_error_rate)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= RPC_BREAKER_FAILURES:
+            self.open_until = time.monotonic() + RPC_BREAKER_COOLDOWN
+
+    def is_available(self) -> bool:
+        """Check the circuit breaker, half-open once the cooldown has passed and no probe is running"""
+        if self.consecutive_failures < RPC_BREAKER_FAILURES:
+            return True
+        return not self.probing and time.monotonic() >= self.open_until
+
+    def acquire(self) -> bool:
+        """Admit a request, a half-open breaker admits a single probe until it succeeds or fails"""
+        if not self.is_available():
+            return False
+        if self.consecutive_failures >= RPC_BREAKER_FAILURES:
+            self.probing = True
+        return True
+
+    def score(self) -> float:
+        """Lower is better, endpoints without samples keep their configured order"""
+        if self.ewma_latency is None:
+            return float('inf')
+        return self.ewma_latency * (1 + 10 * self.ewma_error_rate)
+
+    def hedge_delay(self) -> float:
+        """Delay before a duplicate request, the recent p95 latency"""
+        if not self.latencies:
+            return RPC_HEDGE_MAX_DELAY
+        ordered = sorted(self.latencies)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return min(RPC_HEDGE_MAX_DELAY, max(RPC_HEDGE_MIN_DELAY, p95))
+
+class ProviderRegistry:
+    def __init__(
+        self,
+        rpc_urls: Optional[Dict[str, Union[str, List[str]]]] = None,
+        pool_connections: int = RPC_POOL_CONNECTIONS,
+        pool_maxsize: int = RPC_POOL_MAXSIZE,
+        executor_workers: int = RPC_EXECUTOR_WORKERS
+    ):
+        rpc_urls = NETWORK_RPC_ENDPOINTS if rpc_urls is None else rpc_urls
+        self.endpoints = {
+            network: [urls] if isinstance(urls, str) else list(urls)
+            for network, urls in rpc_urls.items()
+        }
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._web3 = {}
+        self._batch_sizes = {}
+        self._health = {
+            network: [EndpointHealth(url) for url in urls]
+            for network, urls in self.endpoints.items()
+        }
+        self._hedges = {network: 0 for network in self.endpoints}
+        self._executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix='rpc')
+        self._lock = threading.Lock()
+
+    def get_rpc_url(self, network: str) -> str:
+        """Get preferred RPC URL for network"""
+        if network not in self.endpoints or not self.endpoints[network]:
+            raise ValueError(f"Unsupported network: {network}")
+        return self.endpoints[network][0]
+
+    def get_session(self, network: str) -> requests.Session:
+        """Get the long-lived keep-alive HTTP session for network"""
+        self.get_rpc_url(network)
+        with self._lock:
+            if network not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=max(self.pool_connections, len(self.endpoints[network])),
+                    pool_maxsize=self.pool_maxsize
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[network] = session
+            return self._sessions[network]
+
+    def get_web3(self, network: str):
+        """Get the shared Web3 client for network, web3 is imported on first use"""
+        self.get_session(network)
+        with self._lock:
+            if network not in self._web3:
+                from web3 import Web3
+                from web3_provider import PooledHTTPProvider
+                self._web3[network] = Web3(PooledHTTPProvider(self, network))
+            return self._web3[network]
+
+    def get_endpoints(self, network: str) -> List[EndpointHealth]:
+        """Get endpoints to try, best first, endpoints with an open breaker last"""
+        self.get_rpc_url(network)
+        health = self._health[network]
+        with self._lock:
+            ordered = sorted(
+                range(len(health)),
+                key=lambda i: (not health[i].is_available(), health[i].score(), i)
+            )
+        return [health[i] for i in ordered]
+
+    def _send(self, network: str, endpoint: EndpointHealth, payload: Any) -> Any:
+        """POST payload to one endpoint and record its health"""
+        started = time.monotonic()
+        try:
+            response = self.get_session(network).post(
+                endpoint.url,
+                json=payload,
+                timeout=RPC_REQUEST_TIMEOUT
+            )
+            response.raise_for_status()
+            data = response.json()
+        except requests.HTTPError as e:
+            with self._lock:
+                if e.response is not None and e.response.status_code == 413:
+                    # Batch size probing, the endpoint itself is healthy
+                    endpoint.probing = False
+                else:
+                    endpoint.record_failure()
+            raise
+        except (requests.RequestException, ValueError):
+            with self._lock:
+                endpoint.record_failure()
+            raise
+        
+        with self._lock:
+            endpoint.record_success(time.monotonic() - started)
+        return data
+
+    def _submit_next(self, network: str, endpoints: List[EndpointHealth], start: int, payload: Any):
+        """Send payload to the first endpoint from start its breaker admits, (next start, future or None)"""
+        for index in range(start, len(endpoints)):
+            with self._lock:
+                admitted = endpoints[index].acquire()
+            if admitted:
+                return index + 1, self._executor.submit(self._send, network, endpoints[index], payload)
+        return len(endpoints), None
+
+    def post(self, network: str, payload: Any) -> Any:
+        """POST a JSON-RPC payload, hedging to the next endpoint when the first is slow"""
+        endpoints = self.get_endpoints(network)
+        next_index, future = self._submit_next(network, endpoints, 0, payload)
+        if future is None:
+            raise requests.ConnectionError(f"All {network} RPC endpoints have an open circuit breaker")
+        primary = endpoints[next_index - 1]
+        pending = {future}
+        error = None
+        
+        while pending:
+            delay = primary.hedge_delay() if next_index < len(endpoints) else None
+            done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                try:
+                    return future.result()
+                except (requests.RequestException, ValueError) as e:
+                    error = e
+            
+            if next_index < len(endpoints):
+                # Slow primary gets a hedged duplicate, a failed one is failed over
+                next_index, future = self._submit_next(network, endpoints, next_index, payload)
+                if future is not None:
+                    if not done:
+                        with self._lock:
+                            self._hedges[network] += 1
+                    pending.add(future)
+        
+        raise error
+
+    def get_batch_size(self, network: str) -> int:
+        """Get current JSON-RPC batch size for network"""
+        return self._batch_sizes.get(network, RPC_BATCH_SIZE)
+
+    def request(self, network: str, method: str, params: list) -> Any:
+        """Send a single raw JSON-RPC request and return its result"""
+        data = self.post(network, {'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params})
+        if 'error' in data:
+            raise ValueError(f"RPC error from {network}: {data['error']}")
+        return data.get('result')
+
+    def shrink_batch_size(self, network: str, size: int) -> None:
+        """Halve the batch size after the provider rejected a batch"""
+        with self._lock:
+            self._batch_sizes[network] = max(1, size // 2)
+
+    def grow_batch_size(self, network: str, size: int) -> None:
+        """Grow the batch size by a tenth after a full batch went through"""
+        with self._lock:
+            self._batch_sizes[network] = min(RPC_BATCH_MAX_SIZE, size + max(1, size // 10))
+
+    def batch_request(self, network: str, method: str, params_list: List[list]) -> List[Optional[Any]]:
+        """Send one JSON-RPC method for many params in batches, None for failed items"""
+        results = [None] * len(params_list)
+        failed = []
+        transport_down = False
+        position = 0
+        
+        while position < len(params_list):
+            size = self.get_batch_size(network)
+            chunk = range(position, min(position + size, len(params_list)))
+            payload = [
+                {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params_list[i]}
+                for i in chunk
+            ]
+            
+            try:
+                data = self.post(network, payload)
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 413 and size > 1:
+                    # Payload too large, retry the same chunk at half size
+                    self.shrink_batch_size(network, size)
+                    continue
+                data = e
+            except (requests.RequestException, ValueError) as e:
+                data = e
+            
+            if isinstance(data, Exception):
+                # Transport failure, the batch size is not to blame and single retries would fail too
+                print(f"Error sending batch to {network}: {data}")
+                transport_down = True
+                position = chunk.stop
+                continue
+            
+            if not isinstance(data, list):
+                if size > 1:
+                    # Provider limit hit, retry the same chunk at half size
+                    self.shrink_batch_size(network, size)
+                    continue
+                print(f"Batch rejected by {network}: {data}")
+                position = chunk.stop
+                continue
+            
+            responses = {item.get('id'): item for item in data if isinstance(item, dict)}
+            for i in chunk:
+                item = responses.get(i)
+                if item is None or 'result' not in item:
+                    failed.append(i)
+                else:
+                    results[i] = item['result']
+            
+            position = chunk.stop
+            if len(chunk) == size:
+                self.grow_batch_size(network, size)
+        
+        # Items that failed inside a batch are retried one by one while the transport is up
+        for i in failed:
+            if transport_down:
+                break
+            try:
+                item = self.post(
+                    network,
+                    {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params_list[i]}
+                )
+                results[i] = item.get('result')
+            except requests.RequestException as e:
+                print(f"Error sending {method} to {network}: {e}")
+                transport_down = True
+            except ValueError as e:
+                print(f"Error sending {method} to {network}: {e}")
+        
+        return results
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get request, connection, hedge and endpoint health counters per network"""
+        stats = {}
+        with self._lock:
+            sessions = dict(self._sessions)
+        
+        for network, session in sessions.items():
+            adapter = session.get_adapter(self.get_rpc_url(network))
+            requests_made = 0
+            connections_opened = 0
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                requests_made += pool.num_requests
+                connections_opened += pool.num_connections
+            
+            with self._lock:
+                endpoints = [
+                    {
+                        'url': endpoint.url,
+                        'requests': endpoint.requests,
+                        'failures': endpoint.failures,
+                        'ewma_latency': endpoint.ewma_latency,
+                        'ewma_error_rate': endpoint.ewma_error_rate,
+                        'circuit_open': not endpoint.is_available()
+                    }
+                    for endpoint in self._health[network]
+                ]
+                hedges = self._hedges[network]
+            
+            stats[network] = {
+                'requests': requests_made,
+                'connections': connections_opened,
+                'reused': max(0, requests_made - connections_opened),
+                'hedges': hedges,
+                'endpoints': endpoints
+            }
+        return stats
+
+    def close(self) -> None:
+        """Close all pooled sessions"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+            self._web3 = {}
+
+# Global instance
+provider_registry = ProviderRegistry()
@@ -29,6 +29,9 @@ def check_environment():
         'TELEGRAM_TOKEN',
         'DATABASE_URL'
     ]
+    if os.getenv('WALLET_STORAGE_MODE') == 'compact':
+        # Compact wallets keep only the encrypted master seed
+        required_vars.append('SEED_ENCRYPTION_KEY')
     
     missing_vars = []
     for var in required_vars:
@@ -44,21 +47,20 @@ def check_environment():
     return True
 
 def check_dependencies():
-    """Check if all required packages are installed"""
-    try:
-        import telegram
-        import sqlalchemy
-        import web3
-        import tronpy
-        import solana
-        import requests
-        import bip_utils
-        logger.info("All dependencies are installed")
-        return True
-    except ImportError as e:
-        logger.error(f"Missing dependency: {e}")
+    """Check if all required packages are installed, without importing them"""
+    import importlib.util
+    
+    missing = [
+        package for package in ['telegram', 'sqlalchemy', 'web3', 'tronpy', 'solana', 'requests', 'bip_utils']
+        if importlib.util.find_spec(package) is None
+    ]
+    if missing:
+        logger.error(f"Missing dependency: {', '.join(missing)}")
         logger.error("Please run: pip install -r requirements.txt")
         return False
+    
+    logger.info("All dependencies are installed")
+    return True
 
 def check_database():
     """Check database connection"""
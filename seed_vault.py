@@ -0,0 +1,66 @@
+import threading
+from sqlalchemy.exc import IntegrityError
+from database import get_user_seed, create_user_seed
+from wallet_generator import generate_seed_phrase, derive_wallet, normalize_private_key
+from config import SEED_ENCRYPTION_KEY
+
+class SeedVault:
+    """Encrypted per-user master seeds and on-demand key derivation for compact wallets"""
+
+    def __init__(self, key: str = SEED_ENCRYPTION_KEY):
+        self.key = key
+        self._fernet = None
+        self._lock = threading.Lock()
+
+    def get_fernet(self):
+        """Get Fernet cipher for SEED_ENCRYPTION_KEY"""
+        with self._lock:
+            if self._fernet is None:
+                if not self.key:
+                    raise ValueError("SEED_ENCRYPTION_KEY is not set")
+                from cryptography.fernet import Fernet
+                self._fernet = Fernet(self.key)
+            return self._fernet
+
+    def encrypt(self, seed_phrase: str) -> str:
+        """Encrypt a mnemonic"""
+        return self.get_fernet().encrypt(seed_phrase.encode()).decode()
+
+    def decrypt(self, encrypted_seed: str) -> str:
+        """Decrypt a mnemonic"""
+        return self.get_fernet().decrypt(encrypted_seed.encode()).decode()
+
+    def get_master_seed(self, db, user_id: int) -> str:
+        """Get decrypted master seed of a user, None if the user has none"""
+        user_seed = get_user_seed(db, user_id)
+        return self.decrypt(user_seed.encrypted_seed) if user_seed else None
+
+    def get_or_create_master_seed(self, db, user_id: int) -> str:
+        """Get decrypted master seed of a user, created on first use"""
+        seed_phrase = self.get_master_seed(db, user_id)
+        if seed_phrase is not None:
+            return seed_phrase
+        
+        try:
+            create_user_seed(db, user_id, self.encrypt(generate_seed_phrase()))
+        except IntegrityError:
+            # Another worker created it first
+            db.rollback()
+        return self.get_master_seed(db, user_id)
+
+    def get_private_key(self, db, wallet) -> str:
+        """Get private key of a wallet, re-derived from the master seed for compact wallets"""
+        if wallet.private_key:
+            return normalize_private_key(wallet.network, wallet.private_key)
+        
+        seed_phrase = self.get_master_seed(db, wallet.user_id)
+        if seed_phrase is None or wallet.derivation_index is None:
+            raise ValueError(f"No key material for wallet {wallet.address}")
+        
+        # Account contexts are kept in the wallet_generator LRU, so signing
+        # several wallets of one user runs PBKDF2 once
+        _, private_key = derive_wallet(seed_phrase, wallet.network, wallet.derivation_index)
+        return private_key
+
+# Global instance
+seed_vault = SeedVault()
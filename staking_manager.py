@@ -1,17 +1,51 @@
+import asyncio
+import logging
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
-from database import StakingLog, get_active_stakes, create_stake
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from collections import Counter
+from database import (
+    SessionLocal, StakingLog, get_active_stakes, create_stake, reserve_stake_slot,
+    release_stake_slots, get_active_stake_count, has_active_stake
+)
+from reward_engine import reward_engine
+from maturity_scheduler import maturity_scheduler
+from sqlalchemy import Integer, DateTime, case, cast, func, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from config import (
     STAKING_PERIODS, 
     MIN_STAKING_AMOUNTS, 
     MAX_ACTIVE_STAKES, 
-    EARLY_WITHDRAWAL_PENALTY
+    EARLY_WITHDRAWAL_PENALTY,
+    STAKING_COMPLETION_CHUNK_SIZE,
+    STAKING_ACCRUAL_CHUNK_SIZE
 )
 
+logger = logging.getLogger(__name__)
+
 class StakingManager:
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        completion_chunk_size: int = STAKING_COMPLETION_CHUNK_SIZE,
+        scheduler=maturity_scheduler,
+        accrual_chunk_size: int = STAKING_ACCRUAL_CHUNK_SIZE
+    ):
+        self.session_factory = session_factory
+        self.scheduler = scheduler
+        self.completion_chunk_size = completion_chunk_size
+        self.accrual_chunk_size = accrual_chunk_size
+        self._accrual_lock = threading.Lock()
+        self.completion_consumers = []
+        self._completion_lock = threading.Lock()
+        self.completion_stats = {
+            'runs': 0,
+            'completed': 0,
+            'seconds': 0.0,
+            'rows_per_sec': 0.0
+        }
 
     def calculate_reward(self, amount: float, rate: float, days: int) -> float:
         """Calculate staking reward"""
@@ -52,14 +86,12 @@ class StakingManager:
             return False, f"Minimum staking amount for {asset}: {min_amount}"
         
         # Check maximum active stakes
-        active_stakes = get_active_stakes(db, user_id)
-        if len(active_stakes) >= MAX_ACTIVE_STAKES:
+        if get_active_stake_count(db, user_id) >= MAX_ACTIVE_STAKES:
             return False, f"Maximum {MAX_ACTIVE_STAKES} active stakes allowed"
         
         # Check if wallet already has active stake
-        for stake in active_stakes:
-            if stake.wallet_address == wallet_address and stake.asset == asset:
-                return False, f"Wallet {wallet_address} already has active {asset} stake"
+        if has_active_stake(db, user_id, wallet_address, asset):
+            return False, f"Wallet {wallet_address} already has active {asset} stake"
         
         return True, "Valid"
 
@@ -79,16 +111,26 @@ class StakingManager:
         start_date = datetime.utcnow()
         end_date = start_date + timedelta(days=period_info['days'])
         
-        # Create stake
-        stake = create_stake(
-            db=db,
-            user_id=user_id,
-            wallet_address=wallet_address,
-            amount=amount,
-            asset=asset,
-            rate=period_info['rate'],
-            end_date=end_date
-        )
+        # Count the stake and insert it in one transaction, the user row lock and
+        # the active wallet/asset unique index turn away concurrent duplicates
+        if not reserve_stake_slot(db, user_id, MAX_ACTIVE_STAKES):
+            db.rollback()
+            raise ValueError(f"Maximum {MAX_ACTIVE_STAKES} active stakes allowed")
+        
+        try:
+            stake = create_stake(
+                db=db,
+                user_id=user_id,
+                wallet_address=wallet_address,
+                amount=amount,
+                asset=asset,
+                rate=period_info['rate'],
+                end_date=end_date
+            )
+        except IntegrityError:
+            db.rollback()
+            raise ValueError(f"Wallet {wallet_address} already has active {asset} stake")
+        self.scheduler.add(stake.id, stake.end_date)
         
         return stake
 
@@ -111,56 +153,196 @@ class StakingManager:
         reward = self.calculate_reward(stake.amount, stake.rate, days_passed)
         return reward
 
-    def get_stake_summary(self, stake: StakingLog) -> Dict:
+    def get_stake_summaries(self, stakes: List[StakingLog], as_of: Optional[datetime] = None) -> List[Dict]:
+        """Get summary information for stakes, computed in one pass at as_of"""
+        as_of = as_of or datetime.utcnow()
+        results = {
+            name: values.tolist()
+            for name, values in reward_engine.compute_stakes(stakes, as_of).items()
+        }
+        
+        return [
+            {
+                'id': stake.id,
+                'wallet_address': stake.wallet_address,
+                'asset': stake.asset,
+                'amount': stake.amount,
+                'rate': stake.rate,
+                'start_date': stake.start_date,
+                'end_date': stake.end_date,
+                'current_reward': results['current_reward'][i],
+                'penalty_amount': results['penalty_amount'][i],
+                'days_remaining': results['days_remaining'][i],
+                'status': stake.status
+            }
+            for i, stake in enumerate(stakes)
+        ]
+
+    def get_stake_summary(self, stake: StakingLog, as_of: Optional[datetime] = None) -> Dict:
         """Get summary information for stake"""
-        current_reward = self.calculate_current_reward(stake)
-        penalty_amount = current_reward * EARLY_WITHDRAWAL_PENALTY
-        days_remaining = (stake.end_date - datetime.utcnow()).days
+        return self.get_stake_summaries([stake], as_of)[0]
+
+    def get_rewards_snapshot(self, db: Session, as_of: Optional[datetime] = None, user_id: Optional[int] = None) -> Dict:
+        """Columns of active stakes with their rewards, penalties and days remaining at as_of"""
+        as_of = as_of or datetime.utcnow()
+        query = db.query(
+            StakingLog.id, StakingLog.user_id, StakingLog.asset, StakingLog.amount,
+            StakingLog.rate, StakingLog.start_date, StakingLog.end_date
+        ).filter(StakingLog.status == 'active')
+        if user_id is not None:
+            query = query.filter(StakingLog.user_id == user_id)
         
-        return {
-            'id': stake.id,
-            'wallet_address': stake.wallet_address,
-            'asset': stake.asset,
-            'amount': stake.amount,
-            'rate': stake.rate,
-            'start_date': stake.start_date,
-            'end_date': stake.end_date,
-            'current_reward': current_reward,
-            'penalty_amount': penalty_amount,
-            'days_remaining': max(0, days_remaining),
-            'status': stake.status
-        }
+        rows = query.all()
+        columns = reward_engine.to_columns(rows)
+        columns.update(reward_engine.compute(as_of=as_of, **columns))
+        columns['id'] = [row.id for row in rows]
+        columns['user_id'] = [row.user_id for row in rows]
+        columns['asset'] = [row.asset for row in rows]
+        columns['as_of'] = as_of
+        return columns
 
-    def process_completed_stakes(self, db: Session) -> List[StakingLog]:
-        """Process completed stakes and return them"""
-        completed_stakes = []
-        active_stakes = db.query(StakingLog).filter(
-            StakingLog.status == 'active'
+    def complete_matured_chunk(self, db: Session, as_of: datetime, chunk_size: int) -> List:
+        """Complete up to chunk_size matured stakes in one UPDATE ... RETURNING"""
+        matured = select(StakingLog.id).where(
+            StakingLog.status == 'active',
+            StakingLog.end_date <= as_of
+        ).order_by(StakingLog.end_date).limit(chunk_size).with_for_update(skip_locked=True)
+        
+        completed = db.execute(
+            update(StakingLog).where(
+                StakingLog.id.in_(matured.scalar_subquery()),
+                StakingLog.status == 'active'
+            ).values(
+                status='completed',
+                accrued_reward=self.final_reward_sql(db)
+            ).returning(
+                StakingLog.id, StakingLog.user_id, StakingLog.wallet_address,
+                StakingLog.asset, StakingLog.amount, StakingLog.accrued_reward
+            ).execution_options(synchronize_session=False)
         ).all()
+        release_stake_slots(db, Counter(row.user_id for row in completed))
+        db.commit()
+        return completed
+
+    def iter_completed_stakes(self, db: Session, as_of: Optional[datetime] = None, chunk_size: Optional[int] = None) -> Iterator[List]:
+        """Complete stakes matured by as_of chunk by chunk, yield each committed chunk"""
+        as_of = as_of or datetime.utcnow()
+        chunk_size = chunk_size or self.completion_chunk_size
+        while True:
+            completed = self.complete_matured_chunk(db, as_of, chunk_size)
+            if completed:
+                yield completed
+            if len(completed) < chunk_size:
+                return
+
+    def add_completion_consumer(self, consumer: Callable[[List], None]) -> None:
+        """Register a callback receiving each chunk of completed stakes"""
+        self.completion_consumers.append(consumer)
+
+    def process_completed_stakes(self, db: Session, as_of: Optional[datetime] = None, chunk_size: Optional[int] = None) -> Dict:
+        """Complete matured stakes, pass them to consumers and return run stats"""
+        started = time.monotonic()
+        completed = 0
+        for chunk in self.iter_completed_stakes(db, as_of, chunk_size):
+            completed += len(chunk)
+            for consumer in self.completion_consumers:
+                try:
+                    consumer(chunk)
+                except Exception as e:
+                    logger.error(f"Error in completed stakes consumer: {e}")
         
-        for stake in active_stakes:
-            if datetime.utcnow() >= stake.end_date:
-                # Calculate final reward
-                final_reward = self.calculate_reward(
-                    stake.amount, 
-                    stake.rate, 
-                    (stake.end_date - stake.start_date).days
-                )
-                
-                # Update stake
-                stake.status = 'completed'
-                stake.accrued_reward = final_reward
-                completed_stakes.append(stake)
+        elapsed = time.monotonic() - started
+        rows_per_sec = completed / elapsed if elapsed > 0 else 0.0
+        self.completion_stats['runs'] += 1
+        self.completion_stats['completed'] += completed
+        self.completion_stats['seconds'] += elapsed
+        if self.completion_stats['seconds'] > 0:
+            self.completion_stats['rows_per_sec'] = self.completion_stats['completed'] / self.completion_stats['seconds']
+        if completed:
+            logger.info(f"Completed {completed} matured stakes in {elapsed:.2f}s ({rows_per_sec:.0f} rows/s)")
+        return {'completed': completed, 'seconds': elapsed, 'rows_per_sec': rows_per_sec}
+
+    def run_completion(self) -> Optional[Dict]:
+        """Complete matured stakes in own session, None if a run is already going"""
+        if not self._completion_lock.acquire(blocking=False):
+            return None
         
-        db.commit()
-        return completed_stakes
+        db = self.session_factory()
+        try:
+            return self.process_completed_stakes(db)
+        finally:
+            db.close()
+            self._completion_lock.release()
+
+    def accrue_chunk(self, db: Session, as_of: datetime, after_id: int, chunk_size: int) -> List[int]:
+        """Bring accrued_reward of the next chunk of active stakes behind as_of up to date"""
+        pending = select(StakingLog.id).where(
+            StakingLog.status == 'active',
+            StakingLog.id > after_id,
+            or_(StakingLog.last_accrued_at.is_(None), StakingLog.last_accrued_at < as_of)
+        ).order_by(StakingLog.id).limit(chunk_size)
+        
+        stake_ids = db.execute(pending).scalars().all()
+        if stake_ids:
+            # Absolute reward at as_of, so re-running a chunk writes the same values
+            db.execute(
+                update(StakingLog).where(
+                    StakingLog.id.in_(stake_ids),
+                    StakingLog.status == 'active'
+                ).values(
+                    accrued_reward=self.current_reward_sql(db, as_of),
+                    last_accrued_at=as_of
+                ).execution_options(synchronize_session=False)
+            )
+            db.commit()
+        return stake_ids
+
+    def accrue_rewards(self, db: Session, as_of: Optional[datetime] = None, chunk_size: Optional[int] = None) -> Dict:
+        """Advance accrued_reward and last_accrued_at of active stakes to as_of, UTC midnight by default"""
+        as_of = as_of or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        chunk_size = chunk_size or self.accrual_chunk_size
+        started = time.monotonic()
+        accrued = 0
+        after_id = 0
+        while True:
+            stake_ids = self.accrue_chunk(db, as_of, after_id, chunk_size)
+            accrued += len(stake_ids)
+            if len(stake_ids) < chunk_size:
+                break
+            after_id = stake_ids[-1]
+        
+        elapsed = time.monotonic() - started
+        rows_per_sec = accrued / elapsed if elapsed > 0 else 0.0
+        if accrued:
+            logger.info(f"Accrued rewards of {accrued} stakes to {as_of} in {elapsed:.2f}s ({rows_per_sec:.0f} rows/s)")
+        return {'accrued': accrued, 'as_of': as_of, 'seconds': elapsed, 'rows_per_sec': rows_per_sec}
+
+    def run_accrual(self) -> Optional[Dict]:
+        """Accrue rewards in own session, None if a run is already going"""
+        if not self._accrual_lock.acquire(blocking=False):
+            return None
+        
+        db = self.session_factory()
+        try:
+            return self.accrue_rewards(db)
+        finally:
+            db.close()
+            self._accrual_lock.release()
+
+    async def accrual_job(self, context) -> None:
+        """Job queue callback, accrues rewards off the event loop"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.run_accrual)
+        except Exception as e:
+            logger.error(f"Error accruing staking rewards: {e}")
 
     def early_withdraw_stake(self, db: Session, stake_id: int) -> Tuple[bool, str, float]:
         """Process early withdrawal of stake"""
         stake = db.query(StakingLog).filter(
             StakingLog.id == stake_id,
             StakingLog.status == 'active'
-        ).first()
+        ).with_for_update().first()
         
         if not stake:
             return False, "Stake not found or not active", 0.0
@@ -173,24 +355,72 @@ class StakingManager:
         # Update stake
         stake.status = 'early_withdrawn'
         stake.accrued_reward = final_reward
+        release_stake_slots(db, {stake.user_id: 1})
         
         db.commit()
+        self.scheduler.cancel(stake.id)
         
         return True, "Early withdrawal successful", final_reward
 
-    def get_staking_stats(self, db: Session, user_id: int) -> Dict:
-        """Get staking statistics for user"""
-        active_stakes = get_active_stakes(db, user_id)
-        
-        total_staked = sum(stake.amount for stake in active_stakes)
-        total_reward = sum(self.calculate_current_reward(stake) for stake in active_stakes)
-        
+    def days_between_sql(self, db: Session, start, end):
+        """SQL expression for whole days from start to end, like timedelta.days"""
+        if db.bind.dialect.name == 'postgresql':
+            return func.floor(func.extract('epoch', end - start) / 86400)
+        return cast(func.julianday(end) - func.julianday(start), Integer)
+
+    def current_reward_sql(self, db: Session, as_of: datetime):
+        """SQL expression for calculate_current_reward of an active stake"""
+        days_passed = self.days_between_sql(db, StakingLog.start_date, literal(as_of, DateTime))
+        return case(
+            (days_passed > 0, StakingLog.amount * (StakingLog.rate / 100) * (days_passed / 365.0)),
+            else_=0.0
+        )
+
+    def final_reward_sql(self, db: Session):
+        """SQL expression for the full-term reward of a stake"""
+        days = self.days_between_sql(db, StakingLog.start_date, StakingLog.end_date)
+        return StakingLog.amount * (StakingLog.rate / 100) * (days / 365.0)
+
+    def aggregate_active_stakes(self, db: Session, user_id: Optional[int] = None, as_of: Optional[datetime] = None) -> Dict:
+        """Count, staked amount and current reward of active stakes per asset in one query"""
+        as_of = as_of or datetime.utcnow()
+        query = db.query(
+            StakingLog.asset,
+            func.count(StakingLog.id),
+            func.coalesce(func.sum(StakingLog.amount), 0.0),
+            func.coalesce(func.sum(self.current_reward_sql(db, as_of)), 0.0)
+        ).filter(StakingLog.status == 'active')
+        if user_id is not None:
+            query = query.filter(StakingLog.user_id == user_id)
+        return self.sum_asset_totals(query.group_by(StakingLog.asset))
+
+    def sum_asset_totals(self, rows) -> Dict:
+        """Build stats from (asset, stakes, staked, reward) rows"""
+        assets = {
+            asset: {'stakes': count, 'staked': float(staked), 'reward': float(reward)}
+            for asset, count, staked, reward in rows
+        }
         return {
-            'total_stakes': len(active_stakes),
-            'total_staked': total_staked,
-            'total_reward': total_reward,
-            'max_stakes': MAX_ACTIVE_STAKES
+            'total_stakes': sum(totals['stakes'] for totals in assets.values()),
+            'total_staked': sum(totals['staked'] for totals in assets.values()),
+            'total_reward': sum(totals['reward'] for totals in assets.values()),
+            'assets': assets
         }
 
+    def get_staking_stats(self, db: Session, user_id: int) -> Dict:
+        """Get staking statistics for user"""
+        stats = self.aggregate_active_stakes(db, user_id)
+        stats['max_stakes'] = MAX_ACTIVE_STAKES
+        return stats
+
+    def get_global_staking_stats(self, db: Session) -> Dict:
+        """Get staking statistics across all users, rewards as of the last accrual"""
+        return self.sum_asset_totals(db.query(
+            StakingLog.asset,
+            func.count(),
+            func.coalesce(func.sum(StakingLog.amount), 0.0),
+            func.coalesce(func.sum(StakingLog.accrued_reward), 0.0)
+        ).filter(StakingLog.status == 'active').group_by(StakingLog.asset))
+
 # Global instance
 staking_manager = StakingManager()
\ No newline at end of file
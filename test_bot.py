@@ -15,6 +15,41 @@ from wallet_generator import generate_wallet, generate_multiple_wallets
 from utils import validate_address, validate_amount, escape_markdown
 from config import SUPPORTED_NETWORKS, STAKING_PERIODS
 
+def start_rpc_server(handle_request, max_batch_size=None, delay=0, status=200, oversize_status=200):
+    """Start a local JSON-RPC stand-in server, returns (server, url)"""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def do_POST(self):
+            import time
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            time.sleep(delay)
+            response_status = status
+            if isinstance(payload, list) and max_batch_size and len(payload) > max_batch_size:
+                result = {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'batch too large'}}
+                response_status = oversize_status
+            elif isinstance(payload, list):
+                result = [handle_request(item) for item in payload]
+            else:
+                result = handle_request(payload)
+            body = json.dumps(result).encode()
+            self.send_response(response_status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
 class TestWalletGenerator(unittest.TestCase):
     """Test wallet generation functionality"""
     
@@ -58,6 +93,63 @@ class TestWalletGenerator(unittest.TestCase):
         with self.assertRaises(ValueError):
             generate_wallet('UNSUPPORTED')
 
+    def test_derive_wallets_from_one_seed(self):
+        """Test batch wallets share a seed and differ by derivation index"""
+        from wallet_generator import derive_wallet, derive_wallets
+        
+        wallets = derive_wallets('TRX', 3)
+        
+        self.assertEqual([w['derivation_index'] for w in wallets], [0, 1, 2])
+        self.assertEqual(len({w['seed_phrase'] for w in wallets}), 1)
+        self.assertEqual(len({w['address'] for w in wallets}), 3)
+        for wallet in wallets:
+            self.assertTrue(wallet['address'].startswith('T'))
+        
+        # Keys can be re-derived from seed and index
+        address, private_key = derive_wallet(wallets[0]['seed_phrase'], 'TRX', 2)
+        self.assertEqual(address, wallets[2]['address'])
+        self.assertEqual(private_key, wallets[2]['private_key'])
+
+    def test_generate_multiple_wallets_separate_seeds(self):
+        """Test multiple wallet generation with a seed per wallet"""
+        wallets = generate_multiple_wallets('ETH', 2, shared_seed=False)
+        
+        self.assertEqual(len({w['seed_phrase'] for w in wallets}), 2)
+
+class TestWalletGenerationService(unittest.TestCase):
+    """Test process pool wallet generation"""
+    
+    def test_split(self):
+        """Test batches are split into contiguous index ranges"""
+        from wallet_service import WalletGenerationService
+        
+        service = WalletGenerationService(max_workers=4, chunk_size=10)
+        
+        self.assertEqual(service.split(5), [(0, 5)])
+        self.assertEqual(service.split(99), [(0, 25), (25, 25), (50, 25), (75, 24)])
+        self.assertEqual(service.split(30, start_index=100), [(100, 10), (110, 10), (120, 10)])
+
+    def test_generate(self):
+        """Test generated wallets match serial derivation from the same seed"""
+        import asyncio
+        from wallet_generator import derive_wallets
+        from wallet_service import WalletGenerationService
+        
+        service = WalletGenerationService(max_workers=2, chunk_size=2)
+        try:
+            wallets = asyncio.run(service.generate('ETH', 5))
+            addresses = list(service.generate_addresses('ETH', 5, wallets[0]['seed_phrase'], task_size=2))
+            independent = asyncio.run(service.generate_independent('ETH', 5))
+        finally:
+            service.shutdown()
+        
+        self.assertEqual(len({w['seed_phrase'] for w in independent}), 5)
+        self.assertEqual(len({w['address'] for w in independent}), 5)
+        
+        expected = derive_wallets('ETH', 5, seed_phrase=wallets[0]['seed_phrase'])
+        self.assertEqual(wallets, expected)
+        self.assertEqual(addresses, [(w['derivation_index'], w['address']) for w in expected])
+
 class TestUtils(unittest.TestCase):
     """Test utility functions"""
     
@@ -72,6 +164,37 @@ class TestUtils(unittest.TestCase):
         self.assertFalse(validate_address('0x123', 'ETH'))
         self.assertFalse(validate_address('TJRabPrwbZy45sbavfcjinPJC18kjpRTv8', 'ETH'))
 
+    def test_address_checksums(self):
+        """Test optional EIP-55 and Base58Check verification"""
+        self.assertTrue(validate_address('0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed', 'ETH', checksum=True))
+        self.assertTrue(validate_address('0x5aaeb6053f3e94c9b9a09f33669435e7ef1beaed', 'ETH', checksum=True))
+        self.assertFalse(validate_address('0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAeD', 'ETH', checksum=True))
+        self.assertTrue(validate_address('TJRabPrwbZy45sbavfcjinPJC18kjpRTv8', 'TRX', checksum=True))
+        self.assertFalse(validate_address('TJRabPrwbZy45sbavfcjinPJC18kjpRTv9', 'TRX', checksum=True))
+        self.assertTrue(validate_address('TJRabPrwbZy45sbavfcjinPJC18kjpRTv9', 'TRX'))
+
+    def test_batch_address_validation(self):
+        """Test validating and classifying many addresses in one call"""
+        from utils import validate_addresses, classify_addresses
+        from wallet_generator import derive_wallets
+        
+        doge = derive_wallets('DOGE', 1)[0]['address']
+        xrp = derive_wallets('XRP', 1)[0]['address']
+        sol = derive_wallets('SOL', 1)[0]['address']
+        
+        self.assertEqual(
+            validate_addresses(['0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed', '0x123', None], 'POL'),
+            [True, False, False]
+        )
+        self.assertEqual(validate_addresses(['x'], 'UNSUPPORTED'), [False])
+        self.assertEqual(
+            classify_addresses(
+                ['0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed', 'TJRabPrwbZy45sbavfcjinPJC18kjpRTv8', doge, xrp, sol, 'invalid'],
+                checksum=True
+            ),
+            ['ETH', 'TRX', 'DOGE', 'XRP', 'SOL', None]
+        )
+
     def test_validate_amount(self):
         """Test amount validation"""
         # Valid amounts
@@ -179,6 +302,1513 @@ class TestStakingManager(unittest.TestCase):
         with self.assertRaises(ValueError):
             manager.get_staking_period_info('invalid_period')
 
+    def test_staking_stats_aggregate(self):
+        """Test SQL staking stats match per-stake rewards"""
+        from datetime import datetime, timedelta
+        from database import StakingLog
+        from staking_manager import StakingManager
+        
+        manager = StakingManager()
+        db = create_test_session_factory()()
+        now = datetime.utcnow()
+        stakes = [
+            StakingLog(user_id=1, wallet_address='a', amount=100, asset='USDT', rate=20,
+                       start_date=now - timedelta(days=100, hours=5), end_date=now + timedelta(days=265)),
+            StakingLog(user_id=1, wallet_address='b', amount=2, asset='ETH', rate=16,
+                       start_date=now - timedelta(days=10), end_date=now + timedelta(days=20)),
+            StakingLog(user_id=1, wallet_address='c', amount=50, asset='USDT', rate=18,
+                       start_date=now - timedelta(hours=3), end_date=now + timedelta(days=90)),
+            StakingLog(user_id=2, wallet_address='d', amount=70, asset='USDT', rate=20,
+                       start_date=now - timedelta(days=40), end_date=now + timedelta(days=325)),
+            StakingLog(user_id=1, wallet_address='e', amount=999, asset='USDT', rate=20,
+                       start_date=now - timedelta(days=40), end_date=now, status='completed')
+        ]
+        db.add_all(stakes)
+        db.commit()
+        
+        with patch('staking_manager.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = now
+            stats = manager.get_staking_stats(db, 1)
+            expected_reward = sum(manager.calculate_current_reward(stake) for stake in stakes[:3])
+        
+        self.assertEqual(stats['total_stakes'], 3)
+        self.assertEqual(stats['total_staked'], 152)
+        self.assertAlmostEqual(stats['total_reward'], expected_reward, places=9)
+        self.assertEqual(stats['assets']['USDT']['stakes'], 2)
+        self.assertAlmostEqual(stats['assets']['ETH']['reward'], 2 * 0.16 * 10 / 365, places=9)
+        
+        global_stats = manager.get_global_staking_stats(db)
+        self.assertEqual(global_stats['total_stakes'], 4)
+        self.assertEqual(global_stats['assets']['USDT']['staked'], 220)
+        db.close()
+
+    def test_process_completed_stakes(self):
+        """Test matured stakes are completed in chunks and streamed to consumers"""
+        from datetime import datetime, timedelta
+        from database import StakingLog
+        from staking_manager import StakingManager
+        
+        session_factory = create_test_session_factory()
+        manager = StakingManager(session_factory=session_factory, completion_chunk_size=2)
+        chunks = []
+        manager.add_completion_consumer(chunks.append)
+        
+        db = session_factory()
+        now = datetime.utcnow()
+        for i in range(5):
+            db.add(StakingLog(user_id=i, wallet_address='a', amount=100, asset='USDT', rate=20,
+                              start_date=now - timedelta(days=365 + i), end_date=now - timedelta(days=i)))
+        db.add(StakingLog(user_id=9, wallet_address='b', amount=100, asset='USDT', rate=20,
+                          start_date=now - timedelta(days=10), end_date=now + timedelta(days=20)))
+        db.commit()
+        db.close()
+        
+        result = manager.run_completion()
+        
+        self.assertEqual(result['completed'], 5)
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual([{row.user_id for row in chunk} for chunk in chunks], [{3, 4}, {1, 2}, {0}])
+        self.assertTrue(all(abs(row.accrued_reward - 20.0) < 1e-9 for chunk in chunks for row in chunk))
+        
+        db = session_factory()
+        statuses = dict(db.query(StakingLog.user_id, StakingLog.status).all())
+        self.assertEqual(statuses[9], 'active')
+        self.assertEqual(set(statuses[i] for i in range(5)), {'completed'})
+        db.close()
+        self.assertEqual(manager.run_completion()['completed'], 0)
+        self.assertEqual(manager.completion_stats['completed'], 5)
+
+    def test_accrue_rewards(self):
+        """Test accrual is chunked, idempotent and feeds the materialized global stats"""
+        from datetime import datetime, timedelta
+        from database import StakingLog
+        from staking_manager import StakingManager
+        
+        session_factory = create_test_session_factory()
+        manager = StakingManager(session_factory=session_factory, accrual_chunk_size=2)
+        as_of = datetime(2024, 6, 1)
+        db = session_factory()
+        for days, status in [(73, 'active'), (146, 'active'), (0, 'active'), (10, 'completed'), (365, 'active')]:
+            db.add(StakingLog(user_id=1, wallet_address=f"w{days}", amount=100, asset='USDT', rate=20, status=status,
+                              start_date=as_of - timedelta(days=days), end_date=as_of + timedelta(days=30)))
+        db.commit()
+        
+        result = manager.accrue_rewards(db, as_of=as_of)
+        self.assertEqual(result['accrued'], 4)
+        rewards = [(stake.accrued_reward, stake.last_accrued_at) for stake in db.query(StakingLog).order_by(StakingLog.id)]
+        self.assertAlmostEqual(rewards[0][0], 4.0, places=9)
+        self.assertAlmostEqual(rewards[1][0], 8.0, places=9)
+        self.assertEqual(rewards[2][0], 0.0)
+        self.assertIsNone(rewards[3][1])
+        self.assertEqual(rewards[4][1], as_of)
+        
+        self.assertEqual(manager.accrue_rewards(db, as_of=as_of)['accrued'], 0)
+        self.assertEqual(manager.accrue_rewards(db, as_of=as_of + timedelta(days=1))['accrued'], 4)
+        
+        stats = manager.get_global_staking_stats(db)
+        self.assertEqual(stats['total_stakes'], 4)
+        self.assertAlmostEqual(stats['total_reward'], 100 * 0.2 * (74 + 147 + 1 + 366) / 365, places=9)
+        db.close()
+
+    def test_staking_admission(self):
+        """Test admission keeps the active stake counter and rejects duplicates and overflow"""
+        from datetime import timedelta
+        from database import create_user, get_active_stake_count
+        from maturity_scheduler import MaturityScheduler
+        from staking_manager import StakingManager
+        
+        session_factory = create_test_session_factory()
+        manager = StakingManager(session_factory=session_factory, scheduler=MaturityScheduler(session_factory))
+        db = session_factory()
+        user = create_user(db, 777)
+        
+        first = manager.create_staking(db, user.id, 'a', 10, 'USDT', '1_month')
+        manager.create_staking(db, user.id, 'a', 1, 'ETH', '3_months')
+        self.assertEqual(get_active_stake_count(db, user.id), 2)
+        self.assertEqual(
+            manager.validate_staking_request(db, user.id, 10, 'USDT', 'a'),
+            (False, "Wallet a already has active USDT stake")
+        )
+        with self.assertRaises(ValueError):
+            manager.create_staking(db, user.id, 'a', 10, 'USDT', '6_months')
+        self.assertEqual(get_active_stake_count(db, user.id), 2)
+        
+        with patch('staking_manager.MAX_ACTIVE_STAKES', 2):
+            self.assertFalse(manager.validate_staking_request(db, user.id, 10, 'USDT', 'b')[0])
+            with self.assertRaises(ValueError):
+                manager.create_staking(db, user.id, 'b', 10, 'USDT', '1_month')
+        
+        self.assertTrue(manager.early_withdraw_stake(db, first.id)[0])
+        self.assertEqual(get_active_stake_count(db, user.id), 1)
+        manager.create_staking(db, user.id, 'a', 10, 'USDT', '1_month')
+        
+        manager.process_completed_stakes(db, as_of=first.end_date + timedelta(days=200))
+        self.assertEqual(get_active_stake_count(db, user.id), 0)
+        db.close()
+    
+    def test_staking_admission_double_tap(self):
+        """Test concurrent identical requests admit exactly one stake"""
+        import os
+        import tempfile
+        import threading
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from database import Base, StakingLog, create_user, get_active_stake_count
+        from maturity_scheduler import MaturityScheduler
+        from staking_manager import StakingManager
+        
+        engine = create_engine(
+            f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stakes.db')}",
+            connect_args={'check_same_thread': False, 'timeout': 30}
+        )
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        manager = StakingManager(session_factory=session_factory, scheduler=MaturityScheduler(session_factory))
+        db = session_factory()
+        user = create_user(db, 888)
+        db.close()
+        
+        results = []
+        def tap():
+            tap_db = session_factory()
+            try:
+                manager.create_staking(tap_db, user.id, 'a', 10, 'USDT', '1_month')
+                results.append(True)
+            except ValueError:
+                results.append(False)
+            finally:
+                tap_db.close()
+        
+        threads = [threading.Thread(target=tap) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        db = session_factory()
+        self.assertEqual(sorted(results), [False] * 4 + [True])
+        self.assertEqual(db.query(StakingLog).count(), 1)
+        self.assertEqual(get_active_stake_count(db, user.id), 1)
+        db.close()
+        engine.dispose()
+
+class TestRewardEngine(unittest.TestCase):
+    """Test vectorized staking reward calculations"""
+    
+    def test_matches_per_stake_calculation(self):
+        """Test engine results match per-stake rewards at the same as-of time"""
+        from datetime import datetime, timedelta
+        from types import SimpleNamespace
+        from reward_engine import RewardEngine
+        from staking_manager import StakingManager
+        
+        manager = StakingManager()
+        now = datetime(2024, 6, 1, 12, 0, 0)
+        stakes = [
+            SimpleNamespace(amount=100.0, rate=20.0, start_date=now - timedelta(days=days, hours=hours),
+                            end_date=now - timedelta(days=days, hours=hours) + timedelta(days=term), status=status)
+            for days, hours, term, status in [
+                (100, 5, 180, 'active'), (0, 3, 30, 'active'), (-2, 0, 30, 'active'),
+                (400, 0, 365, 'active'), (10, 0, 90, 'completed')
+            ]
+        ]
+        
+        results = RewardEngine(penalty=0.5).compute_stakes(stakes, now)
+        
+        with patch('staking_manager.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = now
+            expected = [manager.calculate_current_reward(stake) for stake in stakes]
+        for i, stake in enumerate(stakes):
+            self.assertAlmostEqual(results['current_reward'][i], expected[i], places=9)
+            self.assertAlmostEqual(results['penalty_amount'][i], expected[i] * 0.5, places=9)
+            self.assertEqual(results['days_remaining'][i], max(0, (stake.end_date - now).days))
+    
+    def test_stake_summaries(self):
+        """Test summaries of stakes share one as-of time"""
+        from datetime import datetime, timedelta
+        from database import StakingLog
+        from staking_manager import StakingManager
+        
+        now = datetime(2024, 6, 1)
+        stake = StakingLog(id=7, user_id=1, wallet_address='a', amount=365.0, asset='USDT', rate=10.0,
+                           start_date=now - timedelta(days=10), end_date=now + timedelta(days=20), status='active')
+        
+        summaries = StakingManager().get_stake_summaries([stake, stake], as_of=now)
+        
+        self.assertEqual(len(summaries), 2)
+        self.assertEqual(summaries[0]['id'], 7)
+        self.assertAlmostEqual(summaries[0]['current_reward'], 1.0, places=9)
+        self.assertEqual(summaries[1]['days_remaining'], 20)
+        self.assertIsInstance(summaries[0]['current_reward'], float)
+
+class TestMaturityScheduler(unittest.TestCase):
+    """Test heap-based stake maturity scheduling"""
+    
+    def setUp(self):
+        from datetime import datetime, timedelta
+        from database import StakingLog
+        from maturity_scheduler import MaturityScheduler
+        
+        self.now = datetime.utcnow()
+        self.session_factory = create_test_session_factory()
+        db = self.session_factory()
+        for days, status in [(5, 'active'), (-1, 'active'), (2, 'active'), (1, 'completed')]:
+            db.add(StakingLog(user_id=1, wallet_address=f"w{days}", amount=10, asset='USDT', rate=16, status=status,
+                              start_date=self.now - timedelta(days=30), end_date=self.now + timedelta(days=days)))
+        db.commit()
+        db.close()
+        self.scheduler = MaturityScheduler(session_factory=self.session_factory, retry_delay=7)
+    
+    def test_load_and_pop_due(self):
+        """Test heap rebuilt from active stakes pops in maturity order and skips cancelled"""
+        from datetime import timedelta
+        
+        self.assertEqual(self.scheduler.reload(), 3)
+        self.assertEqual(self.scheduler.next_due(), self.now - timedelta(days=1))
+        
+        self.scheduler.cancel(2)
+        self.assertEqual(self.scheduler.next_due(), self.now + timedelta(days=2))
+        self.scheduler.add(9, self.now + timedelta(days=3))
+        
+        due = self.scheduler.pop_due(self.now + timedelta(days=4))
+        self.assertEqual([stake_id for _, stake_id in due], [3, 9])
+        self.assertEqual(self.scheduler.next_due(), self.now + timedelta(days=5))
+    
+    def test_schedule_wakes_at_next_maturity(self):
+        """Test the job queue is armed for the next maturity"""
+        from datetime import timedelta
+        
+        job_queue = Mock()
+        self.scheduler.job_queue = job_queue
+        self.scheduler.add(1, self.now + timedelta(hours=1))
+        self.scheduler.schedule()
+        
+        callback = job_queue.run_once.call_args[0][0]
+        delay = job_queue.run_once.call_args[1]['when']
+        self.assertEqual(callback, self.scheduler.wake_job)
+        self.assertAlmostEqual(delay, 3600, delta=5)
+        
+        first_job = self.scheduler.job
+        self.scheduler.add(2, self.now - timedelta(hours=1))
+        self.scheduler.schedule(min_delay=7)
+        first_job.schedule_removal.assert_called_once()
+        self.assertEqual(job_queue.run_once.call_args[1]['when'], 7)
+    
+    def test_run_due_completes_matured_stakes(self):
+        """Test matured entries trigger one completion pass and are kept on failure"""
+        from staking_manager import StakingManager
+        
+        manager = StakingManager(session_factory=self.session_factory, scheduler=self.scheduler)
+        self.scheduler.reload()
+        self.scheduler.on_due = Mock(return_value=None)
+        
+        with self.assertRaises(RuntimeError):
+            self.scheduler.run_due()
+        self.assertEqual(len(self.scheduler.heap), 3)
+        
+        self.scheduler.on_due = manager.run_completion
+        self.assertEqual(self.scheduler.run_due(), 1)
+        self.assertEqual(self.scheduler.run_due(), 0)
+        self.assertEqual(manager.completion_stats['completed'], 1)
+    
+    def test_staking_manager_keeps_heap_current(self):
+        """Test new stakes are added and early withdrawals cancelled"""
+        from staking_manager import StakingManager
+        
+        from database import create_user
+        
+        manager = StakingManager(session_factory=self.session_factory, scheduler=self.scheduler)
+        db = self.session_factory()
+        user = create_user(db, 555)
+        stake = manager.create_staking(db, user.id, 'a', 10, 'USDT', '1_month')
+        self.assertEqual(self.scheduler.next_due(), stake.end_date)
+        
+        ok, _, _ = manager.early_withdraw_stake(db, stake.id)
+        self.assertTrue(ok)
+        self.assertIsNone(self.scheduler.next_due())
+        db.close()
+
+class TestBalanceChecker(unittest.TestCase):
+    """Test balance checker functionality"""
+    
+    def test_get_all_balances_async_partial(self):
+        """Test concurrent balance fetch returns partial results on timeout"""
+        import asyncio
+        import time
+        from balance_checker import BalanceChecker
+        
+        checker = BalanceChecker()
+        
+        def fake_get_balance(address, network):
+            if address == 'slow':
+                time.sleep(0.5)
+            return {network: 1.0}
+        
+        wallets = [
+            Mock(address='fast1', network='ETH'),
+            Mock(address='slow', network='BNB'),
+            Mock(address='fast2', network='SOL'),
+        ]
+        
+        with patch.object(checker, 'get_balance', side_effect=fake_get_balance):
+            balances, timed_out = asyncio.run(
+                checker.get_all_balances_async(wallets, timeout=0.1)
+            )
+        
+        self.assertEqual(balances, {'fast1': {'ETH': 1.0}, 'fast2': {'SOL': 1.0}})
+        self.assertEqual(timed_out, ['slow'])
+
+    def test_fetch_errors_are_unknown(self):
+        """Test failed fetches return None instead of a zero balance"""
+        from balance_checker import BalanceChecker
+        from utils import format_balance_message
+        
+        checker = BalanceChecker()
+        client = Mock()
+        client.get_balance.side_effect = ConnectionError('down')
+        client.eth.get_balance.side_effect = ConnectionError('down')
+        with patch('balance_checker.network_adapters.get', return_value=client):
+            self.assertEqual(checker.get_ethereum_balance('0xabc'), {'ETH': None, 'USDT': None})
+            self.assertEqual(checker.get_bnb_balance('0xabc'), {'BNB': None})
+            self.assertEqual(checker.get_avalanche_balance('0xabc'), {'AVAX': None})
+            self.assertEqual(checker.get_polygon_balance('0xabc'), {'POL': None})
+            self.assertEqual(checker.get_solana_balance('sol1'), {'SOL': None})
+            self.assertEqual(checker.get_tron_balance('T1'), {'TRX': None, 'USDT': None})
+        
+        with patch('balance_checker.http_client.get', return_value=Mock(status_code=503)):
+            self.assertEqual(checker.get_dogecoin_balance('D1'), {'DOGE': None})
+            self.assertEqual(checker.get_xrp_balance('r1'), {'XRP': None})
+        
+        with patch('balance_checker.http_client.get', side_effect=ConnectionError('down')):
+            self.assertEqual(checker.get_dogecoin_balance('D1'), {'DOGE': None})
+            self.assertEqual(checker.get_xrp_balance('r1'), {'XRP': None})
+        
+        self.assertIn('временно недоступен', format_balance_message({'r1': {'XRP': None}}))
+
+    def test_tron_balance_takes_one_token_per_request(self):
+        """Test every TronGrid request is throttled and the USDT contract is built once"""
+        from balance_checker import BalanceChecker
+        
+        checker = BalanceChecker()
+        client = Mock()
+        client.get_account_balance.return_value = 2_000_000
+        client.get_contract.return_value.functions.balanceOf.return_value = 3_000_000
+        with patch('balance_checker.network_adapters.get', return_value=client), \
+                patch('balance_checker.http_client.throttle') as mock_throttle:
+            self.assertEqual(checker.get_tron_balance('T1'), {'TRX': 2.0, 'USDT': 3.0})
+            self.assertEqual(mock_throttle.call_count, 3)
+            
+            self.assertEqual(checker.get_tron_balance('T2'), {'TRX': 2.0, 'USDT': 3.0})
+            self.assertEqual(mock_throttle.call_count, 5)
+        
+        self.assertEqual(client.get_contract.call_count, 1)
+
+class TestProviderRegistry(unittest.TestCase):
+    """Test pooled RPC provider registry"""
+    
+    def test_shared_client_reuses_connection(self):
+        """Test repeated calls share one Web3 client and one keep-alive connection"""
+        from rpc_providers import ProviderRegistry
+        
+        server, url = start_rpc_server(
+            lambda request: {'jsonrpc': '2.0', 'id': request['id'], 'result': hex(10**18)}
+        )
+        self.addCleanup(server.shutdown)
+        registry = ProviderRegistry({'ETH': url})
+        self.addCleanup(registry.close)
+        
+        w3 = registry.get_web3('ETH')
+        self.assertIs(w3, registry.get_web3('ETH'))
+        
+        address = '0x' + '11' * 20
+        for _ in range(3):
+            self.assertEqual(w3.eth.get_balance(address), 10**18)
+        
+        stats = registry.get_stats()['ETH']
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['reused'], 2)
+    
+    def test_batch_request_adapts_and_retries_items(self):
+        """Test batches shrink to the provider limit and failed items are retried alone"""
+        from rpc_providers import ProviderRegistry
+        
+        bad_calls = []
+        
+        def handle_request(request):
+            address = request['params'][0]
+            if address == 'bad':
+                bad_calls.append(request)
+                return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32000, 'message': 'boom'}}
+            return {'jsonrpc': '2.0', 'id': request['id'], 'result': hex(int(address))}
+        
+        server, url = start_rpc_server(handle_request, max_batch_size=40)
+        self.addCleanup(server.shutdown)
+        registry = ProviderRegistry({'ETH': url})
+        self.addCleanup(registry.close)
+        
+        params = [[str(i), 'latest'] for i in range(250)]
+        params[7] = ['bad', 'latest']
+        results = registry.batch_request('ETH', 'eth_getBalance', params)
+        
+        self.assertEqual(len(results), 250)
+        self.assertIsNone(results[7])
+        self.assertEqual(results[8], hex(8))
+        self.assertEqual(results[249], hex(249))
+        self.assertEqual(len(bad_calls), 2)
+        self.assertLessEqual(registry.get_batch_size('ETH'), 44)
+    
+    @patch('rpc_providers.RPC_BREAKER_FAILURES', 1)
+    def test_batch_request_shrinks_on_payload_too_large(self):
+        """Test HTTP 413 answers shrink the batch like JSON-RPC batch errors without tripping the breaker"""
+        from rpc_providers import ProviderRegistry
+        
+        server, url = start_rpc_server(
+            lambda request: {'jsonrpc': '2.0', 'id': request['id'], 'result': request['params'][0]},
+            max_batch_size=30,
+            oversize_status=413
+        )
+        self.addCleanup(server.shutdown)
+        registry = ProviderRegistry({'ETH': url})
+        self.addCleanup(registry.close)
+        
+        results = registry.batch_request('ETH', 'eth_getBalance', [[str(i)] for i in range(100)])
+        
+        self.assertEqual(results, [str(i) for i in range(100)])
+        self.assertLessEqual(registry.get_batch_size('ETH'), 33)
+        endpoint_stats = registry.get_stats()['ETH']['endpoints'][0]
+        self.assertEqual(endpoint_stats['failures'], 0)
+        self.assertFalse(endpoint_stats['circuit_open'])
+    
+    def test_batch_request_keeps_size_when_endpoint_down(self):
+        """Test transport errors fail chunks once without shrinking or single retries"""
+        from rpc_providers import ProviderRegistry
+        
+        server, url = start_rpc_server(lambda request: {})
+        server.shutdown()
+        server.server_close()
+        registry = ProviderRegistry({'ETH': url})
+        self.addCleanup(registry.close)
+        
+        with patch.object(registry, 'post', wraps=registry.post) as mock_post:
+            results = registry.batch_request('ETH', 'eth_getBalance', [[str(i)] for i in range(250)])
+        
+        self.assertEqual(results, [None] * 250)
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(registry.get_batch_size('ETH'), 100)
+    
+    @patch('rpc_providers.RPC_HEDGE_MAX_DELAY', 0.05)
+    def test_hedged_request_beats_slow_endpoint(self):
+        """Test a duplicate request to the next endpoint answers for a slow primary"""
+        import time
+        from rpc_providers import ProviderRegistry
+        
+        slow, slow_url = start_rpc_server(
+            lambda request: {'jsonrpc': '2.0', 'id': request['id'], 'result': 'slow'}, delay=1
+        )
+        fast, fast_url = start_rpc_server(
+            lambda request: {'jsonrpc': '2.0', 'id': request['id'], 'result': 'fast'}
+        )
+        self.addCleanup(slow.shutdown)
+        self.addCleanup(fast.shutdown)
+        registry = ProviderRegistry({'ETH': [slow_url, fast_url]})
+        self.addCleanup(registry.close)
+        
+        started = time.monotonic()
+        self.assertEqual(registry.request('ETH', 'eth_blockNumber', []), 'fast')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(registry.get_stats()['ETH']['hedges'], 1)
+        
+        # The fast endpoint now has latency samples and is preferred
+        self.assertEqual(registry.get_endpoints('ETH')[0].url, fast_url)
+    
+    @patch('rpc_providers.RPC_HEDGE_MAX_DELAY', 0.05)
+    def test_concurrent_hedges_do_not_queue_behind_slow_primaries(self):
+        """Test many concurrent callers all get hedged answers from the fast endpoint"""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from rpc_providers import ProviderRegistry
+        
+        slow, slow_url = start_rpc_server(
+            lambda request: {'jsonrpc': '2.0', 'id': request['id'], 'result': 'slow'}, delay=2
+        )
+        fast, fast_url = start_rpc_server(
+            lambda request: {'jsonrpc': '2.0', 'id': request['id'], 'result': 'fast'}
+        )
+        self.addCleanup(slow.shutdown)
+        self.addCleanup(fast.shutdown)
+        registry = ProviderRegistry({'ETH': [slow_url, fast_url]})
+        self.addCleanup(registry.close)
+        
+        def timed_request(_):
+            started = time.monotonic()
+            result = registry.request('ETH', 'eth_blockNumber', [])
+            return result, time.monotonic() - started
+        
+        with ThreadPoolExecutor(max_workers=20) as callers:
+            results = list(callers.map(timed_request, range(20)))
+        
+        self.assertEqual({result for result, _ in results}, {'fast'})
+        self.assertLess(max(latency for _, latency in results), 1.0)
+    
+    @patch('rpc_providers.RPC_BREAKER_FAILURES', 1)
+    def test_circuit_breaker_opens_on_failing_endpoint(self):
+        """Test failing endpoints are failed over and moved behind an open breaker"""
+        from rpc_providers import ProviderRegistry
+        
+        broken_requests = []
+        broken, broken_url = start_rpc_server(lambda request: broken_requests.append(request) or {}, status=500)
+        good, good_url = start_rpc_server(
+            lambda request: {'jsonrpc': '2.0', 'id': request['id'], 'result': 'ok'}
+        )
+        self.addCleanup(broken.shutdown)
+        self.addCleanup(good.shutdown)
+        registry = ProviderRegistry({'ETH': [broken_url, good_url]})
+        self.addCleanup(registry.close)
+        
+        self.assertEqual(registry.request('ETH', 'eth_blockNumber', []), 'ok')
+        self.assertEqual(registry.get_endpoints('ETH')[-1].url, broken_url)
+        
+        endpoint_stats = registry.get_stats()['ETH']['endpoints']
+        self.assertTrue(endpoint_stats[0]['circuit_open'])
+        self.assertEqual(endpoint_stats[0]['failures'], 1)
+        self.assertFalse(endpoint_stats[1]['circuit_open'])
+        
+        # The open endpoint is skipped, not hedged to or failed over to
+        for _ in range(5):
+            self.assertEqual(registry.request('ETH', 'eth_blockNumber', []), 'ok')
+        self.assertEqual(len(broken_requests), 1)
+    
+    @patch('rpc_providers.RPC_BREAKER_FAILURES', 1)
+    def test_half_open_breaker_admits_one_probe(self):
+        """Test a breaker past its cooldown lets a single probe through until it resolves"""
+        from rpc_providers import EndpointHealth
+        
+        endpoint = EndpointHealth('http://node')
+        self.assertTrue(endpoint.acquire())
+        endpoint.record_failure()
+        self.assertFalse(endpoint.acquire())
+        
+        endpoint.open_until = 0.0
+        self.assertTrue(endpoint.acquire())
+        self.assertFalse(endpoint.acquire())
+        endpoint.record_failure()
+        self.assertFalse(endpoint.acquire())
+        
+        endpoint.open_until = 0.0
+        self.assertTrue(endpoint.acquire())
+        endpoint.record_success(0.01)
+        self.assertTrue(endpoint.acquire())
+        self.assertTrue(endpoint.acquire())
+    
+    def test_unsupported_network(self):
+        """Test unknown network error"""
+        from rpc_providers import ProviderRegistry
+        
+        with self.assertRaises(ValueError):
+            ProviderRegistry({}).get_web3('ETH')
+
+class TestMulticallReader(unittest.TestCase):
+    """Test Multicall3 balance aggregation against a local stand-in node"""
+    
+    def setUp(self):
+        from eth_abi import encode, decode
+        from web3 import Web3
+        from multicall_reader import BALANCE_OF, GET_ETH_BALANCE
+        
+        self.token = '0x' + '22' * 20
+        self.holders = [Web3.to_checksum_address('0x' + f'{i:040x}') for i in range(1, 6)]
+        token_balances = {holder.lower(): i * 10**6 for i, holder in enumerate(self.holders, 1)}
+        self.blocks = []
+        
+        def handle_request(request):
+            if request['method'] != 'eth_call':
+                return {'jsonrpc': '2.0', 'id': request['id'], 'result': '0x1'}
+            call, block = request['params']
+            self.blocks.append(block)
+            data = bytes.fromhex(call['data'][2:])
+            _, calls = decode(['bool', '(address,bytes)[]'], data[4:])
+            results = []
+            for target, calldata in calls:
+                holder = decode(['address'], calldata[4:])[0].lower()
+                if calldata[:4] == BALANCE_OF and target.lower() == self.token and holder != self.holders[2].lower():
+                    results.append((True, encode(['uint256'], [token_balances[holder]])))
+                elif calldata[:4] == GET_ETH_BALANCE:
+                    results.append((True, encode(['uint256'], [10**18])))
+                else:
+                    results.append((False, b''))
+            result = encode(['uint256', 'bytes32', '(bool,bytes)[]'], [1234, b'\x00' * 32, results])
+            return {'jsonrpc': '2.0', 'id': request['id'], 'result': '0x' + result.hex()}
+        
+        server, url = start_rpc_server(handle_request)
+        self.addCleanup(server.shutdown)
+        self.w3 = Web3(Web3.HTTPProvider(url))
+    
+    def test_get_token_balances_pins_block(self):
+        """Test token balances are read in chunks pinned to one block"""
+        from multicall_reader import MulticallReader
+        
+        reader = MulticallReader(self.w3, chunk_size=2)
+        block_number, balances = reader.get_token_balances(self.token, self.holders, decimals=6)
+        
+        self.assertEqual(block_number, 1234)
+        self.assertEqual(balances[self.holders[0]], 1.0)
+        self.assertIsNone(balances[self.holders[2]])
+        self.assertEqual(balances[self.holders[4]], 5.0)
+        self.assertEqual(self.blocks, ['latest', hex(1234), hex(1234)])
+    
+    def test_get_native_balances(self):
+        """Test native balances via getEthBalance"""
+        from multicall_reader import MulticallReader
+        
+        reader = MulticallReader(self.w3)
+        block_number, balances = reader.get_native_balances(self.holders)
+        
+        self.assertEqual(block_number, 1234)
+        self.assertEqual(set(balances.values()), {1.0})
+        self.assertEqual(len(self.blocks), 1)
+
+class TestBalanceCache(unittest.TestCase):
+    """Test TTL/LRU balance cache"""
+    
+    @patch('balance_cache.time.monotonic')
+    def test_fresh_stale_and_expired(self, mock_monotonic):
+        """Test entries go fresh -> stale -> expired"""
+        from balance_cache import BalanceCache
+        
+        cache = BalanceCache(ttls={'ETH': 10}, stale_ttl=20)
+        mock_monotonic.return_value = 100
+        cache.set_many('ETH', '0xABC', {'ETH': 1.0, 'USDT': 2.0})
+        
+        mock_monotonic.return_value = 105
+        self.assertEqual(cache.get_many('ETH', '0xabc', ['ETH', 'USDT']), ({'ETH': 1.0, 'USDT': 2.0}, True))
+        
+        mock_monotonic.return_value = 120
+        self.assertEqual(cache.get('ETH', '0xabc', 'ETH'), (1.0, False))
+        
+        mock_monotonic.return_value = 131
+        self.assertEqual(cache.get('ETH', '0xabc', 'ETH'), (None, False))
+        
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['stale_hits'], stats['misses']), (1, 1, 1))
+    
+    def test_lru_eviction_and_invalidation(self):
+        """Test bounded size and write invalidation"""
+        from balance_cache import BalanceCache
+        
+        cache = BalanceCache(max_entries=2)
+        cache.set('SOL', 'a', 'SOL', 1.0)
+        cache.set('SOL', 'b', 'SOL', 2.0)
+        cache.get('SOL', 'a', 'SOL')
+        cache.set('SOL', 'c', 'SOL', 3.0)
+        
+        self.assertEqual(cache.get('SOL', 'b', 'SOL'), (None, False))
+        self.assertEqual(cache.get('SOL', 'a', 'SOL'), (1.0, True))
+        
+        cache.invalidate('SOL', 'a')
+        self.assertEqual(cache.get('SOL', 'a', 'SOL'), (None, False))
+        stats = cache.get_stats()
+        self.assertEqual((stats['evictions'], stats['invalidations'], stats['size']), (1, 1, 1))
+    
+    def test_balance_checker_serves_stale_while_revalidating(self):
+        """Test stale balance is returned immediately and refreshed in background"""
+        from balance_cache import BalanceCache
+        from balance_checker import BalanceChecker
+        
+        cache = BalanceCache(ttls={'SOL': 0}, stale_ttl=60)
+        checker = BalanceChecker()
+        cache.set('SOL', 'addr', 'SOL', 1.0)
+        
+        with patch('balance_checker.balance_cache', cache), \
+                patch.object(checker, 'fetch_balance', return_value={'SOL': 2.0}) as mock_fetch:
+            self.assertEqual(checker.get_balance('addr', 'SOL'), {'SOL': 1.0})
+            checker.executor.shutdown(wait=True)
+        
+        mock_fetch.assert_called_once_with('addr', 'SOL')
+        self.assertEqual(cache.get_stats()['stale_hits'], 1)
+        self.assertEqual(cache._entries[('SOL', 'addr', 'SOL')][0], 2.0)
+    
+    def test_withdrawal_manager_caches_only_fetched_balances(self):
+        """Test unsupported withdrawal balances are unknown and never cached as zero"""
+        from balance_cache import BalanceCache
+        from withdrawal_manager import WithdrawalManager
+        
+        cache = BalanceCache()
+        manager = WithdrawalManager()
+        with patch('withdrawal_manager.balance_cache', cache):
+            self.assertIsNone(manager.get_balance('addr', 'SOL', 'SOL'))
+            self.assertIsNone(manager.get_balance('0xabc', 'DAI', 'ETH'))
+            valid, message = manager.validate_withdrawal('addr', 1.0, 'SOL', 'SOL', 'key')
+        
+        self.assertFalse(valid)
+        self.assertIn('SOL', message)
+        self.assertEqual(cache.get_stats()['size'], 0)
+
+def create_test_session_factory():
+    """Create an in-memory SQLite database with all tables"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from database import Base
+    
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class TestBalanceRefresher(unittest.TestCase):
+    """Test background balance snapshot refresh"""
+    
+    def test_refresh_all_upserts_snapshots_by_priority(self):
+        """Test snapshots are written, updated and ordered by user activity"""
+        from datetime import datetime, timedelta
+        from database import User, Wallet, get_user_balances
+        from balance_refresher import BalanceRefresher
+        
+        session_factory = create_test_session_factory()
+        db = session_factory()
+        db.add_all([
+            User(id=1, user_id=1, telegram_id=1, account_id='1', last_active_at=datetime.utcnow() - timedelta(days=1)),
+            User(id=2, user_id=2, telegram_id=2, account_id='2', last_active_at=datetime.utcnow()),
+            Wallet(id=1, user_id=1, network='ETH', address='0xold', private_key='k', seed_phrase='s'),
+            Wallet(id=2, user_id=2, network='ETH', address='0xnew', private_key='k', seed_phrase='s'),
+            Wallet(id=3, user_id=2, network='SOL', address='sol1', private_key='k', seed_phrase='s'),
+        ])
+        db.commit()
+        
+        refresher = BalanceRefresher(session_factory=session_factory)
+        self.assertEqual(
+            [wallet.address for wallet in refresher.get_wallets_by_priority(db, 'ETH')],
+            ['0xnew', '0xold']
+        )
+        
+        def fake_evm(addresses, network):
+            return 100, {address: {'ETH': 1.0, 'USDT': None} for address in addresses}
+        
+        with patch('balance_refresher.balance_checker.get_evm_balances_bulk', side_effect=fake_evm), \
+                patch('balance_refresher.balance_checker.fetch_balance', return_value={'SOL': 3.0}):
+            written = refresher.refresh_all()
+            self.assertEqual(written['ETH'], 2)
+            self.assertEqual(written['SOL'], 1)
+        
+        with patch('balance_refresher.balance_checker.get_evm_balances_bulk',
+                   return_value=(101, {'0xnew': {'ETH': 2.0}, '0xold': {'ETH': 2.0}})), \
+                patch('balance_refresher.balance_checker.fetch_balance', return_value={'SOL': 4.0}):
+            refresher.refresh_all()
+        
+        # A failed fetch keeps the previous snapshot
+        with patch('balance_refresher.balance_checker.get_evm_balances_bulk',
+                   return_value=(102, {'0xnew': {'ETH': 2.0}, '0xold': {'ETH': 2.0}})), \
+                patch('balance_refresher.balance_checker.fetch_balance', return_value={'SOL': None}):
+            refresher.refresh_all()
+        
+        snapshots = {(row.address, row.asset): row for row in get_user_balances(db, 2)}
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(snapshots[('0xnew', 'ETH')].amount, 2.0)
+        self.assertEqual(snapshots[('0xnew', 'ETH')].block_number, 102)
+        self.assertEqual(snapshots[('sol1', 'SOL')].amount, 4.0)
+        self.assertIsNone(snapshots[('sol1', 'SOL')].block_number)
+        db.close()
+
+class TestBlockFollower(unittest.TestCase):
+    """Test block-driven incremental balance updates"""
+    
+    def test_poll_touches_our_addresses_and_rechecks_reorgs(self):
+        """Test senders, recipients and USDT transfers are matched and reorgs re-read"""
+        from block_follower import BlockFollower, TrackedWallet, TRANSFER_TOPIC
+        from rpc_providers import ProviderRegistry
+        
+        ours = ['0x' + 'a1' * 20, '0x' + 'b2' * 20, '0x' + 'c3' * 20]
+        chain = {'head': 10, 'hashes': {}}
+        
+        def block(number):
+            transactions = []
+            if number == 11:
+                transactions.append({'from': ours[0].upper().replace('0X', '0x'), 'to': '0x' + '99' * 20})
+            if number == 10:
+                transactions.append({'from': '0x' + '99' * 20, 'to': ours[1]})
+            return {
+                'number': hex(number),
+                'hash': chain['hashes'].get(number, f"0x{number:064x}"),
+                'transactions': transactions
+            }
+        
+        def handle_request(request):
+            method, params = request['method'], request['params']
+            if method == 'eth_blockNumber':
+                result = hex(chain['head'])
+            elif method == 'eth_getBlockByNumber':
+                number = int(params[0], 16)
+                result = block(number) if number <= chain['head'] else None
+            elif method == 'eth_getLogs':
+                self.assertEqual(params[0]['topics'], [TRANSFER_TOPIC])
+                result = [{
+                    'blockNumber': params[0]['toBlock'],
+                    'topics': [TRANSFER_TOPIC, '0x' + '00' * 12 + '77' * 20, '0x' + '00' * 12 + ours[2][2:]]
+                }]
+            return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+        
+        server, url = start_rpc_server(handle_request)
+        self.addCleanup(server.shutdown)
+        registry = ProviderRegistry({'ETH': url})
+        self.addCleanup(registry.close)
+        
+        follower = BlockFollower('ETH', confirmations=3)
+        follower.tracked = {
+            address: [TrackedWallet(i, 1, address)] for i, address in enumerate(ours)
+        }
+        
+        with patch('block_follower.provider_registry', registry), \
+                patch.object(follower, 'refresh_addresses') as mock_refresh:
+            self.assertEqual(follower.poll(), set())
+            
+            chain['head'] = 12
+            self.assertEqual(follower.poll(), {ours[0], ours[2]})
+            self.assertEqual(follower.last_block, 12)
+            
+            # Block 10 was never seen, block 11 gets replaced by a reorg
+            chain['hashes'][11] = '0x' + 'ff' * 32
+            chain['head'] = 13
+            self.assertEqual(follower.poll(), {ours[0], ours[2]})
+            self.assertEqual(follower.stats['reorged_blocks'], 1)
+        
+        self.assertEqual(mock_refresh.call_count, 2)
+        self.assertEqual(follower.stats['blocks'], 4)
+        self.assertGreater(follower.stats['blocks_per_sec'], 0)
+
+    def test_poll_refreshes_orphaned_addresses_and_retries_failed_refresh(self):
+        """Test addresses of orphaned blocks are re-read and blocks are kept until their refresh succeeds"""
+        from block_follower import BlockFollower, TrackedWallet
+        from rpc_providers import ProviderRegistry
+        
+        ours = ['0x' + 'a1' * 20, '0x' + 'b2' * 20]
+        chain = {'head': 10, 'fork': False}
+        
+        def block(number):
+            transactions = []
+            if number == 11:
+                # The replacement block no longer pays our first address
+                transactions.append({'from': '0x' + '99' * 20, 'to': ours[1] if chain['fork'] else ours[0]})
+            return {
+                'number': hex(number),
+                'hash': f"0x{number + (1000 if chain['fork'] else 0):064x}",
+                'transactions': transactions
+            }
+        
+        def handle_request(request):
+            method, params = request['method'], request['params']
+            if method == 'eth_blockNumber':
+                result = hex(chain['head'])
+            else:
+                number = int(params[0], 16)
+                result = block(number) if number <= chain['head'] else None
+            return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+        
+        server, url = start_rpc_server(handle_request)
+        self.addCleanup(server.shutdown)
+        follower = BlockFollower('POL', confirmations=3)
+        registry = ProviderRegistry({follower.rpc_network: url})
+        self.addCleanup(registry.close)
+        
+        follower.tracked = {address: [TrackedWallet(i, 1, address)] for i, address in enumerate(ours)}
+        
+        with patch('block_follower.provider_registry', registry), \
+                patch.object(follower, 'refresh_addresses') as mock_refresh:
+            follower.poll()
+            chain['head'] = 11
+            
+            mock_refresh.side_effect = ConnectionError('down')
+            with self.assertRaises(ConnectionError):
+                follower.poll()
+            self.assertEqual(follower.last_block, 10)
+            
+            mock_refresh.side_effect = None
+            self.assertEqual(follower.poll(), {ours[0]})
+            self.assertEqual(follower.last_block, 11)
+            
+            chain['fork'] = True
+            self.assertEqual(follower.poll(), {ours[0], ours[1]})
+        
+        mock_refresh.assert_called_with({ours[0], ours[1]})
+
+    def test_refresh_addresses_keeps_fresh_balances_cached(self):
+        """Test balances read for touched addresses stay cached and reach the snapshots"""
+        from database import get_user_balances
+        from balance_cache import BalanceCache
+        from block_follower import BlockFollower, TrackedWallet
+        
+        address = '0x' + 'a1' * 20
+        cache = BalanceCache()
+        cache.set_many('ETH', address, {'ETH': 1.0, 'USDT': 5.0})
+        
+        def fake_evm(addresses, network):
+            balances = {address: {'ETH': 2.0, 'USDT': None}}
+            cache.set_many(network, address, balances[address])
+            return 100, balances
+        
+        session_factory = create_test_session_factory()
+        follower = BlockFollower('ETH', session_factory=session_factory)
+        follower.tracked = {address: [TrackedWallet(1, 1, address)]}
+        with patch('block_follower.balance_cache', cache), \
+                patch('block_follower.balance_checker.get_evm_balances_bulk', side_effect=fake_evm):
+            follower.refresh_addresses({address})
+        
+        # The unknown USDT balance is dropped, not served stale
+        self.assertEqual(cache.get_many('ETH', address, ['ETH']), ({'ETH': 2.0}, True))
+        self.assertEqual(cache.get_many('ETH', address, ['USDT'])[0], None)
+        db = session_factory()
+        self.assertEqual([(row.asset, row.amount) for row in get_user_balances(db, 1)], [('ETH', 2.0)])
+        db.close()
+
+    def test_run_once_skips_polling_without_tracked_addresses(self):
+        """Test no blocks are fetched while no wallets are tracked"""
+        from block_follower import BlockFollower
+        
+        follower = BlockFollower('ETH', session_factory=create_test_session_factory())
+        follower.last_block = 10
+        with patch.object(follower, 'poll') as mock_poll:
+            self.assertEqual(follower.run_once(), set())
+        
+        mock_poll.assert_not_called()
+        self.assertIsNone(follower.last_block)
+
+class TestHttpClient(unittest.TestCase):
+    """Test rate-limited REST client"""
+    
+    def setUp(self):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        
+        self.responses = []
+        self.headers = []
+        test = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                test.headers.append(dict(self.headers))
+                status, retry_after = test.responses.pop(0)
+                body = b'{"ok": true}'
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header('Retry-After', str(retry_after))
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_address[1]}/balance"
+    
+    def test_token_bucket(self):
+        """Test burst capacity and refusal beyond max wait"""
+        from http_client import TokenBucket
+        
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertTrue(bucket.acquire(max_wait=0))
+        self.assertTrue(bucket.acquire(max_wait=0))
+        self.assertFalse(bucket.acquire(max_wait=0.1))
+    
+    def test_retry_after_and_api_key(self):
+        """Test a short Retry-After is retried and the API key header is injected"""
+        from http_client import HttpClient
+        
+        client = HttpClient(
+            rate_limits={'127.0.0.1': (100, 100)},
+            api_key_headers={'127.0.0.1': {'TRON-PRO-API-KEY': 'secret'}}
+        )
+        self.responses = [(429, 0), (200, None)]
+        
+        response = client.get(self.url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.headers[0]['TRON-PRO-API-KEY'], 'secret')
+        self.assertEqual(client.get_stats(), {'requests': 2, 'rate_limited': 0, 'retries': 1})
+    
+    def test_rate_limited_is_not_zero_balance(self):
+        """Test a long Retry-After surfaces as unknown balance instead of 0.0"""
+        from http_client import HttpClient, RateLimitedError
+        from balance_checker import BalanceChecker
+        
+        client = HttpClient(rate_limits={'127.0.0.1': (100, 100)}, api_key_headers={})
+        self.responses = [(429, 120)]
+        with self.assertRaises(RateLimitedError):
+            client.get(self.url)
+        
+        # The host stays blocked without another request
+        with self.assertRaises(RateLimitedError):
+            client.get(self.url)
+        self.assertEqual(len(self.headers), 1)
+        
+        # An exhausted bucket answers without touching the provider
+        xrp_client = HttpClient(rate_limits={'api.xrpscan.com': (0.01, 1)}, api_key_headers={}, max_wait=0)
+        xrp_client.throttle('api.xrpscan.com')
+        checker = BalanceChecker()
+        with patch('balance_checker.http_client', xrp_client):
+            self.assertEqual(checker.get_xrp_balance('rXRP'), {'XRP': None})
+
+class TestNetworkAdapters(unittest.TestCase):
+    """Test lazy chain client loading"""
+    
+    def test_clients_built_once_on_first_use(self):
+        """Test factories run on first get only"""
+        from network_adapters import AdapterRegistry
+        
+        calls = []
+        registry = AdapterRegistry()
+        registry.register('SOL', lambda: calls.append('SOL') or object())
+        
+        self.assertFalse(registry.is_loaded('SOL'))
+        client = registry.get('SOL')
+        self.assertIs(registry.get('SOL'), client)
+        self.assertEqual(calls, ['SOL'])
+        self.assertEqual(registry.get_loaded(), ['SOL'])
+        with self.assertRaises(ValueError):
+            registry.get('UNSUPPORTED')
+
+    def test_bot_import_loads_no_chain_sdk(self):
+        """Test importing the bot does not import web3, tronpy, solana or bip_utils"""
+        import subprocess
+        
+        output = subprocess.run(
+            [sys.executable, '-c', (
+                "import sys, bot; "
+                "print([m for m in ('web3', 'tronpy', 'solana', 'bip_utils') if m in sys.modules])"
+            )],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
+
+class TestBulkWalletPersistence(unittest.TestCase):
+    """Test bulk wallet inserts"""
+    
+    def test_create_wallets_bulk(self):
+        """Test a batch is inserted in one transaction with derivation indexes"""
+        from database import create_wallets_bulk, get_user_wallets
+        
+        session_factory = create_test_session_factory()
+        db = session_factory()
+        wallets = [
+            {'address': f"0x{index:040x}", 'private_key': 'k', 'seed_phrase': 's', 'derivation_index': index}
+            for index in range(250)
+        ]
+        
+        self.assertEqual(create_wallets_bulk(db, 7, 'ETH', wallets), 250)
+        self.assertEqual(create_wallets_bulk(db, 7, 'ETH', []), 0)
+        
+        stored = sorted(get_user_wallets(db, 7), key=lambda wallet: wallet.derivation_index)
+        self.assertEqual(len(stored), 250)
+        self.assertEqual(stored[5].address, wallets[5]['address'])
+        self.assertEqual(stored[5].network, 'ETH')
+        db.close()
+
+class TestSeedVault(unittest.TestCase):
+    """Test compact wallet storage with per-user master seeds"""
+    
+    def test_compact_wallets_rederive_keys(self):
+        """Test compact wallets store no keys and re-derive them from the master seed"""
+        from cryptography.fernet import Fernet
+        from sqlalchemy.exc import IntegrityError
+        from database import UserSeed, create_wallets_bulk, get_user_wallets, get_next_derivation_index
+        from wallet_generator import derive_wallets
+        from seed_vault import SeedVault
+        
+        session_factory = create_test_session_factory()
+        db = session_factory()
+        vault = SeedVault(key=Fernet.generate_key().decode())
+        
+        seed_phrase = vault.get_or_create_master_seed(db, 1)
+        self.assertEqual(vault.get_or_create_master_seed(db, 1), seed_phrase)
+        self.assertNotIn(seed_phrase, db.query(UserSeed).one().encrypted_seed)
+        
+        self.assertEqual(get_next_derivation_index(db, 1, 'ETH'), 0)
+        wallets = derive_wallets('ETH', 3, seed_phrase=seed_phrase)
+        create_wallets_bulk(db, 1, 'ETH', wallets, compact=True)
+        self.assertEqual(get_next_derivation_index(db, 1, 'ETH'), 3)
+        self.assertEqual(get_next_derivation_index(db, 1, 'TRX'), 0)
+        
+        stored = sorted(get_user_wallets(db, 1), key=lambda wallet: wallet.derivation_index)
+        self.assertEqual([wallet.private_key for wallet in stored], [None] * 3)
+        self.assertEqual(vault.get_private_key(db, stored[2]), wallets[2]['private_key'])
+        
+        # The same index cannot be stored twice
+        with self.assertRaises(IntegrityError):
+            create_wallets_bulk(db, 1, 'ETH', wallets[:1], compact=True)
+        db.close()
+
+    def test_withdraw_wallet_picks_network_of_shared_address(self):
+        """Test a compact EVM address held in several networks is selected with its network"""
+        import asyncio
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        import bot
+        
+        address = '0x' + 'ab' * 20
+        wallets = [SimpleNamespace(network=network, address=address) for network in ('ETH', 'BNB')]
+        
+        def run(text):
+            update = Mock()
+            update.message.text = text
+            update.message.reply_text = AsyncMock()
+            context = SimpleNamespace(user_data={})
+            with patch('bot.get_user_identity_async', AsyncMock(return_value=SimpleNamespace(id=1))), \
+                    patch('bot.get_user_wallets_async', AsyncMock(return_value=wallets)):
+                state = asyncio.run(bot.handle_withdraw_wallet.__wrapped__(update, context, None))
+            return state, context.user_data.get('withdraw_wallet')
+        
+        self.assertEqual(run(address), (bot.CHOOSING_WALLET, None))
+        self.assertEqual(run(f"bnb {address.upper().replace('0X', '0x')}"), (bot.ENTERING_AMOUNT, wallets[1]))
+
+    def test_stored_keys_are_normalized(self):
+        """Test EVM keys stored without the 0x prefix read back in the generated format"""
+        from types import SimpleNamespace
+        from seed_vault import SeedVault
+        
+        vault = SeedVault(key='')
+        legacy = SimpleNamespace(network='BNB', private_key='ab' * 32)
+        current = SimpleNamespace(network='ETH', private_key='0x' + 'ab' * 32)
+        tron = SimpleNamespace(network='TRX', private_key='ab' * 32)
+        
+        self.assertEqual(vault.get_private_key(None, legacy), '0x' + 'ab' * 32)
+        self.assertEqual(vault.get_private_key(None, current), '0x' + 'ab' * 32)
+        self.assertEqual(vault.get_private_key(None, tron), 'ab' * 32)
+
+    def test_missing_key(self):
+        """Test compact storage requires an encryption key"""
+        from seed_vault import SeedVault
+        
+        with self.assertRaises(ValueError):
+            SeedVault(key='').encrypt('seed')
+
+    def test_compact_generation_retries_on_index_conflict(self):
+        """Test a request that read a stale derivation index retries after the stored wallets"""
+        import asyncio
+        import tempfile
+        from cryptography.fernet import Fernet
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from database import Base, create_wallets_bulk, get_user_wallets
+        from async_database import AsyncDatabase, get_next_derivation_index_async
+        from wallet_generator import derive_wallets
+        from seed_vault import SeedVault
+        import bot
+        
+        path = os.path.join(tempfile.mkdtemp(), 'compact.db')
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        database = AsyncDatabase(url=f"sqlite+aiosqlite:///{path}")
+        vault = SeedVault(key=Fernet.generate_key().decode())
+        session_factory = sessionmaker(bind=engine)
+        
+        class SerialGenerationService:
+            async def generate(self, network, count, seed_phrase=None, start_index=0):
+                return derive_wallets(network, count, seed_phrase=seed_phrase, start_index=start_index)
+        
+        index_reads = []
+        
+        async def stale_index(db, user_id, network):
+            # The first read races with a concurrent request that stores indexes 0-2
+            index_reads.append(await get_next_derivation_index_async(db, user_id, network))
+            if len(index_reads) == 1:
+                sync_db = session_factory()
+                seed_phrase = vault.get_or_create_master_seed(sync_db, 1)
+                create_wallets_bulk(sync_db, 1, 'ETH', derive_wallets('ETH', 3, seed_phrase=seed_phrase), compact=True)
+                sync_db.close()
+            return index_reads[-1]
+        
+        async def scenario():
+            async with database.session() as db:
+                wallets = await bot.generate_compact_wallets(db, 1, 'ETH', 2)
+            await database.dispose()
+            return wallets
+        
+        with patch('bot.seed_vault', vault), \
+             patch('bot.wallet_generation_service', SerialGenerationService()), \
+             patch('bot.get_next_derivation_index_async', stale_index):
+            wallets = asyncio.run(scenario())
+        
+        self.assertEqual(index_reads, [0, 3])
+        self.assertEqual([wallet['derivation_index'] for wallet in wallets], [3, 4])
+        db = session_factory()
+        self.assertEqual(len(get_user_wallets(db, 1)), 5)
+        db.close()
+
+class TestMigrations(unittest.TestCase):
+    """Test versioned schema migrations"""
+    
+    def test_upgrade_original_schema(self):
+        """Test an original database gets new columns, indexes and version records once"""
+        from sqlalchemy import create_engine, inspect, text
+        from sqlalchemy.pool import StaticPool
+        from migrations import migrate, MIGRATIONS
+        
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL UNIQUE, "
+                "telegram_id INTEGER NOT NULL UNIQUE, account_id VARCHAR(9) NOT NULL UNIQUE, creation_date DATETIME)"
+            ))
+            connection.execute(text(
+                "CREATE TABLE wallets (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, network VARCHAR(10) NOT NULL, "
+                "address VARCHAR(100) NOT NULL, private_key TEXT NOT NULL, seed_phrase TEXT NOT NULL)"
+            ))
+            connection.execute(text(
+                "INSERT INTO wallets (user_id, network, address, private_key, seed_phrase) VALUES (1, 'ETH', '0x1', 'k', 's')"
+            ))
+        
+        self.assertEqual(migrate(engine), [version for version, _, _ in MIGRATIONS])
+        self.assertEqual(migrate(engine), [])
+        
+        inspector = inspect(engine)
+        self.assertIn('derivation_index', {c['name'] for c in inspector.get_columns('wallets')})
+        self.assertIn('last_active_at', {c['name'] for c in inspector.get_columns('users')})
+        self.assertIn('ix_wallets_user_id', {i['name'] for i in inspector.get_indexes('wallets')})
+        self.assertIn('ix_staking_logs_active_end_date', {i['name'] for i in inspector.get_indexes('staking_logs')})
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT count(*) FROM wallets")).scalar(), 1)
+            plan = connection.execute(text(
+                "EXPLAIN QUERY PLAN SELECT id FROM staking_logs WHERE status = 'active' AND end_date <= '2030-01-01'"
+            )).all()
+        self.assertIn('ix_staking_logs_active_end_date', ' '.join(str(row) for row in plan))
+
+    def test_upgrade_staking_logs(self):
+        """Test migrations 5 and 6 add accrual and admission columns and indexes"""
+        from sqlalchemy import create_engine, inspect, text
+        from sqlalchemy.pool import StaticPool
+        from migrations import migrate
+        
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE staking_logs (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+                "wallet_address VARCHAR(100) NOT NULL, amount FLOAT NOT NULL, asset VARCHAR(10) NOT NULL, "
+                "rate FLOAT NOT NULL, start_date DATETIME, end_date DATETIME NOT NULL, status VARCHAR(20), accrued_reward FLOAT)"
+            ))
+            connection.execute(text(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL UNIQUE, "
+                "telegram_id INTEGER NOT NULL UNIQUE, account_id VARCHAR(9) NOT NULL UNIQUE, creation_date DATETIME)"
+            ))
+            connection.execute(text("INSERT INTO users (id, user_id, telegram_id, account_id) VALUES (1, 5, 5, 'A1')"))
+            for wallet, status in [('a', 'active'), ('b', 'active'), ('a', 'completed')]:
+                connection.execute(text(
+                    "INSERT INTO staking_logs (user_id, wallet_address, amount, asset, rate, end_date, status) "
+                    "VALUES (1, :wallet, 1, 'USDT', 16, '2030-01-01', :status)"
+                ), {'wallet': wallet, 'status': status})
+        
+        self.assertEqual(migrate(engine)[-2:], [5, 6])
+        inspector = inspect(engine)
+        self.assertIn('last_accrued_at', {c['name'] for c in inspector.get_columns('staking_logs')})
+        with engine.connect() as connection:
+            plan = connection.execute(text(
+                "EXPLAIN QUERY PLAN SELECT asset, count(*), sum(amount), sum(accrued_reward) "
+                "FROM staking_logs WHERE status = 'active' GROUP BY asset"
+            )).all()
+        self.assertIn('COVERING INDEX ix_staking_logs_active_totals', ' '.join(str(row) for row in plan))
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT active_stakes FROM users")).scalar(), 2)
+        self.assertIn('uq_staking_logs_active_wallet_asset', {i['name'] for i in inspector.get_indexes('staking_logs')})
+
+    def test_upgrade_postpones_active_stake_index_on_duplicates(self):
+        """Test duplicate active stakes do not abort migration 6 and the index follows once they finish"""
+        from sqlalchemy import create_engine, inspect, text
+        from sqlalchemy.pool import StaticPool
+        from migrations import migrate
+        
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE staking_logs (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+                "wallet_address VARCHAR(100) NOT NULL, amount FLOAT NOT NULL, asset VARCHAR(10) NOT NULL, "
+                "rate FLOAT NOT NULL, start_date DATETIME, end_date DATETIME NOT NULL, status VARCHAR(20), accrued_reward FLOAT)"
+            ))
+            connection.execute(text(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL UNIQUE, "
+                "telegram_id INTEGER NOT NULL UNIQUE, account_id VARCHAR(9) NOT NULL UNIQUE, creation_date DATETIME)"
+            ))
+            for _ in range(2):
+                connection.execute(text(
+                    "INSERT INTO staking_logs (user_id, wallet_address, amount, asset, rate, end_date, status) "
+                    "VALUES (1, 'a', 1, 'USDT', 16, '2030-01-01', 'active')"
+                ))
+        
+        with self.assertLogs('migrations', level='WARNING'):
+            self.assertEqual(migrate(engine)[-1], 6)
+        self.assertNotIn('uq_staking_logs_active_wallet_asset', {i['name'] for i in inspect(engine).get_indexes('staking_logs')})
+        
+        with engine.begin() as connection:
+            # Rows written outside the ORM still count from zero
+            connection.execute(text("INSERT INTO users (id, user_id, telegram_id, account_id) VALUES (2, 6, 6, 'A2')"))
+            self.assertEqual(connection.execute(text("SELECT active_stakes FROM users WHERE id = 2")).scalar(), 0)
+            connection.execute(text("UPDATE staking_logs SET status = 'completed' WHERE id = 1"))
+        
+        self.assertEqual(migrate(engine), [])
+        self.assertIn('uq_staking_logs_active_wallet_asset', {i['name'] for i in inspect(engine).get_indexes('staking_logs')})
+
+class TestAsyncDatabase(unittest.TestCase):
+    """Test async session-per-update layer"""
+    
+    def test_session_per_update(self):
+        """Test handlers get a session that is closed afterwards and async helpers work"""
+        import asyncio
+        import tempfile
+        from sqlalchemy import create_engine
+        from database import Base
+        from async_database import (
+            AsyncDatabase, create_user_async, get_user_by_telegram_id_async, touch_user_async
+        )
+        
+        path = os.path.join(tempfile.mkdtemp(), 'async.db')
+        Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+        database = AsyncDatabase(url=f"sqlite+aiosqlite:///{path}")
+        
+        async def handler(update, context, db):
+            user = await create_user_async(db, 42)
+            await touch_user_async(db, user.id)
+            return (await get_user_by_telegram_id_async(db, 42)).account_id, user.account_id
+        
+        async def scenario():
+            with patch('async_database.async_database', database):
+                from async_database import with_session
+                found, created = await with_session(handler)(None, None)
+            stats = database.get_pool_stats()
+            await database.dispose()
+            return found, created, stats
+        
+        found, created, stats = asyncio.run(scenario())
+        self.assertEqual(found, created)
+        self.assertEqual(stats['sessions'], 1)
+        self.assertEqual(stats['open_sessions'], 0)
+        self.assertGreaterEqual(stats['checkouts'], 1)
+
+    def test_async_database_url(self):
+        """Test sync URLs map to async drivers"""
+        from config import get_async_database_url
+        
+        self.assertEqual(get_async_database_url('postgresql://u:p@h/db'), 'postgresql+asyncpg://u:p@h/db')
+        self.assertEqual(get_async_database_url('sqlite:///bot.db'), 'sqlite+aiosqlite:///bot.db')
+
+class TestUserIdentityCache(unittest.TestCase):
+    """Test telegram_id -> user identity cache"""
+    
+    def test_lookup_populates_and_evicts(self):
+        """Test first lookup fills the cache, unknown users are not cached, LRU is bounded"""
+        from database import User, create_user, get_user_identity
+        from identity_cache import UserIdentityCache
+        
+        cache = UserIdentityCache(max_entries=2)
+        session_factory = create_test_session_factory()
+        db = session_factory()
+        db.add(User(id=1, user_id=10, telegram_id=10, account_id='000000010'))
+        db.commit()
+        
+        with patch('database.user_identity_cache', cache):
+            self.assertIsNone(get_user_identity(db, 20))
+            created = create_user(db, 20)
+            self.assertEqual(get_user_identity(db, 20).id, created.id)
+            
+            self.assertEqual(get_user_identity(db, 10).account_id, '000000010')
+            self.assertEqual(get_user_identity(db, 10).id, 1)
+            
+            create_user(db, 30)
+        
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+        self.assertIsNone(cache.get(20))
+        self.assertAlmostEqual(stats['hit_rate'], 0.5)
+        db.close()
+
+    def test_async_lookup_counts_each_lookup_once(self):
+        """Test a miss then a hit through the async helper give a hit rate of one half"""
+        import asyncio
+        import tempfile
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from database import Base, User
+        from async_database import AsyncDatabase, get_user_identity_async
+        from identity_cache import UserIdentityCache
+        
+        path = os.path.join(tempfile.mkdtemp(), 'identity.db')
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        db.add(User(id=1, user_id=10, telegram_id=10, account_id='000000010'))
+        db.commit()
+        db.close()
+        engine.dispose()
+        cache = UserIdentityCache()
+        database = AsyncDatabase(url=f"sqlite+aiosqlite:///{path}")
+        
+        async def lookups():
+            async with database.session() as session:
+                first = await get_user_identity_async(session, 10)
+                second = await get_user_identity_async(session, 10)
+            await database.dispose()
+            return first, second
+        
+        with patch('database.user_identity_cache', cache), patch('async_database.user_identity_cache', cache):
+            first, second = asyncio.run(lookups())
+        
+        self.assertEqual(first, second)
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 0.5)
+
+class TestWalletReservoir(unittest.TestCase):
+    """Test pre-generated wallet reservoir"""
+    
+    def test_refill_and_claim(self):
+        """Test refill tops up to target and users never share a wallet or mnemonic"""
+        import asyncio
+        from database import get_user_wallets
+        from wallet_generator import generate_multiple_wallets
+        from wallet_reservoir import WalletReservoir
+        
+        class SerialGenerationService:
+            async def generate_independent(self, network, count):
+                return generate_multiple_wallets(network, count, shared_seed=False)
+        
+        session_factory = create_test_session_factory()
+        reservoir = WalletReservoir(
+            session_factory=session_factory,
+            generation_service=SerialGenerationService(),
+            networks=['ETH', 'SOL'],
+            low_water=5,
+            target=10,
+            lot_size=4
+        )
+        
+        self.assertEqual(asyncio.run(reservoir.refill()), 20)
+        self.assertEqual(reservoir.get_depths(), {'ETH': 10, 'SOL': 10})
+        self.assertEqual(asyncio.run(reservoir.refill()), 0)
+        
+        db = session_factory()
+        first = reservoir.claim(db, 1, 'ETH', 6)
+        second = reservoir.claim(db, 2, 'ETH', 6)
+        
+        self.assertEqual(len(first), 6)
+        self.assertEqual(len(second), 4)
+        self.assertFalse({w.id for w in first} & {w.id for w in second})
+        self.assertEqual({w.address for w in get_user_wallets(db, 1)}, {w.address for w in first})
+        first_seeds = {w.seed_phrase for w in get_user_wallets(db, 1)}
+        second_seeds = {w.seed_phrase for w in get_user_wallets(db, 2)}
+        self.assertEqual(len(first_seeds), 6)
+        self.assertFalse(first_seeds & second_seeds)
+        self.assertEqual(reservoir.get_depths(), {'ETH': 0, 'SOL': 10})
+        
+        stats = reservoir.get_stats()
+        self.assertEqual(stats['claimed'], 10)
+        self.assertEqual(stats['short_claims'], 1)
+        self.assertEqual(stats['refilled'], 20)
+        db.close()
+
 def run_tests():
     """Run all tests"""
     # Create test suite
@@ -186,10 +1816,27 @@ def run_tests():
     
     # Add test cases
     test_suite.addTest(unittest.makeSuite(TestWalletGenerator))
+    test_suite.addTest(unittest.makeSuite(TestWalletGenerationService))
     test_suite.addTest(unittest.makeSuite(TestUtils))
     test_suite.addTest(unittest.makeSuite(TestConfig))
     test_suite.addTest(unittest.makeSuite(TestDatabase))
     test_suite.addTest(unittest.makeSuite(TestStakingManager))
+    test_suite.addTest(unittest.makeSuite(TestRewardEngine))
+    test_suite.addTest(unittest.makeSuite(TestMaturityScheduler))
+    test_suite.addTest(unittest.makeSuite(TestBalanceChecker))
+    test_suite.addTest(unittest.makeSuite(TestProviderRegistry))
+    test_suite.addTest(unittest.makeSuite(TestMulticallReader))
+    test_suite.addTest(unittest.makeSuite(TestBalanceCache))
+    test_suite.addTest(unittest.makeSuite(TestBalanceRefresher))
+    test_suite.addTest(unittest.makeSuite(TestBlockFollower))
+    test_suite.addTest(unittest.makeSuite(TestHttpClient))
+    test_suite.addTest(unittest.makeSuite(TestNetworkAdapters))
+    test_suite.addTest(unittest.makeSuite(TestBulkWalletPersistence))
+    test_suite.addTest(unittest.makeSuite(TestSeedVault))
+    test_suite.addTest(unittest.makeSuite(TestMigrations))
+    test_suite.addTest(unittest.makeSuite(TestAsyncDatabase))
+    test_suite.addTest(unittest.makeSuite(TestUserIdentityCache))
+    test_suite.addTest(unittest.makeSuite(TestWalletReservoir))
     
     # Run tests
     runner = unittest.TextTestRunner(verbosity=2)
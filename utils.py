@@ -1,4 +1,5 @@
 import re
+import base58
 from typing import Dict, List, Optional
 from config import SUPPORTED_NETWORKS, SUPPORTED_ASSETS, SWAP_SUPPORTED_NETWORKS
 
@@ -19,7 +20,9 @@ def format_balance_message(balances: Dict[str, Dict[str, float]]) -> str:
     for address, balance_data in balances.items():
         message += f"*Адрес:* `{address}`\n"
         for asset, amount in balance_data.items():
-            if amount > 0:
+            if amount is None:
+                message += f" \\- {asset}: временно недоступен\n"
+            elif amount > 0:
                 message += f" \\- {asset}: {amount:.8f}\n"
         message += "\n"
     
@@ -32,8 +35,8 @@ def format_wallet_list(wallets: List) -> str:
     
     message = "📋 Ваши кошельки:\n\n"
     for wallet in wallets:
-        message += f"*{wallet\\.network}*\n"
-        message += f"`{wallet\\.address}`\n\n"
+        message += f"*{wallet.network}*\n"
+        message += f"`{wallet.address}`\n\n"
     
     return escape_markdown(message)
 
@@ -50,23 +53,68 @@ def format_staking_summary(stake_summary: Dict) -> str:
     
     return escape_markdown(message)
 
-def validate_address(address: str, network: str) -> bool:
-    """Validate cryptocurrency address format"""
-    patterns = {
-        'ETH': r'^0x[a-fA-F0-9]{40}$',
-        'TRX': r'^T[a-zA-Z0-9]{33}$',
-        'SOL': r'^[1-9A-HJ-NP-Za-km-z]{32,44}$',
-        'BNB': r'^0x[a-fA-F0-9]{40}$',
-        'DOGE': r'^D[a-zA-Z0-9]{33}$',
-        'AVAX': r'^0x[a-fA-F0-9]{40}$',
-        'POL': r'^0x[a-fA-F0-9]{40}$',
-        'XRP': r'^r[a-zA-Z0-9]{25,34}$',
-    }
-    
-    if network not in patterns:
+# Address shapes compiled once, ETH/BNB/AVAX/POL share the EVM shape
+EVM_ADDRESS_NETWORKS = ('ETH', 'BNB', 'AVAX', 'POL')
+EVM_ADDRESS_PATTERN = re.compile(r'0x[a-fA-F0-9]{40}')
+ADDRESS_PATTERNS = {
+    'TRX': re.compile(r'T[a-zA-Z0-9]{33}'),
+    'SOL': re.compile(r'[1-9A-HJ-NP-Za-km-z]{32,44}'),
+    'DOGE': re.compile(r'D[a-zA-Z0-9]{33}'),
+    'XRP': re.compile(r'r[a-zA-Z0-9]{25,34}'),
+    **{network: EVM_ADDRESS_PATTERN for network in EVM_ADDRESS_NETWORKS},
+}
+
+# Non-EVM networks by first character, anything else is tried as Solana
+ADDRESS_PREFIXES = {'T': 'TRX', 'D': 'DOGE', 'r': 'XRP'}
+
+# Base58Check version byte and alphabet
+BASE58CHECK_VERSIONS = {
+    'TRX': (0x41, base58.BITCOIN_ALPHABET),
+    'DOGE': (0x1e, base58.BITCOIN_ALPHABET),
+    'XRP': (0x00, base58.XRP_ALPHABET),
+}
+
+def verify_address_checksum(address: str, network: str) -> bool:
+    """Verify EIP-55 or Base58Check checksum of a well-formed address"""
+    if network in EVM_ADDRESS_NETWORKS:
+        digits = address[2:]
+        if digits.islower() or digits.isupper():
+            # Single-case addresses carry no EIP-55 checksum
+            return True
+        from eth_utils import to_checksum_address
+        return to_checksum_address(address) == address
+    
+    try:
+        if network == 'SOL':
+            return len(base58.b58decode(address)) == 32
+        version, alphabet = BASE58CHECK_VERSIONS[network]
+        payload = base58.b58decode_check(address, alphabet=alphabet)
+    except (ValueError, KeyError):
+        return False
+    return len(payload) == 21 and payload[0] == version
+
+def validate_address(address: str, network: str, checksum: bool = False) -> bool:
+    """Validate cryptocurrency address format, optionally its checksum"""
+    pattern = ADDRESS_PATTERNS.get(network)
+    if pattern is None or not isinstance(address, str) or pattern.fullmatch(address) is None:
         return False
     
-    return bool(re.match(patterns[network], address))
+    return not checksum or verify_address_checksum(address, network)
+
+def validate_addresses(addresses: List[str], network: str, checksum: bool = False) -> List[bool]:
+    """Validate many addresses for one network"""
+    pattern = ADDRESS_PATTERNS.get(network)
+    if pattern is None:
+        return [False] * len(addresses)
+    
+    fullmatch = pattern.fullmatch
+    results = [isinstance(address, str) and fullmatch(address) is not None for address in addresses]
+    if checksum:
+        results = [
+            valid and verify_address_checksum(address, network)
+            for address, valid in zip(addresses, results)
+        ]
+    return results
 
 def validate_amount(amount_str: str) -> Optional[float]:
     """Validate and convert amount string to float"""
@@ -78,22 +126,25 @@ def validate_amount(amount_str: str) -> Optional[float]:
     except ValueError:
         return None
 
-def get_network_from_address(address: str) -> Optional[str]:
-    """Determine network from address format"""
-    for network, pattern in {
-        'ETH': r'^0x[a-fA-F0-9]{40}$',
-        'TRX': r'^T[a-zA-Z0-9]{33}$',
-        'SOL': r'^[1-9A-HJ-NP-Za-km-z]{32,44}$',
-        'BNB': r'^0x[a-fA-F0-9]{40}$',
-        'DOGE': r'^D[a-zA-Z0-9]{33}$',
-        'AVAX': r'^0x[a-fA-F0-9]{40}$',
-        'POL': r'^0x[a-fA-F0-9]{40}$',
-        'XRP': r'^r[a-zA-Z0-9]{25,34}$',
-    }.items():
-        if re.match(pattern, address):
-            return network
+def get_network_from_address(address: str, checksum: bool = False) -> Optional[str]:
+    """Determine network from address format, EVM addresses are reported as ETH"""
+    if not isinstance(address, str):
+        return None
+    
+    if address.startswith('0x'):
+        return 'ETH' if validate_address(address, 'ETH', checksum) else None
+    
+    network = ADDRESS_PREFIXES.get(address[:1])
+    if network and validate_address(address, network, checksum):
+        return network
+    if validate_address(address, 'SOL', checksum):
+        return 'SOL'
     return None
 
+def classify_addresses(addresses: List[str], checksum: bool = False) -> List[Optional[str]]:
+    """Determine networks of many addresses"""
+    return [get_network_from_address(address, checksum) for address in addresses]
+
 def get_available_assets(network: str) -> List[str]:
     """Get available assets for network"""
     return SUPPORTED_ASSETS.get(network, [])
@@ -1,158 +1,129 @@
-import secrets
-import hashlib
 import base58
-from bip_utils import Bip39SeedGenerator, Bip44, Bip44Coins, Bip39MnemonicGenerator
-from web3 import Web3
-from tronpy import Tron
-from solana.keypair import Keypair
-import hdwallet
-from hdwallet import BIP44HDWallet
-from hdwallet.cryptocurrencies import TronMainnet
-from hdwallet.derivations import BIP44Derivation
-from typing import Tuple, Dict, Any
+from functools import lru_cache
+from typing import Tuple, Dict, Any, List, Optional
+from config import WALLET_CONTEXT_CACHE_SIZE
 
-def generate_ethereum_wallet() -> Tuple[str, str, str]:
-    """Generate Ethereum wallet (address, private_key, seed_phrase)"""
-    # Generate mnemonic
-    mnemonic = Bip39MnemonicGenerator().FromWordsNumber(12)
-    seed = Bip39SeedGenerator(mnemonic).Generate()
+# Bip44Coins member per network, Avalanche C-Chain and Polygon use Ethereum derivation.
+# bip_utils is imported on first derivation, not when the bot starts
+NETWORK_COINS = {
+    'ETH': 'ETHEREUM',
+    'TRX': 'TRON',
+    'SOL': 'SOLANA',
+    'BNB': 'BINANCE_SMART_CHAIN',
+    'DOGE': 'DOGECOIN',
+    'AVAX': 'ETHEREUM',
+    'POL': 'ETHEREUM',
+    'XRP': 'RIPPLE',
+}
+
+EVM_KEY_NETWORKS = ['ETH', 'BNB', 'AVAX', 'POL']
+
+def generate_seed_phrase() -> str:
+    """Generate a new 12-word mnemonic"""
+    from bip_utils import Bip39MnemonicGenerator
+    return Bip39MnemonicGenerator().FromWordsNumber(12).ToStr()
+
+def _build_account_context(seed_phrase: str, network: str):
+    """Build BIP44 external chain context m/44'/coin'/0'/0 (runs PBKDF2 once)"""
+    if network not in NETWORK_COINS:
+        raise ValueError(f"Unsupported network: {network}")
     
-    # Generate wallet
-    bip44_mst_ctx = Bip44.FromSeed(seed, Bip44Coins.ETHEREUM)
+    from bip_utils import Bip39SeedGenerator, Bip44, Bip44Changes, Bip44Coins
+    seed = Bip39SeedGenerator(seed_phrase).Generate()
+    bip44_mst_ctx = Bip44.FromSeed(seed, getattr(Bip44Coins, NETWORK_COINS[network]))
     bip44_acc_ctx = bip44_mst_ctx.Purpose().Coin().Account(0)
-    bip44_chg_ctx = bip44_acc_ctx.Change(False)
-    bip44_addr_ctx = bip44_chg_ctx.AddressIndex(0)
-    
+    return bip44_acc_ctx.Change(Bip44Changes.CHAIN_EXT)
+
+@lru_cache(maxsize=WALLET_CONTEXT_CACHE_SIZE)
+def get_account_context(seed_phrase: str, network: str):
+    """Get cached BIP44 external chain context for re-deriving keys"""
+    return _build_account_context(seed_phrase, network)
+
+def _derive_from_context(bip44_chg_ctx, network: str, index: int) -> Tuple[str, str]:
+    """Derive (address, private_key) at AddressIndex(index)"""
+    bip44_addr_ctx = bip44_chg_ctx.AddressIndex(index)
     address = bip44_addr_ctx.PublicKey().ToAddress()
-    private_key = bip44_addr_ctx.PrivateKey().Raw().ToHex()
-    seed_phrase = mnemonic.ToStr()
     
-    return address, private_key, seed_phrase
+    if network == 'SOL':
+        private_key = base58.b58encode(bip44_addr_ctx.PrivateKey().Raw().ToBytes()).decode()
+    elif network in EVM_KEY_NETWORKS:
+        private_key = '0x' + bip44_addr_ctx.PrivateKey().Raw().ToHex()
+    else:
+        private_key = bip44_addr_ctx.PrivateKey().Raw().ToHex()
+    
+    return address, private_key
+
+def normalize_private_key(network: str, private_key: str) -> str:
+    """Give stored EVM keys the 0x prefix, wallets created before derivation moved here lack it"""
+    if network in EVM_KEY_NETWORKS and not private_key.startswith('0x'):
+        return '0x' + private_key
+    return private_key
+
+def derive_wallet(seed_phrase: str, network: str, index: int = 0) -> Tuple[str, str]:
+    """Derive (address, private_key) of seed_phrase at index, reusing cached account contexts"""
+    return _derive_from_context(get_account_context(seed_phrase, network), network, index)
+
+def derive_wallets(
+    network: str, 
+    count: int, 
+    seed_phrase: Optional[str] = None, 
+    start_index: int = 0
+) -> List[Dict[str, Any]]:
+    """Derive count wallets from one mnemonic by address index"""
+    if seed_phrase is None:
+        seed_phrase = generate_seed_phrase()
+    
+    bip44_chg_ctx = _build_account_context(seed_phrase, network)
+    wallets = []
+    for index in range(start_index, start_index + count):
+        address, private_key = _derive_from_context(bip44_chg_ctx, network, index)
+        wallets.append({
+            'address': address,
+            'private_key': private_key,
+            'seed_phrase': seed_phrase,
+            'derivation_index': index
+        })
+    return wallets
+
+def generate_ethereum_wallet() -> Tuple[str, str, str]:
+    """Generate Ethereum wallet (address, private_key, seed_phrase)"""
+    wallet = derive_wallets('ETH', 1)[0]
+    return wallet['address'], wallet['private_key'], wallet['seed_phrase']
 
 def generate_tron_wallet() -> Tuple[str, str, str]:
     """Generate Tron wallet (address, private_key, seed_phrase)"""
-    # Generate mnemonic
-    mnemonic = Bip39MnemonicGenerator().FromWordsNumber(12)
-    seed = Bip39SeedGenerator(mnemonic).Generate()
-    
-    # Generate wallet
-    hdwallet: BIP44HDWallet = BIP44HDWallet(cryptocurrency=TronMainnet)
-    hdwallet.from_mnemonic(mnemonic.ToStr())
-    hdwallet.from_path("m/44'/195'/0'/0/0")
-    
-    address = hdwallet.address()
-    private_key = hdwallet.private_key()
-    seed_phrase = mnemonic.ToStr()
-    
-    return address, private_key, seed_phrase
+    wallet = derive_wallets('TRX', 1)[0]
+    return wallet['address'], wallet['private_key'], wallet['seed_phrase']
 
 def generate_solana_wallet() -> Tuple[str, str, str]:
     """Generate Solana wallet (address, private_key, seed_phrase)"""
-    # Generate mnemonic
-    mnemonic = Bip39MnemonicGenerator().FromWordsNumber(12)
-    seed = Bip39SeedGenerator(mnemonic).Generate()
-    
-    # Generate wallet
-    bip44_mst_ctx = Bip44.FromSeed(seed, Bip44Coins.SOLANA)
-    bip44_acc_ctx = bip44_mst_ctx.Purpose().Coin().Account(0)
-    bip44_chg_ctx = bip44_acc_ctx.Change(False)
-    bip44_addr_ctx = bip44_chg_ctx.AddressIndex(0)
-    
-    address = bip44_addr_ctx.PublicKey().ToAddress()
-    private_key = base58.b58encode(bip44_addr_ctx.PrivateKey().Raw().ToBytes()).decode()
-    seed_phrase = mnemonic.ToStr()
-    
-    return address, private_key, seed_phrase
+    wallet = derive_wallets('SOL', 1)[0]
+    return wallet['address'], wallet['private_key'], wallet['seed_phrase']
 
 def generate_bnb_wallet() -> Tuple[str, str, str]:
     """Generate BNB (BSC) wallet (address, private_key, seed_phrase)"""
-    # Generate mnemonic
-    mnemonic = Bip39MnemonicGenerator().FromWordsNumber(12)
-    seed = Bip39SeedGenerator(mnemonic).Generate()
-    
-    # Generate wallet
-    bip44_mst_ctx = Bip44.FromSeed(seed, Bip44Coins.BINANCE_SMART_CHAIN)
-    bip44_acc_ctx = bip44_mst_ctx.Purpose().Coin().Account(0)
-    bip44_chg_ctx = bip44_acc_ctx.Change(False)
-    bip44_addr_ctx = bip44_chg_ctx.AddressIndex(0)
-    
-    address = bip44_addr_ctx.PublicKey().ToAddress()
-    private_key = bip44_addr_ctx.PrivateKey().Raw().ToHex()
-    seed_phrase = mnemonic.ToStr()
-    
-    return address, private_key, seed_phrase
+    wallet = derive_wallets('BNB', 1)[0]
+    return wallet['address'], wallet['private_key'], wallet['seed_phrase']
 
 def generate_dogecoin_wallet() -> Tuple[str, str, str]:
     """Generate Dogecoin wallet (address, private_key, seed_phrase)"""
-    # Generate mnemonic
-    mnemonic = Bip39MnemonicGenerator().FromWordsNumber(12)
-    seed = Bip39SeedGenerator(mnemonic).Generate()
-    
-    # Generate wallet
-    bip44_mst_ctx = Bip44.FromSeed(seed, Bip44Coins.DOGECOIN)
-    bip44_acc_ctx = bip44_mst_ctx.Purpose().Coin().Account(0)
-    bip44_chg_ctx = bip44_acc_ctx.Change(False)
-    bip44_addr_ctx = bip44_chg_ctx.AddressIndex(0)
-    
-    address = bip44_addr_ctx.PublicKey().ToAddress()
-    private_key = bip44_addr_ctx.PrivateKey().Raw().ToHex()
-    seed_phrase = mnemonic.ToStr()
-    
-    return address, private_key, seed_phrase
+    wallet = derive_wallets('DOGE', 1)[0]
+    return wallet['address'], wallet['private_key'], wallet['seed_phrase']
 
 def generate_avalanche_wallet() -> Tuple[str, str, str]:
     """Generate Avalanche wallet (address, private_key, seed_phrase)"""
-    # Generate mnemonic
-    mnemonic = Bip39MnemonicGenerator().FromWordsNumber(12)
-    seed = Bip39SeedGenerator(mnemonic).Generate()
-    
-    # Generate wallet (using Ethereum derivation for C-Chain)
-    bip44_mst_ctx = Bip44.FromSeed(seed, Bip44Coins.ETHEREUM)
-    bip44_acc_ctx = bip44_mst_ctx.Purpose().Coin().Account(0)
-    bip44_chg_ctx = bip44_acc_ctx.Change(False)
-    bip44_addr_ctx = bip44_chg_ctx.AddressIndex(0)
-    
-    address = bip44_addr_ctx.PublicKey().ToAddress()
-    private_key = bip44_addr_ctx.PrivateKey().Raw().ToHex()
-    seed_phrase = mnemonic.ToStr()
-    
-    return address, private_key, seed_phrase
+    wallet = derive_wallets('AVAX', 1)[0]
+    return wallet['address'], wallet['private_key'], wallet['seed_phrase']
 
 def generate_polygon_wallet() -> Tuple[str, str, str]:
     """Generate Polygon wallet (address, private_key, seed_phrase)"""
-    # Generate mnemonic
-    mnemonic = Bip39MnemonicGenerator().FromWordsNumber(12)
-    seed = Bip39SeedGenerator(mnemonic).Generate()
-    
-    # Generate wallet (using Ethereum derivation for Polygon)
-    bip44_mst_ctx = Bip44.FromSeed(seed, Bip44Coins.ETHEREUM)
-    bip44_acc_ctx = bip44_mst_ctx.Purpose().Coin().Account(0)
-    bip44_chg_ctx = bip44_acc_ctx.Change(False)
-    bip44_addr_ctx = bip44_chg_ctx.AddressIndex(0)
-    
-    address = bip44_addr_ctx.PublicKey().ToAddress()
-    private_key = bip44_addr_ctx.PrivateKey().Raw().ToHex()
-    seed_phrase = mnemonic.ToStr()
-    
-    return address, private_key, seed_phrase
+    wallet = derive_wallets('POL', 1)[0]
+    return wallet['address'], wallet['private_key'], wallet['seed_phrase']
 
 def generate_xrp_wallet() -> Tuple[str, str, str]:
     """Generate XRP wallet (address, private_key, seed_phrase)"""
-    # Generate mnemonic
-    mnemonic = Bip39MnemonicGenerator().FromWordsNumber(12)
-    seed = Bip39SeedGenerator(mnemonic).Generate()
-    
-    # Generate wallet
-    bip44_mst_ctx = Bip44.FromSeed(seed, Bip44Coins.RIPPLE)
-    bip44_acc_ctx = bip44_mst_ctx.Purpose().Coin().Account(0)
-    bip44_chg_ctx = bip44_acc_ctx.Change(False)
-    bip44_addr_ctx = bip44_chg_ctx.AddressIndex(0)
-    
-    address = bip44_addr_ctx.PublicKey().ToAddress()
-    private_key = bip44_addr_ctx.PrivateKey().Raw().ToHex()
-    seed_phrase = mnemonic.ToStr()
-    
-    return address, private_key, seed_phrase
+    wallet = derive_wallets('XRP', 1)[0]
+    return wallet['address'], wallet['private_key'], wallet['seed_phrase']
 
 def generate_wallet(network: str) -> Tuple[str, str, str]:
     """Generate wallet for specified network"""
@@ -172,14 +143,22 @@ def generate_wallet(network: str) -> Tuple[str, str, str]:
     
     return generators[network]()
 
-def generate_multiple_wallets(network: str, count: int) -> list:
-    """Generate multiple wallets for specified network"""
+def generate_multiple_wallets(network: str, count: int, shared_seed: bool = True) -> list:
+    """Generate multiple wallets for specified network
+    
+    With shared_seed all wallets are derived from one mnemonic by address
+    index, otherwise every wallet gets its own mnemonic.
+    """
+    if shared_seed:
+        return derive_wallets(network, count)
+    
     wallets = []
     for _ in range(count):
         address, private_key, seed_phrase = generate_wallet(network)
         wallets.append({
             'address': address,
             'private_key': private_key,
-            'seed_phrase': seed_phrase
+            'seed_phrase': seed_phrase,
+            'derivation_index': 0
         })
     return wallets
\ No newline at end of file
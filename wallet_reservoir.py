@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List
+from database import SessionLocal, add_reservoir_wallets, claim_reservoir_wallets, get_reservoir_depths
+from wallet_service import wallet_generation_service
+from config import (
+    WALLET_RESERVOIR_NETWORKS,
+    WALLET_RESERVOIR_LOW_WATER,
+    WALLET_RESERVOIR_TARGET,
+    WALLET_RESERVOIR_LOT_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+class WalletReservoir:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        generation_service=wallet_generation_service,
+        networks: List[str] = WALLET_RESERVOIR_NETWORKS,
+        low_water: int = WALLET_RESERVOIR_LOW_WATER,
+        target: int = WALLET_RESERVOIR_TARGET,
+        lot_size: int = WALLET_RESERVOIR_LOT_SIZE
+    ):
+        self.session_factory = session_factory
+        self.generation_service = generation_service
+        self.networks = networks
+        self.low_water = low_water
+        self.target = target
+        self.lot_size = lot_size
+        self._lock = threading.Lock()
+        self._refilling = None
+        self.depths = {}
+        self.stats = {
+            'claims': 0,
+            'claimed': 0,
+            'short_claims': 0,
+            'refilled': 0,
+            'refill_seconds': 0.0,
+            'refill_rate': 0.0
+        }
+
+    def claim(self, db, user_id: int, network: str, count: int) -> List:
+        """Assign up to count reservoir wallets to user, returns (id, address, derivation_index) rows"""
+        claimed = claim_reservoir_wallets(db, user_id, network, count)
+        with self._lock:
+            self.stats['claims'] += 1
+            self.stats['claimed'] += len(claimed)
+            if len(claimed) < count:
+                self.stats['short_claims'] += 1
+            if network in self.depths:
+                self.depths[network] = max(self.depths[network] - len(claimed), 0)
+        return claimed
+
+    def get_depths(self) -> Dict[str, int]:
+        """Read unassigned wallet counts per network from the database"""
+        db = self.session_factory()
+        try:
+            depths = get_reservoir_depths(db)
+        finally:
+            db.close()
+        
+        depths = {network: depths.get(network, 0) for network in self.networks}
+        with self._lock:
+            self.depths = dict(depths)
+        return depths
+
+    def store(self, network: str, wallets: List[Dict]) -> None:
+        """Write one lot of generated wallets"""
+        db = self.session_factory()
+        try:
+            add_reservoir_wallets(db, network, wallets)
+        finally:
+            db.close()
+
+    async def refill(self) -> int:
+        """Top up networks below the low-water mark, returns wallets added"""
+        loop = asyncio.get_running_loop()
+        depths = await loop.run_in_executor(None, self.get_depths)
+        added = 0
+        
+        for network, depth in depths.items():
+            if depth >= self.low_water:
+                continue
+            
+            started = time.monotonic()
+            missing = self.target - depth
+            while missing > 0:
+                # Claims hand out single wallets, so no two reservoir wallets may share a mnemonic
+                wallets = await self.generation_service.generate_independent(network, min(self.lot_size, missing))
+                await loop.run_in_executor(None, self.store, network, wallets)
+                missing -= len(wallets)
+                added += len(wallets)
+            
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.depths[network] = self.target
+                self.stats['refilled'] += self.target - depth
+                self.stats['refill_seconds'] += elapsed
+                if self.stats['refill_seconds'] > 0:
+                    self.stats['refill_rate'] = self.stats['refilled'] / self.stats['refill_seconds']
+            logger.info(f"Refilled {network} wallet reservoir with {self.target - depth} wallets in {elapsed:.1f}s")
+        
+        return added
+
+    async def refill_job(self, context) -> None:
+        """Job queue callback, skips the run while a previous refill is still going"""
+        if self._refilling is not None and not self._refilling.done():
+            return
+        
+        self._refilling = asyncio.ensure_future(self.refill())
+        try:
+            await self._refilling
+        except Exception as e:
+            logger.error(f"Error refilling wallet reservoir: {e}")
+
+    def get_stats(self) -> Dict:
+        """Get reservoir depth per network and refill metrics"""
+        with self._lock:
+            return {**self.stats, 'depths': dict(self.depths)}
+
+# Global instance
+wallet_reservoir = WalletReservoir()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Wallet generation service: derives wallets in worker processes off the event loop
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from wallet_generator import derive_wallets, generate_multiple_wallets, generate_seed_phrase
+from config import SUPPORTED_NETWORKS, WALLET_GENERATION_WORKERS, WALLET_GENERATION_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+def _derive_addresses(network: str, seed_phrase: str, start_index: int, count: int) -> List[Tuple[int, str]]:
+    """Worker task for bulk mode, returns (derivation_index, address) only"""
+    wallets = derive_wallets(network, count, seed_phrase=seed_phrase, start_index=start_index)
+    return [(wallet['derivation_index'], wallet['address']) for wallet in wallets]
+
+class WalletGenerationService:
+    def __init__(self, max_workers: int = WALLET_GENERATION_WORKERS, chunk_size: int = WALLET_GENERATION_CHUNK_SIZE):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """Get process pool, started on first use"""
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the bot's threads, sockets or DB pool
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def split(self, count: int, start_index: int = 0) -> List[Tuple[int, int]]:
+        """Split count wallets into (start_index, count) tasks, one per worker at most"""
+        tasks = max(1, min(self.max_workers, count // max(self.chunk_size, 1)))
+        size, extra = divmod(count, tasks)
+        ranges = []
+        index = start_index
+        for task in range(tasks):
+            task_count = size + (1 if task < extra else 0)
+            if task_count:
+                ranges.append((index, task_count))
+                index += task_count
+        return ranges
+
+    async def generate(
+        self,
+        network: str,
+        count: int,
+        seed_phrase: Optional[str] = None,
+        start_index: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Generate count wallets from one seed in worker processes, starting at start_index"""
+        if network not in SUPPORTED_NETWORKS:
+            raise ValueError(f"Unsupported network: {network}")
+        
+        if seed_phrase is None:
+            seed_phrase = generate_seed_phrase()
+        
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        futures = [
+            loop.run_in_executor(executor, derive_wallets, network, task_count, seed_phrase, start_index)
+            for start_index, task_count in self.split(count, start_index)
+        ]
+        wallets = []
+        for chunk in await asyncio.gather(*futures):
+            wallets.extend(chunk)
+        return wallets
+
+    async def generate_independent(self, network: str, count: int) -> List[Dict[str, Any]]:
+        """Generate count wallets with a mnemonic of their own each, in worker processes"""
+        if network not in SUPPORTED_NETWORKS:
+            raise ValueError(f"Unsupported network: {network}")
+        
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        futures = [
+            loop.run_in_executor(executor, generate_multiple_wallets, network, task_count, False)
+            for _, task_count in self.split(count)
+        ]
+        wallets = []
+        for chunk in await asyncio.gather(*futures):
+            wallets.extend(chunk)
+        return wallets
+
+    def generate_addresses(
+        self,
+        network: str,
+        count: int,
+        seed_phrase: str,
+        start_index: int = 0,
+        task_size: int = 10000
+    ) -> Iterator[Tuple[int, str]]:
+        """Stream (derivation_index, address) for bulk provisioning, in index order"""
+        executor = self.get_executor()
+        starts = range(start_index, start_index + count, task_size)
+        counts = [min(task_size, start_index + count - start) for start in starts]
+        for chunk in executor.map(_derive_addresses, [network] * len(counts), [seed_phrase] * len(counts), starts, counts):
+            yield from chunk
+
+    def shutdown(self) -> None:
+        """Stop worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+# Global instance
+wallet_generation_service = WalletGenerationService()
+
+def main():
+    """Bulk CLI: pre-provision treasury addresses into a CSV file"""
+    parser = argparse.ArgumentParser(description='Bulk wallet address generation')
+    parser.add_argument('--network', required=True, choices=SUPPORTED_NETWORKS)
+    parser.add_argument('--count', type=int, required=True)
+    parser.add_argument('--output', required=True, help='CSV file for network,derivation_index,address')
+    parser.add_argument('--start-index', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=WALLET_GENERATION_WORKERS)
+    parser.add_argument('--seed-file', help='file with an existing mnemonic, a new one is written next to the output otherwise')
+    args = parser.parse_args()
+    
+    if args.seed_file:
+        with open(args.seed_file) as f:
+            seed_phrase = f.read().strip()
+    else:
+        seed_phrase = generate_seed_phrase()
+        seed_path = args.output + '.seed'
+        fd = os.open(seed_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(seed_phrase + '\n')
+        print(f"Mnemonic written to {seed_path}", file=sys.stderr)
+    
+    service = WalletGenerationService(max_workers=args.workers)
+    started = time.perf_counter()
+    try:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['network', 'derivation_index', 'address'])
+            for index, address in service.generate_addresses(args.network, args.count, seed_phrase, args.start_index):
+                writer.writerow([args.network, index, address])
+    finally:
+        service.shutdown()
+    
+    elapsed = time.perf_counter() - started
+    print(
+        f"{args.count} {args.network} addresses in {elapsed:.1f}s "
+        f"({args.count / elapsed:.0f}/s, {args.count / elapsed * 3600:,.0f}/h) with {service.max_workers} workers",
+        file=sys.stderr
+    )
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
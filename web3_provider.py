@@ -0,0 +1,17 @@
+import json
+from web3.providers import HTTPProvider
+from typing import Any, Dict
+
+class PooledHTTPProvider(HTTPProvider):
+    """Web3 HTTP provider that sends every request through the provider registry"""
+
+    def __init__(self, registry: 'ProviderRegistry', network: str):
+        super().__init__(registry.get_rpc_url(network))
+        # web3 caches its own session per thread, route through the registry instead
+        self.registry = registry
+        self.network = network
+
+    def make_request(self, method: str, params: Any) -> Dict:
+        """Send a JSON-RPC request over the pooled, hedged endpoints"""
+        request_data = self.encode_rpc_request(method, params)
+        return self.registry.post(self.network, json.loads(request_data))
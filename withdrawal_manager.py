@@ -1,20 +1,16 @@
-from web3 import Web3
-from tronpy import Tron
+from network_adapters import network_adapters
+from balance_cache import balance_cache
 from typing import Dict, Optional, Tuple
 from config import (
     NETWORK_RPC_URLS, 
     USDT_CONTRACTS, 
     INFURA_URL, 
-    TRONGRID_API_KEY,
     MIN_WITHDRAWAL,
     NETWORK_FEES
 )
 
 class WithdrawalManager:
     def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider(INFURA_URL))
-        self.tron = Tron()
-        
         # USDT ABI for ERC20
         self.usdt_abi = [
             {
@@ -29,6 +25,16 @@ class WithdrawalManager:
             }
         ]
 
+    @property
+    def w3(self):
+        """Ethereum Web3 client, built on first use"""
+        return network_adapters.get('ETH')
+
+    @property
+    def tron(self):
+        """Tron client, built on first use"""
+        return network_adapters.get('TRX')
+
     def validate_withdrawal(
         self, 
         address: str, 
@@ -46,6 +52,8 @@ class WithdrawalManager:
         
         # Check balance
         balance = self.get_balance(address, asset, network)
+        if balance is None:
+            return False, f"Не удалось проверить баланс {asset} в сети {network}"
         if balance < amount:
             return False, f"Недостаточно {asset}. Доступно: {balance}"
         
@@ -55,12 +63,23 @@ class WithdrawalManager:
         
         return True, "Valid"
 
-    def get_balance(self, address: str, asset: str, network: str) -> float:
-        """Get balance for specific asset"""
+    def get_balance(self, address: str, asset: str, network: str) -> Optional[float]:
+        """Get balance for specific asset, only fresh cache entries are trusted, None if unsupported"""
+        balance, fresh = balance_cache.get(network, address, asset)
+        if balance is not None and fresh:
+            return balance
+        
+        balance = self.fetch_balance(address, asset, network)
+        if balance is not None:
+            balance_cache.set(network, address, asset, balance)
+        return balance
+
+    def fetch_balance(self, address: str, asset: str, network: str) -> Optional[float]:
+        """Get balance for specific asset from the chain, None for unsupported networks and assets"""
         if network == 'ETH':
             if asset == 'ETH':
                 balance_wei = self.w3.eth.get_balance(address)
-                return self.w3.from_wei(balance_wei, 'ether')
+                return float(self.w3.from_wei(balance_wei, 'ether'))
             elif asset == 'USDT':
                 contract = self.w3.eth.contract(
                     address=USDT_CONTRACTS['ETH'], 
@@ -77,7 +96,7 @@ class WithdrawalManager:
                 balance_sun = contract.functions.balanceOf(address)
                 return balance_sun / 1_000_000
         
-        return 0.0
+        return None
 
     def validate_private_key(self, private_key: str, network: str) -> bool:
         """Validate private key format"""
@@ -229,16 +248,21 @@ class WithdrawalManager:
         
         # Perform withdrawal based on network
         if network == 'ETH':
-            return self.perform_ethereum_withdrawal(
+            result = self.perform_ethereum_withdrawal(
                 from_address, to_address, amount, asset, private_key
             )
         elif network == 'TRX':
-            return self.perform_tron_withdrawal(
+            result = self.perform_tron_withdrawal(
                 from_address, to_address, amount, asset, private_key
             )
         else:
             # For other networks, return pending status
             return True, "Запрос отправлен на ручную обработку", None
+        
+        if result[0]:
+            balance_cache.invalidate(network, from_address)
+            balance_cache.invalidate(network, to_address)
+        return result
 
     def get_network_fee(self, network: str) -> float:
         """Get network fee for withdrawal"""